@@ -0,0 +1,113 @@
+"""Compare dense, sparse and reduced landscape features for the SVM.
+
+Runs the rest vs beat SVM of subject 0508 on its H0 and H1 landscapes, using
+the bundled perseus output in 'data/postprocessed', once for each feature
+mode, and prints the size of the feature matrix, the time to build it, the
+time to cross-validate the SVM, and the mean accuracy.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_feature_modes.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from persim.landscapes import PersLandscapeApprox
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import target_labels  # noqa: E402
+from src.diagram_store import read_perseus_output  # noqa: E402
+from src.landscapes import LabelIndex, landscape_matrix  # noqa: E402
+from src.svm import landscape_svm  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+SUBJECT = "0508"
+HOMOLOGICAL_DEGREES = [0, 1]
+LABELS = ["rest", "beat"]
+FOLDS = 5
+
+MODES = {
+    "dense": {},
+    "sparse": {"sparse": True},
+    "depth 5": {"max_depth": 5},
+    "depth 5, sparse": {"max_depth": 5, "sparse": True},
+    "downsample 4": {"downsample": 4},
+    "depth 5, downsample 4, sparse": {
+        "max_depth": 5,
+        "downsample": 4,
+        "sparse": True,
+    },
+}
+
+
+def load_landscapes() -> list:
+    """Construct the landscapes of every time slice in every degree."""
+    landscapes = []
+    for hom_deg in HOMOLOGICAL_DEGREES:
+        for time_slice in range(len(target_labels)):
+            diagram = read_perseus_output(
+                os.path.join(
+                    DATA_DIR,
+                    "postprocessed",
+                    SUBJECT,
+                    f"patient_{SUBJECT}_time_{time_slice}_output_{hom_deg}.txt",
+                )
+            )
+            landscapes.append(
+                PersLandscapeApprox(
+                    dgms=[np.array([])] * hom_deg + [diagram],
+                    hom_deg=hom_deg,
+                    num_steps=1800,
+                )
+            )
+    return landscapes
+
+
+def feature_nbytes(features) -> int:
+    """Memory held by a dense or CSR feature matrix."""
+    if isinstance(features, np.ndarray):
+        return features.nbytes
+    return features.data.nbytes + features.indices.nbytes + features.indptr.nbytes
+
+
+def main() -> None:
+    landscapes = load_landscapes()
+    label_index = LabelIndex(target_labels * len(HOMOLOGICAL_DEGREES))
+    selected = [landscapes[idx] for idx in label_index.rows(LABELS)]
+
+    rows = []
+    for mode, options in MODES.items():
+        start = time.perf_counter()
+        features = landscape_matrix(selected, **options)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scores = landscape_svm(
+            landscapes=landscapes,
+            labels=LABELS,
+            target_labels=label_index,
+            folds=FOLDS,
+            **options,
+        )
+        svm_time = time.perf_counter() - start
+        rows.append(
+            {
+                "mode": mode,
+                "features": features.shape[1],
+                "MB": feature_nbytes(features) / 2**20,
+                "build (s)": build_time,
+                "svm (s)": svm_time,
+                "accuracy": scores.mean(),
+            }
+        )
+        print(rows[-1], flush=True)
+    print(pd.DataFrame(rows).set_index("mode").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Time every stage of the pipeline and measure its peak memory.
+
+Each benchmark runs on the bundled sample data of subject 0508, except
+`apply_mask`, which runs on a synthetic raw volume written by
+`write_synthetic_volume`. `construct_diagrams_gudhi` reads the bundled sparse
+perseus input files, as written by `apply_mask`. Every benchmark is timed `--repeat` times, and then
+run once more under tracemalloc to measure the peak memory allocated by
+Python and NumPy during the call. Memory allocated by compiled libraries
+outside of NumPy, such as the cubical complexes of gudhi, is not traced.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_stages.py
+    python benchmarks/bench_stages.py --only landscape_svm --repeat 5
+    python benchmarks/bench_stages.py --output new.json --compare old.json
+
+`--output` saves the results as JSON, and `--compare` prints the ratio of the
+timings and peak memory to those saved from an earlier run.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import h5py as h5
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import target_labels, total_time  # noqa: E402
+from src.landscapes import (  # noqa: E402
+    LabelIndex,
+    construct_landscapes,
+    pad_flatten_landscape_values,
+    perseus_to_sktda,
+)
+from src.make_dataset import apply_mask, construct_diagrams_gudhi  # noqa: E402
+from src.masks import Mask, load_mask  # noqa: E402
+from src.permutation_test import (  # noqa: E402
+    group_permutation_test,
+    permutation_test,
+    permutation_test_vectorized,
+)
+from src.sample_data import link_sample_data  # noqa: E402
+from src.svm import landscape_svm  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+SUBJECT = "0508"
+LABELS = ["rest", "beat"]
+NUM_PERMS = 200
+
+
+def write_synthetic_volume(
+    data_dir: str, subject: str, mask: Mask, seed: int = 0
+) -> str:
+    """
+    Write a random raw volume in the layout read by `apply_mask`.
+
+    The volume is indexed by (time, z, x, y), with integer amplitudes stored
+    as float32, and only extends as far as the bounding box of the mask, to
+    keep the file small.
+
+    Parameters
+    ----------
+    data_dir : str
+        The path to the data directory.
+    subject : str
+        The subject number of the volume.
+    mask : Mask
+        The mask which is applied to the volume.
+    seed : int, optional
+        Seed of the amplitudes.
+
+    Returns
+    -------
+    The path of the raw file.
+
+    """
+    shape = (total_time,) + mask.upper
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(data_dir, "raw", subject)
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(os.path.join(data_dir, "preprocessed", subject), exist_ok=True)
+    path = os.path.join(raw_dir, "rocd" + subject + ".mat")
+    with h5.File(path, "w") as raw_file:
+        dataset = raw_file.create_dataset(
+            "rocd" + subject, shape=shape, dtype=np.float32
+        )
+        for time_slice in range(total_time):
+            dataset[time_slice] = rng.integers(0, 2000, size=shape[1:])
+    return path
+
+
+def benchmarks(data_dir: str, synthetic: bool = True) -> dict:
+    """
+    Prepare the inputs of each benchmark and return the benchmarks by name.
+
+    Each benchmark is a function without arguments. The inputs which are not
+    part of the timed stage are computed here, once. Writing the synthetic
+    volume takes a while, so it is skipped if `synthetic` is False.
+    """
+    mask = load_mask(os.path.join(DATA_DIR, "raw", "rDACC.mat"))
+    if synthetic:
+        write_synthetic_volume(data_dir, "9999", mask)
+    link_sample_data(data_dir)
+    landscapes = {
+        hom_deg: construct_landscapes(SUBJECT, hom_deg, data_dir) for hom_deg in [0, 1]
+    }
+    rows = LabelIndex(target_labels).rows(LABELS)
+    selected = [landscapes[1][idx] for idx in rows]
+
+    return {
+        "apply_mask": lambda: apply_mask("9999", mask, data_dir, supra=True),
+        "construct_diagrams_gudhi": lambda: construct_diagrams_gudhi(
+            SUBJECT, 1, 0, DATA_DIR
+        ),
+        "perseus_to_sktda": lambda: [
+            perseus_to_sktda(SUBJECT, 1, time_slice, data_dir)
+            for time_slice in range(total_time)
+        ],
+        "construct_landscapes": lambda: construct_landscapes(SUBJECT, 1, data_dir),
+        "pad_flatten_landscape_values": lambda: pad_flatten_landscape_values(selected),
+        "permutation_test": lambda: permutation_test(
+            landscapes[1], LABELS, num_perms=NUM_PERMS
+        ),
+        "permutation_test_vectorized": lambda: permutation_test_vectorized(
+            landscapes[1], LABELS, num_perms=NUM_PERMS
+        ),
+        "group_permutation_test": lambda: group_permutation_test(
+            {SUBJECT: landscapes}, LABELS, num_perms=NUM_PERMS
+        ),
+        "landscape_svm": lambda: landscape_svm(
+            landscapes=landscapes[0] + landscapes[1],
+            labels=LABELS,
+            target_labels=target_labels * 2,
+        ),
+    }
+
+
+def measure(benchmark, repeat: int) -> dict:
+    """Time a benchmark `repeat` times and measure its peak memory once."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    benchmark()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "min (s)": min(timings),
+        "median (s)": statistics.median(timings),
+        "peak (MB)": peak / 2**20,
+    }
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="Names of the benchmarks to run.")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON file of an earlier run.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        synthetic = not args.only or "apply_mask" in args.only
+        for name, benchmark in benchmarks(data_dir, synthetic).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(benchmark, args.repeat)
+            print(name, results[name], flush=True)
+
+    table = pd.DataFrame(results).T
+    if args.compare:
+        with open(args.compare, "r") as compare_file:
+            baseline = pd.DataFrame(json.load(compare_file)).T
+        table["time ratio"] = table["min (s)"] / baseline["min (s)"]
+        table["memory ratio"] = table["peak (MB)"] / baseline["peak (MB)"]
+    print(table.round(3).to_string())
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,12 +21,14 @@ the workflow begins with reading from perseus input files which have been provid
 in 'data/postprocessed'.
 """
 
-import pandas as pd
+import os
+
 import seaborn as sns
 
+from src import label_pairings as LABEL_PAIRINGS
 from src import target_labels as TARGET_LABELS
-from src.landscapes import construct_landscapes
-from src.svm import landscape_svm
+from src.landscapes import LandscapeCache
+from src.svm import evaluate_pairings
 
 SUPRA_LEVEL = True  # Compute the supralevel persistent homology as opposed to sub-level
 DATA_DIR = "/run/user/1000/gvfs/smb-share:server=192.168.68.110,share=home/Sam_Vaibhav_project_files/"  # edit this to point to the path of the data directory
@@ -50,45 +52,24 @@ SVM_TEST_LABELS = ["rest", "beat"]
 # p_val1 = permutation_test(pl_list[1], PERM_TEST_LABELS)
 
 
-avg_accur = pd.DataFrame(
-    columns = ["Rest vs Beat", "Random vs Beat", "Rest vs Random", "All Three"]
-)
+# Landscapes and feature matrices are cached on disk between runs.
+landscape_cache = LandscapeCache(cache_dir=os.path.join(DATA_DIR, "landscape_cache"))
 
-for subject in SUBJECT_LIST:
-    pl_list = []
-    for hom_deg in HOMOLOGICAL_DEGREES:
-        pl = construct_landscapes(subject=subject, hom_deg=hom_deg, data_dir=DATA_DIR)
-        pl_list.append(pl)
-    svm_vals = []
-    svm_vals.append(
-        landscape_svm(
-            landscapes = pl_list[0] + pl_list[1],
-            labels = ["rest", "beat"],
-            target_labels = TARGET_LABELS * 2,
-        ).mean()
-    )
-    svm_vals.append(
-        landscape_svm(
-            landscapes = pl_list[0] + pl_list[1],
-            labels = ["random", "beat"],
-            target_labels = TARGET_LABELS * 2,
-        ).mean()
-    )
-    svm_vals.append(
-        landscape_svm(
-            landscapes = pl_list[0] + pl_list[1],
-            labels = ["rest", "random"],
-            target_labels = TARGET_LABELS * 2,
-        ).mean()
+features = {
+    subject: landscape_cache.feature_matrix(
+        subject=subject, hom_degs=HOMOLOGICAL_DEGREES, data_dir=DATA_DIR
     )
-    svm_vals.append(
-        landscape_svm(
-            landscapes = pl_list[0] + pl_list[1],
-            labels = ["rest", "beat", "random"],
-            target_labels = TARGET_LABELS * 2,
-        ).mean()
-    )
-    avg_accur.loc[subject] = svm_vals
+    for subject in SUBJECT_LIST
+}
+scores = evaluate_pairings(
+    features=features,
+    pairings=LABEL_PAIRINGS,
+    target_labels=TARGET_LABELS * len(HOMOLOGICAL_DEGREES),
+    n_jobs=-1,
+)
+avg_accur = scores.pivot_table(
+    index="subject", columns="pairing", values="score", sort=False
+)
 ax = sns.heatmap(avg_accur, annot=True, linewidths=0.5, cmap="YlOrRd_r")
 ax.set_title("TDA-based SVM classification accuracies as a function of pairing")
 ax.set_xticklabels(avg_accur.columns)
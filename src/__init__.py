@@ -1 +1 @@
-from src.config import target_labels, total_time
+from src.config import label_pairings, target_labels, total_time
@@ -3,6 +3,8 @@
 target_labels: The true labelling of time slices, used for classification.
 
 total_time: Number of time slices in the acquisition.
+
+label_pairings: The label comparisons reported for each subject, by name.
 """
 
 
@@ -27,3 +29,10 @@ target_labels = (
 )
 
 total_time = len(target_labels)
+
+label_pairings = {
+    "Rest vs Beat": ["rest", "beat"],
+    "Random vs Beat": ["random", "beat"],
+    "Rest vs Random": ["rest", "random"],
+    "All Three": ["rest", "beat", "random"],
+}
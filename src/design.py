@@ -0,0 +1,293 @@
+"""The block design of an acquisition: the label of every time slice.
+
+An `ExperimentDesign` holds the labels of the time slices of an acquisition,
+encoded once as integer codes with the row indices of every label and the
+start and stop of every block, together with the label pairings reported for
+it. It is passed to the functions of the pipeline, so acquisitions of
+different lengths or designs can be processed in the same process. Designs
+are read from small JSON or TOML files such as::
+
+    name = "ocd"
+    blocks = [["rest", 3], ["beat", 13], ["rest", 8]]
+
+    [pairings]
+    "Rest vs Beat" = ["rest", "beat"]
+
+`DEFAULT_DESIGN` is the design of `src.config`, which every function uses
+when it is not given a design.
+
+"""
+
+import json
+import os
+
+import numpy as np
+
+from src.config import label_pairings, target_labels
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    tomllib = None
+
+
+class LabelIndex:
+    """
+    Integer encoding of a labelling with precomputed row indices per label.
+
+    The labelling is encoded once, so selecting the rows of any subset of
+    labels from a feature matrix is a single fancy index rather than a new
+    list per label.
+
+    Parameters
+    ----------
+    list_of_labels : list
+        A complete labelling, e.g. `target_labels`.
+
+    Examples
+    --------
+    Select the rest and beat time slices of a feature matrix::
+
+        >>> label_index = LabelIndex(target_labels)
+        >>> X, y = label_index.select(features, ["rest", "beat"])
+
+    """
+
+    def __init__(self, list_of_labels: list) -> None:
+        self.classes, self.codes = np.unique(
+            np.asarray(list_of_labels), return_inverse=True
+        )
+        self.indices = {
+            label: np.flatnonzero(self.codes == code)
+            for code, label in enumerate(self.classes)
+        }
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def tile(self, reps: int) -> "LabelIndex":
+        """
+        Return the index of the labelling repeated `reps` times.
+
+        This labels a feature matrix stacking the landscapes of `reps`
+        homological degrees, as `LandscapeCache.feature_matrix`, without
+        encoding the repeated labelling again.
+        """
+        tiled = LabelIndex.__new__(LabelIndex)
+        tiled.classes = self.classes
+        tiled.codes = np.tile(self.codes, reps)
+        offsets = len(self) * np.arange(reps)
+        tiled.indices = {
+            label: (offsets[:, np.newaxis] + rows).ravel()
+            for label, rows in self.indices.items()
+        }
+        return tiled
+
+    def rows(self, labels: list) -> np.ndarray:
+        """Return the indices of the entries labelled `labels[0]`, `labels[1]`, ..."""
+        return np.concatenate(
+            [self.indices.get(label, np.empty(0, dtype=np.intp)) for label in labels]
+        )
+
+    def select(self, features: np.ndarray, labels: list) -> tuple:
+        """
+        Select the rows of `features` with the given labels, grouped by label.
+
+        Parameters
+        ----------
+        features : np.ndarray
+            An array whose rows are labelled by this index.
+        labels : list
+            The labels to be selected.
+
+        Returns
+        -------
+        A tuple (X, y) of the selected rows and their labels.
+
+        """
+        if features.shape[0] != len(self):
+            raise ValueError("features and the labelling must be the same length")
+        rows = self.rows(labels)
+        return features[rows], self.classes[self.codes[rows]]
+
+
+class ExperimentDesign(LabelIndex):
+    """
+    The labels of the time slices of an acquisition.
+
+    As a `LabelIndex`, the design encodes its labels once and selects the
+    rows of any labels from a feature matrix. It also records the blocks of
+    consecutive time slices with the same label.
+
+    Parameters
+    ----------
+    labels : list
+        The label of every time slice, e.g. `target_labels`.
+    pairings : dict, optional
+        Lists of labels to be compared, keyed by the name of the comparison,
+        e.g. `label_pairings`. The default is no pairings.
+    name : str, optional
+        The name of the design.
+
+    Attributes
+    ----------
+    total_time : int
+        The number of time slices.
+    block_starts, block_stops : np.ndarray
+        The first and one past the last time slice of every block.
+    block_codes : np.ndarray
+        The code of the label of every block, indexing `classes`.
+
+    """
+
+    def __init__(
+        self, labels: list, pairings: dict = None, name: str = "default"
+    ) -> None:
+        if len(labels) == 0:
+            raise ValueError("an experiment design needs at least one time slice")
+        super().__init__(labels)
+        self.labels = list(labels)
+        self.pairings = {key: list(value) for key, value in (pairings or {}).items()}
+        self.name = name
+        self.total_time = len(self.labels)
+        boundaries = np.flatnonzero(np.diff(self.codes)) + 1
+        self.block_starts = np.concatenate(([0], boundaries))
+        self.block_stops = np.concatenate((boundaries, [self.total_time]))
+        self.block_codes = self.codes[self.block_starts]
+
+    def __repr__(self) -> str:
+        return (
+            f"ExperimentDesign(name={self.name!r}, total_time={self.total_time},"
+            f" blocks={len(self.block_starts)})"
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ExperimentDesign):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def blocks(self, label: str = None) -> list:
+        """Return the (start, stop) of every block, or of the blocks of `label`."""
+        return [
+            (int(start), int(stop))
+            for start, stop, code in zip(
+                self.block_starts, self.block_stops, self.block_codes
+            )
+            if label is None or self.classes[code] == label
+        ]
+
+    @classmethod
+    def from_blocks(
+        cls, blocks: list, pairings: dict = None, name: str = "default"
+    ) -> "ExperimentDesign":
+        """Construct a design from a list of (label, number of time slices)."""
+        labels = []
+        for label, length in blocks:
+            labels += [label] * int(length)
+        return cls(labels, pairings, name)
+
+    @classmethod
+    def from_dict(cls, design: dict) -> "ExperimentDesign":
+        """
+        Construct a design from a dict, as read from a design file.
+
+        The dict holds either "blocks", a list of [label, number of time
+        slices], or "labels", the label of every time slice, and optionally
+        "pairings" and "name".
+        """
+        pairings = design.get("pairings")
+        name = design.get("name", "default")
+        if "blocks" in design:
+            return cls.from_blocks(design["blocks"], pairings, name)
+        if "labels" in design:
+            return cls(design["labels"], pairings, name)
+        raise ValueError("an experiment design needs 'blocks' or 'labels'")
+
+    def to_dict(self) -> dict:
+        """Return the design as a dict of its blocks, as read by `from_dict`."""
+        return {
+            "name": self.name,
+            "blocks": [
+                [str(self.classes[code]), int(stop - start)]
+                for start, stop, code in zip(
+                    self.block_starts, self.block_stops, self.block_codes
+                )
+            ],
+            "pairings": self.pairings,
+        }
+
+    @classmethod
+    def load(cls, path: str) -> "ExperimentDesign":
+        """
+        Read a design from a JSON file, or from a TOML file ending in '.toml'.
+
+        Reading TOML requires Python 3.11 or later.
+        """
+        if os.path.splitext(path)[1] == ".toml":
+            if tomllib is None:
+                raise ImportError("reading TOML designs requires Python 3.11+")
+            with open(path, "rb") as design_file:
+                return cls.from_dict(tomllib.load(design_file))
+        with open(path, "r") as design_file:
+            return cls.from_dict(json.load(design_file))
+
+    def save(self, path: str) -> None:
+        """Write the design to a JSON file."""
+        with open(path, "w") as design_file:
+            json.dump(self.to_dict(), design_file, indent=2)
+
+
+DEFAULT_DESIGN = ExperimentDesign(target_labels, label_pairings, name="default")
+
+
+def get_design(design=None, subject: str = None) -> ExperimentDesign:
+    """
+    Resolve the design argument of a pipeline function.
+
+    Parameters
+    ----------
+    design : ExperimentDesign | str | dict, optional
+        A design, the path of a design file, or a dict of designs or paths
+        keyed by subject number. The default is `DEFAULT_DESIGN`.
+    subject : str, optional
+        The subject whose design is looked up if `design` is a dict. A
+        KeyError is raised if the dict has no design for it.
+
+    Returns
+    -------
+    The ExperimentDesign.
+
+    """
+    if isinstance(design, dict):
+        if subject not in design:
+            raise KeyError(f"No experiment design for subject {subject!r}")
+        design = design[subject]
+    if design is None:
+        return DEFAULT_DESIGN
+    if isinstance(design, str):
+        return ExperimentDesign.load(design)
+    return design
+
+
+def resolve_design(design=None):
+    """
+    Read the design files of a design argument once.
+
+    Entry points which hand a design to many functions resolve it first, so
+    that a design file is not parsed again by every call of `get_design`.
+
+    Parameters
+    ----------
+    design : ExperimentDesign | str | dict, optional
+        A design, the path of a design file, or a dict of designs or paths
+        keyed by subject number. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    The ExperimentDesign, or a dict of ExperimentDesigns keyed by subject
+    number if `design` is a dict.
+
+    """
+    if isinstance(design, dict):
+        return {subject: get_design(value) for subject, value in design.items()}
+    return get_design(design)
@@ -0,0 +1,194 @@
+"""Store all persistence diagrams of a subject in a single binary file.
+
+The perseus output layout holds one small text file per subject, time slice
+and homological degree. The diagram store replaces these with one HDF5 file
+per subject, holding every birth-death pair in a single contiguous array
+together with an index of where each diagram starts and ends. The pairs are
+memory-mapped on loading, so individual diagrams are views into the file.
+
+"""
+
+import os
+
+import h5py as h5
+import numpy as np
+
+from src.design import get_design
+from src.profiling import timed
+
+
+def diagram_store_path(subject: str, data_dir: str) -> str:
+    """Return the default location of the diagram store of `subject`."""
+    return os.path.join(
+        data_dir, "postprocessed", subject, "patient_" + subject + "_diagrams.h5"
+    )
+
+
+def read_perseus_output(path: str) -> np.ndarray:
+    """
+    Read a perseus output file into an array of birth-death pairs.
+
+    Deaths of -1, which perseus uses for classes that never die, are replaced
+    by np.inf.
+
+    Parameters
+    ----------
+    path : str
+        The path to the perseus output file.
+
+    Returns
+    -------
+    A numpy.ndarray of shape (number of pairs, 2).
+
+    """
+    with open(path, "r") as pd_file:
+        pairs = np.array(pd_file.read().split(), dtype=np.float64).reshape(-1, 2)
+    pairs[pairs[:, 1] == -1, 1] = np.inf
+    return pairs
+
+
+@timed
+def convert_perseus_outputs(
+    subject: str, hom_degs: list, data_dir: str, store_path: str = None, design=None
+) -> str:
+    """
+    Convert the perseus output files of a subject into a diagram store.
+
+    This method reads from the 'postprocessed' subdirectory of `data_dir`.
+
+    Parameters
+    ----------
+    subject : str
+        The subject number to be converted.
+
+    hom_degs : list
+        The homological degrees to be converted.
+
+    data_dir : str
+        The path to the data directory.
+
+    store_path : str, optional
+        Where to write the store. The default is given by `diagram_store_path`.
+
+    design : ExperimentDesign | str, optional
+        The design of the acquisition. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    The path of the diagram store.
+
+    """
+    total_time = get_design(design).total_time
+
+    if store_path is None:
+        store_path = diagram_store_path(subject, data_dir)
+    post_processing_dir = os.path.join(data_dir, "postprocessed", subject)
+
+    pairs = []
+    offsets = np.zeros((len(hom_degs), total_time + 1), dtype=np.int64)
+    count = 0
+    for deg_idx, hom_deg in enumerate(hom_degs):
+        offsets[deg_idx, 0] = count
+        for time in range(total_time):
+            pd_filename = (
+                "patient_"
+                + subject
+                + "_time_"
+                + str(time)
+                + "_output_"
+                + str(hom_deg)
+                + ".txt"
+            )
+            diagram = read_perseus_output(
+                os.path.join(post_processing_dir, pd_filename)
+            )
+            pairs.append(diagram)
+            count += len(diagram)
+            offsets[deg_idx, time + 1] = count
+    write_diagram_store(store_path, np.concatenate(pairs), offsets, hom_degs)
+    return store_path
+
+
+def write_diagram_store(
+    store_path: str, pairs: np.ndarray, offsets: np.ndarray, hom_degs: list
+) -> None:
+    """
+    Write concatenated birth-death pairs and their index to a diagram store.
+
+    The diagram of degree `hom_degs[i]` at time `t` is
+    `pairs[offsets[i, t]:offsets[i, t + 1]]`.
+
+    Parameters
+    ----------
+    store_path : str
+        The path of the store to write.
+
+    pairs : np.ndarray
+        All birth-death pairs, of shape (number of pairs, 2).
+
+    offsets : np.ndarray
+        Integer array of shape (len(hom_degs), number of time slices + 1).
+
+    hom_degs : list
+        The homological degrees in the store.
+
+    Returns
+    -------
+    None.
+
+    """
+    with h5.File(store_path, "w") as store:
+        # Contiguous and uncompressed, so the pairs can be memory-mapped.
+        store.create_dataset("pairs", data=np.asarray(pairs, dtype=np.float64))
+        store.create_dataset("offsets", data=offsets)
+        store.attrs["hom_degs"] = np.asarray(hom_degs, dtype=np.int64)
+
+
+class DiagramStore:
+    """
+    Read-only access to a diagram store.
+
+    The birth-death pairs are memory-mapped, and `diagram` returns views of
+    them, so loading a subject opens one file and copies nothing.
+
+    Parameters
+    ----------
+    store_path : str
+        The path of the diagram store.
+
+    """
+
+    def __init__(self, store_path: str) -> None:
+        with h5.File(store_path, "r") as store:
+            self.hom_degs = [int(hom_deg) for hom_deg in store.attrs["hom_degs"]]
+            self.offsets = store["offsets"][()]
+            dataset = store["pairs"]
+            offset = dataset.id.get_offset()
+            if offset is None:  # Nothing was allocated for an empty store.
+                self.pairs = np.empty((0, 2))
+            else:
+                self.pairs = np.memmap(
+                    store_path,
+                    dtype=dataset.dtype,
+                    mode="r",
+                    offset=offset,
+                    shape=dataset.shape,
+                )
+        self.total_time = self.offsets.shape[1] - 1
+
+    def diagram(self, hom_deg: int, time: int) -> np.ndarray:
+        """Return the birth-death pairs of degree `hom_deg` at `time`."""
+        deg_idx = self.hom_degs.index(hom_deg)
+        return self.pairs[self.offsets[deg_idx, time] : self.offsets[deg_idx, time + 1]]
+
+    def diagrams(self, hom_deg: int) -> list:
+        """Return the diagrams of degree `hom_deg` for every time slice."""
+        return [self.diagram(hom_deg, time) for time in range(self.total_time)]
+
+    def sktda(self, hom_deg: int, time: int) -> list:
+        """Return a diagram in the format produced by `perseus_to_sktda`."""
+        return (
+            [np.array([])] * hom_deg
+            + [np.asarray(self.diagram(hom_deg, time))]
+            + [np.array([])] * (3 - hom_deg)
+        )
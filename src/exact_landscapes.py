@@ -0,0 +1,358 @@
+"""Exact persistence landscapes, stored as the breakpoints of each layer.
+
+Every layer of a persistence landscape is piecewise linear, so it is
+determined by the points where its slope changes. An `ExactLandscape` keeps
+only these breakpoints, concatenated over the layers into two flat arrays,
+instead of sampling every layer at a fixed number of grid points. Sums,
+differences, averages and sup norms are computed from the breakpoints and are
+exact; sampling on a grid is done on demand, e.g. for the SVM.
+
+"""
+
+import numpy as np
+import scipy.sparse
+
+# Upper bound on the number of tent values evaluated at once in `from_diagram`.
+_CHUNK_SIZE = 2**22
+
+
+def _simplify(x: np.ndarray, y: np.ndarray) -> tuple:
+    """
+    Drop the zero runs at either end and the interior points where the slope
+    does not change, keeping one zero at each end of the support.
+    """
+    nonzero = np.flatnonzero(y)
+    if len(nonzero) == 0:
+        return x[:0], y[:0]
+    x = x[max(nonzero[0] - 1, 0) : nonzero[-1] + 2]
+    y = y[max(nonzero[0] - 1, 0) : nonzero[-1] + 2]
+    dx, dy = np.diff(x), np.diff(y)
+    bends = dy[:-1] * dx[1:] != dy[1:] * dx[:-1]
+    keep = np.concatenate(([True], bends, [True]))
+    return x[keep], y[keep]
+
+
+def _evaluate(grid: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Evaluate a layer, which vanishes outside its breakpoints, on a grid."""
+    if len(x) == 0:
+        return np.zeros(len(grid))
+    return np.interp(grid, x, y, left=0, right=0)
+
+
+class ExactLandscape:
+    """
+    A persistence landscape given by the breakpoints of its layers.
+
+    Layer `k` is the piecewise linear function through the points
+    `(breakpoints[i], values[i])` for `offsets[k] <= i < offsets[k + 1]`, and
+    vanishes outside of them.
+
+    Parameters
+    ----------
+    breakpoints : np.ndarray
+        The x coordinates of the breakpoints of all layers, each layer sorted.
+    values : np.ndarray
+        The values of the landscape at the breakpoints.
+    offsets : np.ndarray
+        Integer array of length depth + 1 delimiting the layers.
+    hom_deg : int, optional
+        The homological degree of the landscape.
+
+    """
+
+    def __init__(
+        self,
+        breakpoints: np.ndarray,
+        values: np.ndarray,
+        offsets: np.ndarray,
+        hom_deg: int = 0,
+    ) -> None:
+        self.breakpoints = np.asarray(breakpoints, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.hom_deg = hom_deg
+
+    @classmethod
+    def from_layers(cls, layers: list, hom_deg: int = 0) -> "ExactLandscape":
+        """Assemble a landscape from a list of (x, y) arrays, one per layer."""
+        layers = [_simplify(x, y) for x, y in layers]
+        layers = [(x, y) for x, y in layers if len(x)]
+        offsets = np.cumsum([0] + [len(x) for x, _ in layers])
+        if not layers:
+            return cls(np.zeros(0), np.zeros(0), offsets, hom_deg)
+        return cls(
+            np.concatenate([x for x, _ in layers]),
+            np.concatenate([y for _, y in layers]),
+            offsets,
+            hom_deg,
+        )
+
+    @classmethod
+    def from_diagram(cls, diagram: np.ndarray, hom_deg: int = 0) -> "ExactLandscape":
+        """
+        Construct the exact landscape of a persistence diagram.
+
+        The landscape is the pointwise sorted stack of the tents
+        max(0, min(t - b, d - t)) of the birth-death pairs. Its breakpoints
+        lie among the births, the deaths and the points (b_i + d_j) / 2 where
+        a rising and a falling tent edge cross, so evaluating and sorting the
+        tents at these candidates determines every layer exactly. Pairs with
+        infinite death are ignored.
+
+        The tents are evaluated in chunks of candidates, at most `_CHUNK_SIZE`
+        values at a time, and only the nonzero layers of each sorted chunk are
+        kept, so the memory beyond the candidates is that of one chunk and of
+        the layers of the landscape.
+
+        Parameters
+        ----------
+        diagram : np.ndarray
+            Birth-death pairs of shape (number of pairs, 2).
+        hom_deg : int, optional
+            The homological degree of the diagram.
+
+        Returns
+        -------
+        The ExactLandscape of the diagram.
+
+        """
+        pairs = np.asarray(diagram, dtype=np.float64).reshape(-1, 2)
+        pairs = pairs[np.all(np.isfinite(pairs), axis=1) & (pairs[:, 1] > pairs[:, 0])]
+        births, deaths = pairs[:, 0], pairs[:, 1]
+        # Crossings of the rising edge of i and the falling edge of j, kept
+        # where both tents are positive.
+        crossings = (births[:, np.newaxis] + deaths[np.newaxis, :]) / 2
+        inside = (
+            (crossings > births[:, np.newaxis])
+            & (crossings < deaths[:, np.newaxis])
+            & (crossings > births[np.newaxis, :])
+            & (crossings < deaths[np.newaxis, :])
+        )
+        x = np.unique(np.concatenate((births, deaths, crossings[inside])))
+
+        if len(x) == 0:
+            return cls.from_layers([], hom_deg)
+        step = max(1, _CHUNK_SIZE // len(pairs))
+        # The nonzero layers found so far, grown as deeper chunks turn up, so
+        # only one chunk of sorted tents is held on top of the layers.
+        layers = np.zeros((0, len(x)))
+        for start in range(0, len(x), step):
+            grid = x[start : start + step]
+            tents = np.maximum(
+                np.minimum(grid - births[:, np.newaxis], deaths[:, np.newaxis] - grid),
+                0,
+            )
+            # Sort each column in decreasing order.
+            tents = -np.sort(-tents, axis=0)
+            depth = np.max(np.count_nonzero(tents, axis=0))
+            if depth > len(layers):
+                layers = np.vstack((layers, np.zeros((depth - len(layers), len(x)))))
+            layers[:depth, start : start + len(grid)] = tents[:depth]
+            del tents
+        return cls.from_layers([(x, y) for y in layers], hom_deg)
+
+    @property
+    def depth(self) -> int:
+        """The number of layers."""
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        """The memory held by the breakpoints, values and offsets."""
+        return self.breakpoints.nbytes + self.values.nbytes + self.offsets.nbytes
+
+    def layer(self, k: int) -> tuple:
+        """Return the breakpoints and values of layer `k`."""
+        if k >= self.depth:
+            return np.zeros(0), np.zeros(0)
+        start, stop = self.offsets[k], self.offsets[k + 1]
+        return self.breakpoints[start:stop], self.values[start:stop]
+
+    def sample(self, grid: np.ndarray) -> np.ndarray:
+        """
+        Evaluate every layer on a grid.
+
+        Returns
+        -------
+        A numpy.ndarray of shape (depth, len(grid)).
+
+        """
+        return np.array(
+            [_evaluate(grid, *self.layer(k)) for k in range(self.depth)]
+        ).reshape(self.depth, len(grid))
+
+    def sup_norm(self) -> float:
+        """The supremum of the absolute value, attained at a breakpoint."""
+        return float(np.max(np.abs(self.values), initial=0))
+
+    def __add__(self, other: "ExactLandscape") -> "ExactLandscape":
+        return linear_combination([self, other], [1, 1])
+
+    def __sub__(self, other: "ExactLandscape") -> "ExactLandscape":
+        return linear_combination([self, other], [1, -1])
+
+    def __neg__(self) -> "ExactLandscape":
+        return ExactLandscape(
+            self.breakpoints, -self.values, self.offsets, self.hom_deg
+        )
+
+    def __mul__(self, scalar: float) -> "ExactLandscape":
+        return ExactLandscape(
+            self.breakpoints, scalar * self.values, self.offsets, self.hom_deg
+        )
+
+    __rmul__ = __mul__
+
+
+def linear_combination(landscapes: list, weights: list) -> ExactLandscape:
+    """
+    Compute a weighted sum of exact landscapes, layer by layer.
+
+    Each layer of the sum is evaluated at the union of the breakpoints of that
+    layer in all of the landscapes, between which every summand is linear.
+
+    Parameters
+    ----------
+    landscapes : list
+        A list of ExactLandscapes.
+    weights : list
+        One weight per landscape.
+
+    Returns
+    -------
+    The ExactLandscape of the weighted sum.
+
+    """
+    depth = max(landscape.depth for landscape in landscapes)
+    layers = []
+    for k in range(depth):
+        pieces = [
+            (weight, landscape.layer(k))
+            for landscape, weight in zip(landscapes, weights)
+            if k < landscape.depth
+        ]
+        x = np.unique(np.concatenate([layer_x for _, (layer_x, _) in pieces]))
+        y = np.zeros(len(x))
+        for weight, (layer_x, layer_y) in pieces:
+            y += weight * _evaluate(x, layer_x, layer_y)
+        layers.append((x, y))
+    return ExactLandscape.from_layers(layers, landscapes[0].hom_deg)
+
+
+def average(landscapes: list) -> ExactLandscape:
+    """Compute the exact average of a list of ExactLandscapes."""
+    return linear_combination(landscapes, [1 / len(landscapes)] * len(landscapes))
+
+
+def construct_exact_landscapes(diagrams: list, hom_deg: int = 0) -> list:
+    """Construct the ExactLandscape of each diagram in a list."""
+    return [ExactLandscape.from_diagram(diagram, hom_deg) for diagram in diagrams]
+
+
+def grid_matrix(
+    landscapes: list,
+    num_steps: int = 1800,
+    max_depth: int = None,
+    dtype: type = np.float64,
+    downsample: int = 1,
+    sparse: bool = False,
+):
+    """
+    Sample exact landscapes on a common grid into a feature matrix.
+
+    The grid has `num_steps` points spanning the supports of all of the
+    landscapes, and the rows are laid out as those of `landscape_matrix`.
+    With `sparse=True`, the nonzero samples of each layer are written
+    straight into a CSR matrix, and the dense matrix is never built.
+
+    Parameters
+    ----------
+    landscapes : list
+        A list of ExactLandscapes.
+    num_steps : int, optional
+        The number of points of the grid. The default is 1800.
+    max_depth : int, optional
+        Keep at most this many layers of each landscape. The default keeps
+        all of them.
+    dtype : type, optional
+        The dtype of the matrix. The default is np.float64.
+    downsample : int, optional
+        Keep every `downsample`-th point of the grid. The default keeps all
+        of them.
+    sparse : bool, optional
+        If True, return a scipy.sparse.csr_matrix. The default is False.
+
+    Returns
+    -------
+    A numpy.ndarray, or a scipy.sparse.csr_matrix, of shape
+    (len(landscapes), depth * len(grid)).
+
+    """
+    nonempty = [landscape for landscape in landscapes if landscape.depth]
+    start = min((landscape.breakpoints.min() for landscape in nonempty), default=0)
+    stop = max((landscape.breakpoints.max() for landscape in nonempty), default=0)
+    grid = np.linspace(start, stop, num_steps)[::downsample]
+    depth = max(landscape.depth for landscape in landscapes)
+    if max_depth is not None:
+        depth = min(depth, max_depth)
+    shape = (len(landscapes), depth * len(grid))
+    if not sparse:
+        matrix = np.zeros(shape, dtype=dtype)
+        values = matrix.reshape(len(landscapes), depth, len(grid))
+        for idx, landscape in enumerate(landscapes):
+            for k in range(min(depth, landscape.depth)):
+                values[idx, k] = _evaluate(grid, *landscape.layer(k))
+        return matrix
+
+    data, indices, indptr = [], [], [0]
+    for landscape in landscapes:
+        row_nnz = 0
+        for k in range(min(depth, landscape.depth)):
+            layer = _evaluate(grid, *landscape.layer(k))
+            nonzero = np.flatnonzero(layer)
+            data.append(layer[nonzero])
+            indices.append(nonzero + k * len(grid))
+            row_nnz += len(nonzero)
+        indptr.append(indptr[-1] + row_nnz)
+    return scipy.sparse.csr_matrix(
+        (
+            np.concatenate(data).astype(dtype) if data else np.zeros(0, dtype=dtype),
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.intp),
+            np.array(indptr),
+        ),
+        shape=shape,
+    )
+
+
+def breakpoint_matrix(landscapes: list) -> np.ndarray:
+    """
+    Sample exact landscapes at the union of their breakpoints, layer by layer.
+
+    Every landscape is linear between consecutive columns of a layer, and so
+    is any linear combination of the rows. The sup norm of a combination,
+    such as a difference of group averages, is therefore the maximum of the
+    absolute values of the combined row, exactly.
+
+    Parameters
+    ----------
+    landscapes : list
+        A list of ExactLandscapes.
+
+    Returns
+    -------
+    A numpy.ndarray with one row per landscape.
+
+    """
+    depth = max(landscape.depth for landscape in landscapes)
+    columns = []
+    for k in range(depth):
+        layers = [landscape.layer(k) for landscape in landscapes]
+        x = np.unique(np.concatenate([layer_x for layer_x, _ in layers]))
+        columns.append(
+            np.array([_evaluate(x, *layer) for layer in layers]).reshape(
+                len(landscapes), len(x)
+            )
+        )
+    if not columns:
+        return np.zeros((len(landscapes), 0))
+    return np.hstack(columns)
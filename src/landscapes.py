@@ -1,11 +1,37 @@
 """Compute persistence landscapes from perseus files and auxiliary functions."""
 
+import hashlib
 import os
+from collections import OrderedDict
 
 import numpy as np
-from persim.landscapes import PersLandscapeApprox, snap_pl
+import scipy.sparse
+from joblib import Parallel, delayed
+from persim.landscapes import PersLandscapeApprox
 
+from src.design import LabelIndex, get_design, resolve_design  # noqa: F401
+from src.diagram_store import read_perseus_output
+from src.exact_landscapes import ExactLandscape, grid_matrix
+from src.profiling import timed
 
+
+def _perseus_output_path(subject: str, hom_deg: int, time: int, data_dir: str) -> str:
+    """Path of the perseus output file of a time slice in a degree."""
+    # subject_prs_path = os.path.join(data_dir, "postprocessed", subject)
+    subject_prs_path = os.path.join(data_dir, "patient" + subject, "pers_output")
+    return os.path.join(
+        subject_prs_path,
+        "patient_"
+        + subject
+        + "_time_"
+        + str(time)
+        + "_output_"
+        + str(hom_deg)
+        + ".txt",
+    )
+
+
+@timed
 def perseus_to_sktda(
     subject: str, hom_deg: int, time: int, data_dir: str
 ) -> np.ndarray:
@@ -29,19 +55,8 @@ def perseus_to_sktda(
     A numpy.ndarray of the persistence diagram.
 
     """
-    # subject_prs_path = os.path.join(data_dir, "postprocessed", subject)
-    subject_prs_path = os.path.join(data_dir, "patient" + subject, "pers_output")
     subject_pd = []
-    subject_prs = os.path.join(
-        subject_prs_path,
-        "patient_"
-        + subject
-        + "_time_"
-        + str(time)
-        + "_output_"
-        + str(hom_deg)
-        + ".txt",
-    )
+    subject_prs = _perseus_output_path(subject, hom_deg, time, data_dir)
     with open(subject_prs, "r") as prs_file:
         for line in prs_file.readlines():
             x, y = line.strip().split(" ")
@@ -56,7 +71,15 @@ def perseus_to_sktda(
     )
 
 
-def construct_landscapes(subject: str, hom_deg: int, data_dir: str) -> list:
+@timed
+def construct_landscapes(
+    subject: str,
+    hom_deg: int,
+    data_dir: str,
+    num_steps: int = None,
+    exact: bool = False,
+    design=None,
+) -> list:
     """
     Construct the list of persistence landscapes.
 
@@ -71,25 +94,418 @@ def construct_landscapes(subject: str, hom_deg: int, data_dir: str) -> list:
         The homological degree.
     data_dir : str
         The path to the data directory.
+    num_steps : int, optional
+        The number of steps in the grid of each landscape. The default is 1800.
+    exact : bool, optional
+        If True, construct ExactLandscapes, which store the breakpoints of each
+        layer instead of a grid, in which case `num_steps` must not be given.
+        The grid of their feature matrix is chosen by `landscape_matrix`. The
+        default is False.
+    design : ExperimentDesign | str, optional
+        The design of the acquisition, or the path of its file. The default
+        is `DEFAULT_DESIGN`.
 
     Returns
     -------
     List of landscapes
 
     """
-    from src import total_time
-
+    if exact and num_steps is not None:
+        raise ValueError("num_steps does not apply to exact landscapes")
+    if num_steps is None:
+        num_steps = 1800
     pl_list = []
-    for time in range(total_time):
+    for time in range(get_design(design).total_time):
         diagrams = perseus_to_sktda(
             subject=subject, hom_deg=hom_deg, time=time, data_dir=data_dir
         )
+        if exact:
+            pl_list.append(ExactLandscape.from_diagram(diagrams[hom_deg], hom_deg))
+            continue
         pl_list.append(
-            PersLandscapeApprox(dgms=diagrams, hom_deg=hom_deg, num_steps=1800)
+            PersLandscapeApprox(dgms=diagrams, hom_deg=hom_deg, num_steps=num_steps)
         )
     return pl_list
 
 
+def _landscape_values(
+    pairs: np.ndarray, start: float, stop: float, num_steps: int
+) -> np.ndarray:
+    """
+    Compute the values of an approximate landscape with NumPy broadcasting.
+
+    This reproduces `PersLandscapeApprox.compute_landscape`: the birth-death
+    pairs are snapped to the grid, each pair contributes a tent sampled at the
+    grid points strictly between its birth and death, and the k-th landscape
+    is the k-th largest tent value at each grid point.
+    """
+    grid, step = np.linspace(start, stop, num_steps, retstep=True)
+    if len(pairs) == 0:
+        return np.zeros((0, num_steps))
+    births = np.argmin(np.abs(grid[:, np.newaxis] - pairs[:, 0]), axis=0)
+    deaths = np.argmin(np.abs(grid[:, np.newaxis] - pairs[:, 1]), axis=0)
+    index = np.arange(num_steps)
+    tents = np.maximum(
+        np.minimum(index - births[:, np.newaxis], deaths[:, np.newaxis] - index),
+        0,
+    )
+    depth = np.max(np.count_nonzero(tents, axis=0))
+    # Sort each column in decreasing order and keep the nonzero depths.
+    tents = -np.sort(-tents, axis=0)[:depth]
+    return tents * step
+
+
+@timed
+def construct_landscape_array(diagrams: list, num_steps: int = 1800) -> tuple:
+    """
+    Construct the values of many landscapes on a shared grid at once.
+
+    Each diagram is turned into an approximate landscape on its own grid, as
+    `PersLandscapeApprox` does, and then sampled on the grid shared by the
+    whole batch, as `snap_pl` does. The values are written into a single
+    zero-padded array, so the result agrees with `snap_pl` followed by
+    `pad_flatten_landscape_values` without constructing any landscape objects.
+
+    Parameters
+    ----------
+    diagrams : list
+        A list of numpy.ndarrays of birth-death pairs, all in the same
+        homological degree. Pairs with infinite death are ignored.
+    num_steps : int, optional
+        The number of steps in the grid. The default is 1800.
+
+    Returns
+    -------
+    A tuple (values, start, stop), where `values` is a numpy.ndarray of shape
+    (len(diagrams), max_depth, num_steps) and `start` and `stop` are the
+    bounds of the shared grid.
+
+    """
+    pairs_list = []
+    for diagram in diagrams:
+        pairs = np.asarray(diagram, dtype=np.float64).reshape(-1, 2)
+        pairs_list.append(pairs[~np.any(pairs == np.inf, axis=1)])
+    starts = [np.min(pairs[:, 0]) for pairs in pairs_list]
+    stops = [np.max(pairs[:, 1]) for pairs in pairs_list]
+    start, stop = min(starts), max(stops)
+    grid = np.linspace(start, stop, num_steps)
+
+    values_list = [
+        _landscape_values(pairs, pl_start, pl_stop, num_steps)
+        for pairs, pl_start, pl_stop in zip(pairs_list, starts, stops)
+    ]
+    max_depth = max(len(values) for values in values_list)
+    landscape_array = np.zeros((len(diagrams), max_depth, num_steps))
+    for idx, (values, pl_start, pl_stop) in enumerate(zip(values_list, starts, stops)):
+        if pl_start == start and pl_stop == stop:
+            landscape_array[idx, : len(values)] = values
+            continue
+        pl_grid = np.linspace(pl_start, pl_stop, num_steps)
+        for depth, funct in enumerate(values):
+            landscape_array[idx, depth] = np.interp(grid, pl_grid, funct)
+    return landscape_array, start, stop
+
+
+def iter_diagrams(subjects, hom_deg: int, data_dir: str, design=None):
+    """
+    Read the perseus output files of one or more subjects one at a time.
+
+    Parameters
+    ----------
+    subjects : str | list
+        The subject number(s).
+    hom_deg : int
+        The homological degree.
+    data_dir : str
+        The path to the data directory.
+    design : ExperimentDesign | str, optional
+        The design of the acquisitions. The default is `DEFAULT_DESIGN`.
+
+    Yields
+    ------
+    Tuples (subject, time, diagram), where `diagram` is a numpy.ndarray of
+    birth-death pairs with np.inf for classes that never die.
+
+    """
+    design = get_design(design)
+    if type(subjects) is str:
+        subjects = [subjects]
+    for subject in subjects:
+        for time in range(design.total_time):
+            path = _perseus_output_path(subject, hom_deg, time, data_dir)
+            yield subject, time, read_perseus_output(path)
+
+
+class LandscapeAccumulator:
+    """
+    Running means of landscapes per label on a shared grid.
+
+    Landscapes are added one at a time and folded into a running mean and sum
+    of squared deviations per label with Welford's update, so only two arrays
+    of shape (depth, num_steps) are held per label, however many landscapes
+    are added. The depth grows as deeper landscapes arrive, the missing layers
+    of the shallower ones counting as zero. Accumulators over disjoint sets of
+    landscapes, e.g. from parallel workers, are combined with `merge`.
+
+    Parameters
+    ----------
+    start : float
+        The start of the shared grid.
+    stop : float
+        The end of the shared grid. Landscapes are sampled on the grid, so any
+        part of a landscape beyond [start, stop] is ignored.
+    num_steps : int, optional
+        The number of steps in the grid. The default is 1800.
+    hom_deg : int, optional
+        The homological degree of the landscapes.
+
+    Examples
+    --------
+    Average the landscapes of every subject by label::
+
+        >>> accumulator = accumulate_landscapes(subjects, 1, data_dir)
+        >>> rest = accumulator.mean("rest")
+
+    """
+
+    def __init__(
+        self, start: float, stop: float, num_steps: int = 1800, hom_deg: int = 0
+    ) -> None:
+        if not (np.isfinite(start) and np.isfinite(stop)):
+            raise ValueError("The bounds of the grid must be finite")
+        self.start = float(start)
+        self.stop = float(stop)
+        self.num_steps = num_steps
+        self.hom_deg = hom_deg
+        self.grid = np.linspace(self.start, self.stop, num_steps)
+        self.counts = {}
+        self._means = {}
+        self._squares = {}
+
+    @property
+    def labels(self) -> list:
+        """The labels added so far."""
+        return list(self.counts)
+
+    def _grow(self, label: str, depth: int) -> None:
+        """Pad the running arrays of `label` with zero layers up to `depth`."""
+        if label not in self.counts:
+            self.counts[label] = 0
+            self._means[label] = np.zeros((0, self.num_steps))
+            self._squares[label] = np.zeros((0, self.num_steps))
+        extra = depth - len(self._means[label])
+        if extra > 0:
+            padding = np.zeros((extra, self.num_steps))
+            self._means[label] = np.vstack((self._means[label], padding))
+            self._squares[label] = np.vstack((self._squares[label], padding))
+
+    def _sample(self, landscape) -> np.ndarray:
+        """Sample a landscape or a diagram on the shared grid."""
+        if isinstance(landscape, ExactLandscape):
+            return landscape.sample(self.grid)
+        if isinstance(landscape, PersLandscapeApprox):
+            pl_grid = np.linspace(landscape.start, landscape.stop, landscape.num_steps)
+            return np.array(
+                [np.interp(self.grid, pl_grid, funct) for funct in landscape.values]
+            ).reshape(-1, self.num_steps)
+        pairs = np.asarray(landscape, dtype=np.float64).reshape(-1, 2)
+        pairs = pairs[~np.any(pairs == np.inf, axis=1)]
+        if len(pairs) == 0:
+            return np.zeros((0, self.num_steps))
+        pl_start, pl_stop = np.min(pairs[:, 0]), np.max(pairs[:, 1])
+        values = _landscape_values(pairs, pl_start, pl_stop, self.num_steps)
+        pl_grid = np.linspace(pl_start, pl_stop, self.num_steps)
+        return np.array(
+            [np.interp(self.grid, pl_grid, funct) for funct in values]
+        ).reshape(-1, self.num_steps)
+
+    def add(self, label: str, landscape) -> None:
+        """
+        Add one landscape to the running mean of `label`.
+
+        Parameters
+        ----------
+        label : str
+            The label of the landscape.
+        landscape : PersLandscapeApprox | ExactLandscape | np.ndarray
+            A landscape, or a diagram of birth-death pairs whose approximate
+            landscape is computed as by `construct_landscape_array`.
+
+        """
+        values = self._sample(landscape)
+        self._grow(label, len(values))
+        mean, squares = self._means[label], self._squares[label]
+        self.counts[label] += 1
+        delta = -mean
+        delta[: len(values)] += values
+        mean += delta / self.counts[label]
+        # delta * (values - new mean), with the missing layers of values zero.
+        deviation = -mean
+        deviation[: len(values)] += values
+        squares += delta * deviation
+
+    def update(self, items) -> "LandscapeAccumulator":
+        """Add every (label, landscape) pair of an iterable, e.g. a generator."""
+        for label, landscape in items:
+            self.add(label, landscape)
+        return self
+
+    def merge(self, other: "LandscapeAccumulator") -> "LandscapeAccumulator":
+        """
+        Fold the running means of another accumulator into this one.
+
+        Both accumulators must share the same grid. The merged means and
+        variances are those of all of the landscapes added to either one.
+
+        Returns
+        -------
+        This accumulator.
+
+        """
+        if (self.start, self.stop, self.num_steps) != (
+            other.start,
+            other.stop,
+            other.num_steps,
+        ):
+            raise ValueError("accumulators must share the same grid to be merged")
+        for label, count in other.counts.items():
+            if count == 0:
+                continue
+            self._grow(label, len(other._means[label]))
+            mean, squares = self._means[label], self._squares[label]
+            other_depth = len(other._means[label])
+            total = self.counts[label] + count
+            delta = -mean
+            delta[:other_depth] += other._means[label]
+            squares[:other_depth] += other._squares[label]
+            squares += delta**2 * (self.counts[label] * count / total)
+            mean += delta * (count / total)
+            self.counts[label] = total
+        return self
+
+    def mean(self, label: str) -> PersLandscapeApprox:
+        """Return the average of the landscapes labelled `label`."""
+        return PersLandscapeApprox(
+            start=self.start,
+            stop=self.stop,
+            num_steps=self.num_steps,
+            hom_deg=self.hom_deg,
+            values=self._means[label].copy(),
+        )
+
+    def variance(self, label: str, ddof: int = 1) -> np.ndarray:
+        """
+        Return the pointwise variance of the landscapes labelled `label`.
+
+        The result has shape (depth, num_steps), and `ddof` is the delta
+        degrees of freedom, as in np.var. The default gives the sample variance.
+        """
+        return self._squares[label] / (self.counts[label] - ddof)
+
+
+def _diagram_bounds(subjects: list, hom_deg: int, data_dir: str, design) -> tuple:
+    """The smallest birth and the largest finite death over all diagrams."""
+    start, stop = np.inf, -np.inf
+    for subject in subjects:
+        for _, _, diagram in iter_diagrams(
+            subject, hom_deg, data_dir, get_design(design, subject)
+        ):
+            pairs = diagram[np.isfinite(diagram[:, 1])]
+            if len(pairs):
+                start = min(start, pairs[:, 0].min())
+                stop = max(stop, pairs[:, 1].max())
+    if start > stop:
+        raise ValueError(
+            "No diagram has a finite birth-death pair; give start and stop"
+        )
+    return start, stop
+
+
+def _accumulate_subject(
+    subject: str,
+    hom_deg: int,
+    data_dir: str,
+    start: float,
+    stop: float,
+    num_steps: int,
+    design,
+) -> LandscapeAccumulator:
+    """The accumulator of the landscapes of one subject, labelled by time slice."""
+    design = get_design(design, subject)
+    accumulator = LandscapeAccumulator(start, stop, num_steps, hom_deg)
+    return accumulator.update(
+        (design.labels[time], diagram)
+        for _, time, diagram in iter_diagrams(subject, hom_deg, data_dir, design)
+    )
+
+
+@timed
+def accumulate_landscapes(
+    subjects,
+    hom_deg: int,
+    data_dir: str,
+    start: float = None,
+    stop: float = None,
+    num_steps: int = 1800,
+    n_jobs: int = None,
+    design=None,
+) -> LandscapeAccumulator:
+    """
+    Average the landscapes of many subjects per label, one diagram at a time.
+
+    Each time slice is labelled by the design of its subject, so subjects
+    with acquisitions of different lengths or designs can be averaged
+    together. The diagrams are streamed
+    from the perseus output files and folded into a `LandscapeAccumulator`
+    per subject, and the accumulators of the subjects are merged, so no list
+    of landscapes is ever held in memory.
+
+    Parameters
+    ----------
+    subjects : str | list
+        The subject number(s).
+    hom_deg : int
+        The homological degree.
+    data_dir : str
+        The path to the data directory.
+    start, stop : float, optional
+        The bounds of the shared grid. By default they are the smallest birth
+        and the largest finite death of all diagrams, found by a first pass
+        over the files, which gives the grid `construct_landscape_array` would
+        use for all of the diagrams at once. A ValueError is raised if no
+        diagram has a finite pair.
+    num_steps : int, optional
+        The number of steps in the grid. The default is 1800.
+    n_jobs : int, optional
+        Number of subjects processed in parallel.
+    design : ExperimentDesign | str | dict, optional
+        The design of the acquisitions, or a dict of designs keyed by subject,
+        as read by `get_design`. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    The merged LandscapeAccumulator.
+
+    """
+    if type(subjects) is str:
+        subjects = [subjects]
+    design = resolve_design(design)
+    if start is None or stop is None:
+        bounds = _diagram_bounds(subjects, hom_deg, data_dir, design)
+        start = bounds[0] if start is None else start
+        stop = bounds[1] if stop is None else stop
+    partials = Parallel(n_jobs=n_jobs)(
+        delayed(_accumulate_subject)(
+            subject, hom_deg, data_dir, start, stop, num_steps, design
+        )
+        for subject in subjects
+    )
+    accumulator = LandscapeAccumulator(start, stop, num_steps, hom_deg)
+    for partial in partials:
+        accumulator.merge(partial)
+    return accumulator
+
+
 def select_from_list(landscapes: list, list_of_labels: list, target_label: str) -> list:
     """
     Select a sublist of landscapes based on label.
@@ -131,7 +547,8 @@ def pad_flatten_landscape_values(landscapes: list) -> list:
     to be flattened to produce a vector of length max_depth * num_steps.
 
     NOTE:: Does not pad in place. Returns a list of values rather than a list
-    of landscapes.
+    of landscapes. The values are the rows of `landscape_matrix`, which should
+    be used directly when a single array is wanted.
 
     Parameters
     ----------
@@ -143,17 +560,311 @@ def pad_flatten_landscape_values(landscapes: list) -> list:
     The padded and flattened landscape values.
 
     """
-    landscapes = snap_pl(landscapes)
+    return list(landscape_matrix(landscapes))
 
-    max_depth = np.max([landscape.max_depth for landscape in landscapes])
-    pl_values = [landscape.values for landscape in landscapes]
-    num_steps = landscapes[0].num_steps
 
-    for idx, value in enumerate(pl_values):
-        if np.shape(value)[0] == max_depth:
-            pl_values[idx] = value.flatten()
+@timed
+def landscape_matrix(
+    landscapes: list,
+    max_depth: int = None,
+    dtype: type = np.float64,
+    downsample: int = 1,
+    sparse: bool = False,
+    num_steps: int = None,
+):
+    """
+    Snap, pad and flatten landscapes into a single feature matrix.
+
+    The landscapes are sampled on a common grid, as by `snap_pl`, and written
+    straight into a preallocated C-contiguous matrix whose rows are the
+    flattened landscape values, padded with zeroes to the greatest depth. No
+    intermediate landscapes or per-row arrays are built.
+
+    ExactLandscapes are sampled on a grid of `num_steps` points by
+    `grid_matrix`.
+
+    Deep landscape functions vanish over most of the grid, so the matrix is
+    mostly zeroes. With `sparse=True` it is assembled as a CSR matrix holding
+    the nonzero values only, and its size scales with the number of nonzeroes
+    rather than with depth * num_steps.
+
+    Parameters
+    ----------
+    landscapes : list
+        A list of landscapes.
+    max_depth : int, optional
+        Keep at most this many landscape functions of each landscape. The
+        default keeps all of them.
+    dtype : type, optional
+        The dtype of the matrix. The default is np.float64.
+    downsample : int, optional
+        Keep every `downsample`-th point of the common grid. The default keeps
+        all of them.
+    sparse : bool, optional
+        If True, return a scipy.sparse.csr_matrix. The default is False.
+    num_steps : int, optional
+        The number of points of the grid of ExactLandscapes. The default is
+        1800. Approximate landscapes keep the grid they were constructed on,
+        so a ValueError is raised if it is given for them.
+
+    Returns
+    -------
+    A numpy.ndarray, or a scipy.sparse.csr_matrix, of shape
+    (len(landscapes), depth * len(grid)), where `depth` is the greatest depth
+    of the landscapes, capped at `max_depth`, and `grid` is the downsampled
+    common grid.
+
+    """
+    if isinstance(landscapes[0], ExactLandscape):
+        return grid_matrix(
+            landscapes,
+            num_steps=1800 if num_steps is None else num_steps,
+            max_depth=max_depth,
+            dtype=dtype,
+            downsample=downsample,
+            sparse=sparse,
+        )
+    if num_steps is not None:
+        raise ValueError("num_steps only applies to ExactLandscapes")
+
+    start = min(landscape.start for landscape in landscapes)
+    stop = max(landscape.stop for landscape in landscapes)
+    num_steps = max(landscape.num_steps for landscape in landscapes)
+    grid = np.linspace(start, stop, num_steps)[::downsample]
+    num_points = len(grid)
+
+    depth = max(landscape.max_depth for landscape in landscapes)
+    if max_depth is not None:
+        depth = min(depth, max_depth)
+    shape = (len(landscapes), depth * num_points)
+    if sparse:
+        data, indices, indptr = [], [], [0]
+    else:
+        matrix = np.zeros(shape, dtype=dtype)
+        # A view of the matrix indexed by (landscape, depth, grid point).
+        values = matrix.reshape(len(landscapes), depth, num_points)
+    for idx, landscape in enumerate(landscapes):
+        on_grid = (
+            landscape.start == start
+            and landscape.stop == stop
+            and landscape.num_steps == num_steps
+        )
+        if on_grid:
+            snapped = landscape.values[:depth, ::downsample]
         else:
-            pl_values[idx] = np.append(
-                value, [np.array([0] * num_steps * (max_depth - np.shape(value)[0]))]
+            pl_grid = np.linspace(landscape.start, landscape.stop, landscape.num_steps)
+            snapped = [
+                np.interp(grid, pl_grid, funct) for funct in landscape.values[:depth]
+            ]
+        if not sparse:
+            values[idx, : len(snapped)] = snapped
+            continue
+        row_nnz = 0
+        for level, funct in enumerate(snapped):
+            nonzero = np.flatnonzero(funct)
+            data.append(np.asarray(funct)[nonzero])
+            indices.append(nonzero + level * num_points)
+            row_nnz += len(nonzero)
+        indptr.append(indptr[-1] + row_nnz)
+    if not sparse:
+        return matrix
+    return scipy.sparse.csr_matrix(
+        (
+            np.concatenate(data).astype(dtype) if data else np.zeros(0, dtype=dtype),
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.intp),
+            np.array(indptr),
+        ),
+        shape=shape,
+    )
+
+
+class LandscapeCache:
+    """
+    Cache of constructed landscapes and feature matrices.
+
+    Entries are addressed by the subject, the homological degree(s), the
+    number of grid steps and a fingerprint (name, size and modification time)
+    of every perseus output file they were built from, so editing or
+    regenerating a diagram invalidates the entries built from it. Entries are
+    kept in memory in a least-recently-used store bounded by `max_bytes`, and
+    written to `cache_dir` as .npz files when `cache_dir` is given, so they are
+    shared between runs.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Directory of the on-disk cache. The default keeps entries in memory only.
+    max_bytes : int, optional
+        Upper bound on the memory used by cached arrays. The default is 1 GiB.
+
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = 2**30) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(
+        self,
+        kind: str,
+        subject: str,
+        hom_degs: list,
+        num_steps: int,
+        data_dir: str,
+        design=None,
+    ) -> str:
+        """Fingerprint the parameters and the source files of an entry."""
+        digest = hashlib.sha256(f"{kind}|{subject}|{hom_degs}|{num_steps}".encode())
+        for hom_deg in hom_degs:
+            for time in range(get_design(design).total_time):
+                path = _perseus_output_path(subject, hom_deg, time, data_dir)
+                stat = os.stat(path)
+                digest.update(
+                    f"|{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+                )
+        return kind + "_" + subject + "_" + digest.hexdigest()[:32]
+
+    def _get(self, key: str) -> dict:
+        """Look an entry up in memory, then on disk."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + ".npz")
+            if os.path.exists(path):
+                with np.load(path) as npz:
+                    arrays = {name: npz[name] for name in npz.files}
+                self._remember(key, arrays)
+                return arrays
+        return None
+
+    def _put(self, key: str, arrays: dict) -> None:
+        """Store an entry in memory and on disk."""
+        if self.cache_dir is not None:
+            np.savez(os.path.join(self.cache_dir, key + ".npz"), **arrays)
+        self._remember(key, arrays)
+
+    def _remember(self, key: str, arrays: dict) -> None:
+        """Add an entry to the in-memory store, evicting the least recently used."""
+        nbytes = sum(array.nbytes for array in arrays.values())
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = arrays
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= sum(array.nbytes for array in evicted.values())
+
+    @timed(name="LandscapeCache.landscapes")
+    def landscapes(
+        self,
+        subject: str,
+        hom_deg: int,
+        data_dir: str,
+        num_steps: int = 1800,
+        design=None,
+    ) -> list:
+        """
+        Return the landscapes of `construct_landscapes`, from the cache if possible.
+
+        Parameters
+        ----------
+        subject : str
+            The subject number to be analyzed.
+        hom_deg : int
+            The homological degree.
+        data_dir : str
+            The path to the data directory.
+        num_steps : int, optional
+            The number of steps in the grid of each landscape.
+        design : ExperimentDesign | str, optional
+            The design of the acquisition. The default is `DEFAULT_DESIGN`.
+
+        Returns
+        -------
+        List of landscapes
+
+        """
+        key = self._key("landscapes", subject, [hom_deg], num_steps, data_dir, design)
+        arrays = self._get(key)
+        if arrays is None:
+            landscapes = construct_landscapes(
+                subject=subject,
+                hom_deg=hom_deg,
+                data_dir=data_dir,
+                num_steps=num_steps,
+                design=design,
+            )
+            depths = np.array([landscape.max_depth for landscape in landscapes])
+            values = np.zeros((len(landscapes), depths.max(), num_steps))
+            for idx, landscape in enumerate(landscapes):
+                values[idx, : depths[idx]] = landscape.values
+            arrays = {
+                "starts": np.array([landscape.start for landscape in landscapes]),
+                "stops": np.array([landscape.stop for landscape in landscapes]),
+                "depths": depths,
+                "values": values,
+            }
+            self._put(key, arrays)
+        return [
+            PersLandscapeApprox(
+                start=start,
+                stop=stop,
+                num_steps=num_steps,
+                hom_deg=hom_deg,
+                values=values[:depth],
+            )
+            for start, stop, depth, values in zip(
+                arrays["starts"], arrays["stops"], arrays["depths"], arrays["values"]
             )
-    return pl_values
+        ]
+
+    @timed(name="LandscapeCache.feature_matrix")
+    def feature_matrix(
+        self,
+        subject: str,
+        hom_degs: list,
+        data_dir: str,
+        num_steps: int = 1800,
+        design=None,
+    ) -> np.ndarray:
+        """
+        Return the `landscape_matrix` of a subject's landscapes in several degrees.
+
+        The rows are the landscapes of `hom_degs[0]` for every time slice,
+        followed by those of `hom_degs[1]`, and so on, all snapped to one grid.
+
+        Parameters
+        ----------
+        subject : str
+            The subject number to be analyzed.
+        hom_degs : list
+            The homological degrees.
+        data_dir : str
+            The path to the data directory.
+        num_steps : int, optional
+            The number of steps in the grid of each landscape.
+        design : ExperimentDesign | str, optional
+            The design of the acquisition. The default is `DEFAULT_DESIGN`.
+
+        Returns
+        -------
+        The feature matrix.
+
+        """
+        key = self._key(
+            "features", subject, list(hom_degs), num_steps, data_dir, design
+        )
+        arrays = self._get(key)
+        if arrays is None:
+            landscapes = []
+            for hom_deg in hom_degs:
+                landscapes += self.landscapes(
+                    subject, hom_deg, data_dir, num_steps, design
+                )
+            arrays = {"features": landscape_matrix(landscapes)}
+            self._put(key, arrays)
+        return arrays["features"]
@@ -5,20 +5,39 @@ just the ACC. The mask filters these other regions out, leaving the ACC.
 
 """
 
+import logging
+import math
 import os
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
 
 import gudhi
 import h5py as h5
 import numpy as np
 
+from src.design import get_design, resolve_design
+from src.masks import Mask, load_mask
+from src.profiling import timed
 
-def apply_mask(subject: str, mask: np.ndarray, data_dir: str, supra: bool) -> None:
+DEFAULT_CHUNK_BYTES = 2**28
+
+
+@timed
+def apply_mask(
+    subject: str,
+    mask: Mask,
+    data_dir: str,
+    supra: bool,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    design=None,
+) -> None:
     """
     Apply the mask to the subject and convert to a perseus input file.
 
     This method reads from the 'raw' subdirectory of `data_dir` and writes
     to the 'preprocessed' subdirectory of `data_dir`. It does not return
-    anything.
+    anything. The raw volume is read in chunks of time slices by
+    `read_masked_amplitudes`, so it is never loaded whole.
 
     This method should not be called directly; use `construct_dataset` to
     avoid reloading the (potentially large) mask.
@@ -28,7 +47,7 @@ def apply_mask(subject: str, mask: np.ndarray, data_dir: str, supra: bool) -> No
     subject : str
         The subject number to be parsed.
 
-    mask: np.ndarray
+    mask: Mask | np.ndarray
         The mask to be applied to subject.
 
     data_dir : str
@@ -37,41 +56,184 @@ def apply_mask(subject: str, mask: np.ndarray, data_dir: str, supra: bool) -> No
     supra : bool
         True if supralevelset persistent homology is to be computed.
 
+    chunk_bytes : int, optional
+        Upper bound on the size of each read from the raw file. The default
+        is 256 MiB.
+
+    design : ExperimentDesign | str, optional
+        The design of the acquisition, or the path of its file. The default
+        is `DEFAULT_DESIGN`.
+
     Returns
     -------
     None.
     """
-    subject_data_path = os.path.join(
-        data_dir, "raw", subject, "rocd" + subject + ".mat"
+    times = range(get_design(design).total_time)
+    mask = _as_mask(mask)
+    amplitudes = read_masked_amplitudes(
+        raw_data_path(subject, data_dir),
+        mask.coordinates,
+        times,
+        supra,
+        chunk_bytes,
     )
-    subject_data = np.array(h5.File(subject_data_path, "r"))
-    max_fmri = int(np.round(np.amax(subject_data)))
-
-    from src import total_time
+    coordinates = mask.perseus_coordinates()
 
-    for time in range(total_time):
+    for time in times:
         prs_filename = "patient_" + subject + "_time_" + str(time) + ".prs"
-        prs_file = open(
-            os.path.join(data_dir, "preprocessed", subject, prs_filename), "w"
+        np.savetxt(
+            os.path.join(data_dir, "preprocessed", subject, prs_filename),
+            np.column_stack((coordinates, amplitudes[time])),
+            fmt="%d",
+            header="3",  # Write dimension to top of perseus input file
+            comments="",
         )
-        prs_file.write("3/n")  # Write dimension to top of perseus input file
 
-        for z in range(35, 85):
-            for x in range(40, 77):
-                for y in range(83, 123):
-                    if int(np.round(mask[z, x, y])) != 0:
-                        if supra:
-                            prs_file.write(
-                                f"{z} {x} {y} {np.round(max_fmri - subject_data[time,z,x,y])}"
-                            )
-                        else:
-                            prs_file.write(
-                                f"{z} {x} {y} {np.round(subject_data[time,z,x,y])}"
-                            )
-        prs_file.close()
+
+def raw_data_path(subject: str, data_dir: str) -> str:
+    """Path of the raw matlab file of a subject."""
+    return os.path.join(data_dir, "raw", subject, "rocd" + subject + ".mat")
+
+
+def _as_mask(mask: Mask) -> Mask:
+    """Wrap a mask array in a `Mask`, which computes its voxels once."""
+    if isinstance(mask, Mask):
+        return mask
+    return Mask.from_array("mask", mask)
+
+
+def mask_coordinates(mask: Mask) -> tuple:
+    """
+    Compute the coordinates of the voxels selected by the mask.
+
+    The coordinates are returned in the order in which they are written to
+    the perseus input files, i.e. lexicographically in (z, x, y).
+
+    Parameters
+    ----------
+    mask : Mask | np.ndarray
+        The mask to be applied.
+
+    Returns
+    -------
+    A tuple (z, x, y) of integer numpy.ndarrays.
+
+    """
+    return _as_mask(mask).coordinates
+
+
+def _masked_amplitudes(
+    subject_data: np.ndarray, coordinates: tuple, times: range, supra: bool
+) -> np.ndarray:
+    """
+    Gather the rounded amplitudes of the masked voxels for the given times.
+
+    All time slices are gathered with a single fancy index, giving an array of
+    shape (len(times), number of voxels).
+    """
+    z, x, y = coordinates
+    amplitudes = np.asarray(subject_data)[np.asarray(times)[:, None], z, x, y]
+    if supra:
+        max_fmri = int(np.round(np.amax(subject_data)))
+        amplitudes = max_fmri - amplitudes
+    return np.round(amplitudes)
 
 
-def construct_perseus_input_files(subjects: str, data_dir: str, supra: bool) -> None:
+def _raw_dataset(raw_file: h5.File) -> h5.Dataset:
+    """
+    Find the volume in a raw matlab file.
+
+    A MATLAB v7.3 file holds each variable as a top-level HDF5 dataset, next to
+    bookkeeping groups whose names start with '#'. The raw files hold a single
+    variable, the volume.
+    """
+    for name, item in raw_file.items():
+        if isinstance(item, h5.Dataset) and not name.startswith("#"):
+            return item
+    raise ValueError(f"No volume found in {raw_file.filename}")
+
+
+def _dataset_max(dataset: h5.Dataset, chunk_bytes: int) -> float:
+    """Maximum of a whole (time, z, x, y) dataset, read in chunks of time slices."""
+    slice_bytes = dataset.dtype.itemsize * math.prod(dataset.shape[1:])
+    step = max(1, chunk_bytes // slice_bytes)
+    return max(
+        dataset[start : start + step].max()
+        for start in range(0, dataset.shape[0], step)
+    )
+
+
+@timed
+def read_masked_amplitudes(
+    subject_data_path: str,
+    coordinates: tuple,
+    times: range,
+    supra: bool,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+) -> np.ndarray:
+    """
+    Read the rounded amplitudes of the masked voxels from a raw matlab file.
+
+    This is the out-of-core counterpart of `_masked_amplitudes`, with the same
+    result. The time slices are read in chunks of at most `chunk_bytes`, as
+    hyperslabs of the HDF5 dataset spanning the bounding box of the voxels.
+    For supralevel persistence, the amplitudes are inverted about the maximum
+    of the whole acquisition, every time slice and every voxel, which is
+    accumulated in a separate pass over chunks of whole time slices. Only one
+    chunk and the gathered amplitudes are held in memory at a time.
+
+    Parameters
+    ----------
+    subject_data_path : str
+        The path to the raw matlab file, holding amplitudes indexed by
+        (time, z, x, y).
+
+    coordinates : tuple
+        The (z, x, y) coordinates of the voxels, as given by `mask_coordinates`.
+
+    times : range
+        The time slices to read. For supralevel persistence the maximum is
+        still taken over every time slice.
+
+    supra : bool
+        True if supralevelset persistent homology is to be computed.
+
+    chunk_bytes : int, optional
+        Upper bound on the size of each read. At least one time slice is read
+        at a time. The default is 256 MiB.
+
+    Returns
+    -------
+    A numpy.ndarray of shape (len(times), number of voxels).
+
+    """
+    z, x, y = coordinates
+    with h5.File(subject_data_path, "r") as raw_file:
+        dataset = _raw_dataset(raw_file)
+        box = tuple(slice(c.min(), c.max() + 1) for c in (z, x, y))
+        lower = (z.min(), x.min(), y.min())
+        slab_bytes = dataset.dtype.itemsize * math.prod(s.stop - s.start for s in box)
+        step = max(1, chunk_bytes // slab_bytes)
+
+        amplitudes = np.empty((len(times), len(z)), dtype=np.float64)
+        for start in range(0, len(times), step):
+            chunk = times[start : start + step]
+            slab = dataset[(slice(chunk.start, chunk.stop, chunk.step),) + box]
+            amplitudes[start : start + len(chunk)] = slab[
+                :, z - lower[0], x - lower[1], y - lower[2]
+            ]
+            # Free the chunk before the next one is read.
+            del slab
+        if supra:
+            max_fmri = _dataset_max(dataset, chunk_bytes)
+    if supra:
+        amplitudes = int(np.round(max_fmri)) - amplitudes
+    return np.round(amplitudes)
+
+
+def construct_perseus_input_files(
+    subjects: str, data_dir: str, supra: bool, design=None
+) -> None:
     """
     Load the mask and apply it to each subject.
 
@@ -89,6 +251,10 @@ def construct_perseus_input_files(subjects: str, data_dir: str, supra: bool) ->
     supra : bool
         True if supralevelset persistent homology is to be computed.
 
+    design : ExperimentDesign | str | dict, optional
+        The design of the acquisitions, or a dict of designs keyed by subject,
+        as read by `get_design`. The default is `DEFAULT_DESIGN`.
+
     Returns
     -------
     None.
@@ -96,12 +262,12 @@ def construct_perseus_input_files(subjects: str, data_dir: str, supra: bool) ->
     """
     if type(subjects) is str:
         subjects = [subjects]
-    mask_path = data_dir + "rDACC.mat"
-    mask = h5.File(mask_path, "r")
-    mask = np.array(mask.get("ocd0408"))  # 0408 is used for all subject runs.
+    design = resolve_design(design)
+    # 0408 is used for all subject runs.
+    mask = load_mask(os.path.join(data_dir, "rDACC.mat"), "ocd0408")
 
     for subject in subjects:
-        apply_mask(subject, mask, data_dir, supra)
+        apply_mask(subject, mask, data_dir, supra, design=get_design(design, subject))
 
 
 def construct_diagrams_gudhi(
@@ -128,20 +294,144 @@ def construct_diagrams_gudhi(
     -------
     A numpy.ndarray consisting of birth-death pairs.
 
+    """
+    return construct_all_diagrams_gudhi(
+        subject=subject, hom_degs=[hom_deg], time=time, data_dir=data_dir
+    )[0]
+
+
+@timed
+def construct_all_diagrams_gudhi(
+    subject: str, hom_degs: list, time: int, data_dir: str
+) -> list:
+    """
+    Construct persistence diagrams in several degrees from one gudhi complex.
+
+    `compute_persistence` produces the intervals in every dimension at once,
+    so the cubical complex of the time slice is built and reduced only once,
+    however many degrees are requested. The perseus input file written by
+    `apply_mask` lists the masked voxels only, which gudhi does not read, so
+    the complex is built from its voxels by `_cubical_complex`.
+
+    Parameters
+    ----------
+    subject : str
+        A subject number to be analyzed.
+
+    hom_degs : list
+        The homological degrees used to compute persistence.
+
+    time : int
+        The time slice to analyze.
+
+    data_dir : str
+        The path to the data directory.
+
+    Returns
+    -------
+    A list of numpy.ndarrays of birth-death pairs, one per entry of `hom_degs`.
+
     """
     prs_filename = "patient_" + subject + "_time_" + str(time) + ".prs"
-    cubical_complex = gudhi.CubicalComplex(
-        perseus_file=os.path.join(data_dir, "preprocessed", subject, prs_filename)
+    voxels = read_perseus_input(
+        os.path.join(data_dir, "preprocessed", subject, prs_filename)
+    )
+    return _persistence_intervals(
+        _cubical_complex(voxels[:, :3], voxels[:, 3]), hom_degs
     )
+
+
+def _cubical_complex(coordinates: np.ndarray, values: np.ndarray):
+    """
+    Build the cubical complex of the masked voxels of a time slice.
+
+    The voxels are placed in a dense array of top-dimensional cells spanning
+    their bounding box, with the unmasked voxels set to +inf so they never
+    enter the filtration.
+    """
+    coordinates = coordinates - coordinates.min(axis=0)
+    cells = np.full(coordinates.max(axis=0) + 1, np.inf)
+    cells[tuple(coordinates.T)] = values
+    return gudhi.CubicalComplex(top_dimensional_cells=cells)
+
+
+def _persistence_intervals(
+    cubical_complex: gudhi.CubicalComplex, hom_degs: list
+) -> list:
+    """Compute persistence once and extract the intervals in each degree."""
     cubical_complex.compute_persistence(homology_coeff_field=2)
-    return cubical_complex.persistence_intervals_in_dimension(hom_deg)
+    return [
+        cubical_complex.persistence_intervals_in_dimension(hom_deg)
+        for hom_deg in hom_degs
+    ]
+
+
+@timed
+def construct_diagrams_in_memory(
+    subject_data: np.ndarray,
+    mask: Mask,
+    hom_degs: list,
+    supra: bool,
+    times: range = None,
+    design=None,
+) -> list:
+    """
+    Construct persistence diagrams straight from the loaded volume.
+
+    This is the in-memory counterpart of `apply_mask` followed by
+    `construct_all_diagrams_gudhi`: no perseus input files are written or
+    parsed. For each time slice the masked voxels are placed in a dense array
+    of top-dimensional cells spanning the bounding box of the mask, with the
+    unmasked voxels set to +inf so they never enter the filtration, and the
+    array is handed to gudhi directly. The diagrams agree with those computed
+    by perseus from the sparse perseus input files.
+
+    Parameters
+    ----------
+    subject_data : np.ndarray
+        The signal amplitudes of the subject, indexed by (time, z, x, y).
+
+    mask : Mask | np.ndarray
+        The mask to be applied to subject.
 
+    hom_degs : list
+        The homological degrees used to compute persistence.
 
-def construct_persistence_files(subject: str, hom_deg: int, data_dir: str) -> None:
+    supra : bool
+        True if supralevelset persistent homology is to be computed.
+
+    times : range, optional
+        The time slices to analyze. The default is every time slice of
+        `design`.
+
+    design : ExperimentDesign | str, optional
+        The design of the acquisition. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    A list indexed by time slice, each entry a list of numpy.ndarrays of
+    birth-death pairs, one per entry of `hom_degs`.
+
+    """
+    if times is None:
+        times = range(get_design(design).total_time)
+    coordinates = mask_coordinates(mask)
+    amplitudes = _masked_amplitudes(subject_data, coordinates, times, supra)
+    coordinates = np.column_stack(coordinates)
+    return [
+        _persistence_intervals(_cubical_complex(coordinates, amplitudes[idx]), hom_degs)
+        for idx in range(len(times))
+    ]
+
+
+@timed
+def construct_persistence_files(
+    subject: str, hom_deg: int, data_dir: str, design=None
+) -> None:
     """
     Construct persistence diagram output files using gudhi directly.
 
-    This method writes to the 'preprocessed' subdirectory of `data_dir`.
+    This method writes to the 'postprocessed' subdirectory of `data_dir`.
     It does not return anything.
 
     Parameters
@@ -149,68 +439,284 @@ def construct_persistence_files(subject: str, hom_deg: int, data_dir: str) -> No
     subject : str
         A subject number to be analyzed.
 
-    hom_deg : int
-        The homological degree used to compute persistence.
+    hom_deg : int | list(int)
+        The homological degree(s) used to compute persistence. The persistence
+        of each time slice is computed once for all of the degrees.
 
     data_dir : str
         The path to the data directory.
 
+    design : ExperimentDesign | str, optional
+        The design of the acquisition. The default is `DEFAULT_DESIGN`.
+
     Returns
     -------
     None.
 
     """
+    if type(hom_deg) is int:
+        hom_deg = [hom_deg]
     post_processing_dir = os.path.join(data_dir, "postprocessed", subject)
-    from src import total_time
 
-    for time in range(total_time):
-        pd_filename = (
-            "patient_"
-            + subject
-            + "_time_"
-            + str(time)
-            + "_output_"
-            + str(hom_deg)
-            + ".txt"
+    for time in range(get_design(design).total_time):
+        _write_diagrams(subject, hom_deg, time, data_dir, post_processing_dir)
+
+
+def _diagram_filename(subject: str, time: int, hom_deg: int) -> str:
+    """Name of the persistence diagram file of a time slice in a degree."""
+    return (
+        "patient_" + subject + "_time_" + str(time) + "_output_" + str(hom_deg) + ".txt"
+    )
+
+
+def _write_diagram(path: str, pds: np.ndarray) -> None:
+    """
+    Write birth-death pairs in the perseus output format.
+
+    Each line holds one integer birth-death pair separated by a space, and
+    classes which never die are given the death value -1.
+    """
+    with open(path, "w") as pd_file:
+        for b, d in pds:
+            death = -1 if np.isinf(d) else int(np.round(d))
+            pd_file.write(f"{int(np.round(b))} {death}\n")
+
+
+def _write_diagrams(
+    subject: str, hom_degs: list, time: int, data_dir: str, post_processing_dir: str
+) -> None:
+    """Compute the diagrams of a time slice once and write one file per degree."""
+    all_pds = construct_all_diagrams_gudhi(
+        subject=subject, hom_degs=hom_degs, time=time, data_dir=data_dir
+    )
+    for hom_deg, pds in zip(hom_degs, all_pds):
+        _write_diagram(
+            os.path.join(
+                post_processing_dir, _diagram_filename(subject, time, hom_deg)
+            ),
+            pds,
         )
-        with open(os.path.join(post_processing_dir, pd_filename), "w") as pd_file:
-            pds = construct_diagrams_gudhi(
-                subject=subject, hom_deg=hom_deg, time=time, data_dir=data_dir
-            )
-            for (b, d) in pds:
-                pd_file.writelines([str(b), str(d), "\n"])
 
 
-def construct_vector(subject: str, data_dir: str) -> list:
+def _persistence_task(task: tuple) -> tuple:
     """
-    Construct a vector of signal amplitude whose coordinates are ordered by the perseus input file.
+    Compute and write the diagrams of one (subject, time) work item.
+
+    Runs in a worker process of `construct_persistence_files_parallel`.
+    """
+    subject, time, hom_degs, data_dir = task
+    start = timer.perf_counter()
+    _write_diagrams(
+        subject,
+        hom_degs,
+        time,
+        data_dir,
+        os.path.join(data_dir, "postprocessed", subject),
+    )
+    return subject, time, timer.perf_counter() - start
+
+
+@timed
+def construct_persistence_files_parallel(
+    subjects: str,
+    hom_degs: list,
+    data_dir: str,
+    n_jobs: int = None,
+    chunksize: int = None,
+    resume: bool = True,
+    design=None,
+) -> list:
+    """
+    Construct persistence diagram output files for many subjects in parallel.
+
+    Every (subject, time) pair is an independent work item, and the work items
+    are fanned out over a process pool. Each work item computes the persistence
+    of its time slice once, extracts the diagrams in all of `hom_degs` and
+    writes them to the 'postprocessed' subdirectory
+    of `data_dir`, exactly as `construct_persistence_files` does.
 
     Parameters
     ----------
-    subject
-    data_dir
+    subjects : str | list(str)
+        A (list of) subject number(s) to be analyzed.
+
+    hom_degs : list
+        The homological degrees used to compute persistence.
+
+    data_dir : str
+        The path to the data directory.
+
+    n_jobs : int, optional
+        Number of worker processes. The default is the number of CPUs.
+
+    chunksize : int, optional
+        Number of work items sent to a worker at once. The default splits the
+        work items into about four chunks per worker, which amortizes the
+        inter-process overhead while keeping the workers balanced.
+
+    resume : bool, optional
+        If True, skip the time slices whose output files all exist already.
+        The default is True.
+
+    design : ExperimentDesign | str | dict, optional
+        The design of the acquisitions, or a dict of designs keyed by subject,
+        as read by `get_design`, so subjects of different lengths share the
+        process pool. The default is `DEFAULT_DESIGN`.
 
     Returns
     -------
+    A list of (subject, time, seconds) tuples, one per computed work item,
+    ordered by subject and then by time.
 
     """
-    from src import total_time
+    if type(subjects) is str:
+        subjects = [subjects]
+    design = resolve_design(design)
+
+    tasks = []
+    for subject in subjects:
+        post_processing_dir = os.path.join(data_dir, "postprocessed", subject)
+        os.makedirs(post_processing_dir, exist_ok=True)
+        for time in range(get_design(design, subject).total_time):
+            if resume and all(
+                os.path.exists(
+                    os.path.join(
+                        post_processing_dir, _diagram_filename(subject, time, hom_deg)
+                    )
+                )
+                for hom_deg in hom_degs
+            ):
+                continue
+            tasks.append((subject, time, list(hom_degs), data_dir))
+    if not tasks:
+        return []
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(tasks) / (4 * n_jobs)))
+
+    logger = logging.getLogger(__name__)
+    timings = []
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        # `map` yields results in submission order, so the output is
+        # deterministic regardless of which worker finishes first.
+        for subject, time, seconds in executor.map(
+            _persistence_task, tasks, chunksize=chunksize
+        ):
+            logger.debug(f"Subject {subject} time {time}: {seconds:.3f}s")
+            timings.append((subject, time, seconds))
+    logger.info(
+        f"Computed {len(timings)} time slices in {sum(t for *_, t in timings):.1f}s"
+        f" of worker time"
+    )
+    return timings
+
+
+def read_perseus_input(path: str) -> np.ndarray:
+    """
+    Read a perseus input file written by `apply_mask`.
+
+    Parameters
+    ----------
+    path : str
+        The path to the perseus input file.
+
+    Returns
+    -------
+    An integer numpy.ndarray with one row (z, x, y, amplitude) per voxel.
+
+    """
+    with open(path, "r") as prs_file:
+        tokens = prs_file.read().split()
+    # The first token is the dimension of the complex.
+    return np.array(tokens[1:], dtype=np.int64).reshape(-1, 4)
+
+
+@timed
+def construct_vector(
+    subject: str,
+    data_dir: str,
+    mmap_path: str = None,
+    mask: Mask = None,
+    supra: bool = True,
+    design=None,
+) -> np.ndarray:
+    """
+    Construct a vector of signal amplitude whose coordinates are ordered by the perseus input file.
+
+    The amplitudes of each time slice are streamed into one preallocated
+    array, which is backed by a memory-mapped file if `mmap_path` is given.
+    Every time slice must list the same voxels in the same order.
 
-    return_list = []
+    If `mask` is given, the perseus input files are not read. The amplitudes
+    are gathered from the raw volume instead, exactly as `apply_mask` writes
+    them to the perseus input files.
+
+    Parameters
+    ----------
+    subject : str
+        The subject number to be analyzed.
+
+    data_dir : str
+        The path to the data directory.
+
+    mmap_path : str, optional
+        File backing the returned array. The default keeps it in memory.
+
+    mask : Mask | np.ndarray, optional
+        The mask to gather the amplitudes from the raw volume with.
+
+    supra : bool, optional
+        Whether the amplitudes gathered with `mask` are those of supralevelset
+        persistent homology. Ignored without `mask`. The default is True.
+
+    design : ExperimentDesign | str, optional
+        The design of the acquisition. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    An int32 numpy.ndarray of shape (total_time, number of voxels), whose
+    rows are the amplitude vectors of the time slices.
+
+    """
+    total_time = get_design(design).total_time
 
     # Check if file exists. If not, create it.
     # if not os.path.exists(path=os.path.join(data_dir,"preprocessed", subject, "patient_" + subject + "_time_0.prs")):
     #    construct_persistence_files(subject=subject, hom_deg=hom_deg, data_dir=data_dir)
 
+    if mask is not None:
+        amplitudes = read_masked_amplitudes(
+            raw_data_path(subject, data_dir),
+            mask_coordinates(mask),
+            range(total_time),
+            supra,
+        )
+        if mmap_path is None:
+            return amplitudes.astype(np.int32)
+        vectors = np.lib.format.open_memmap(
+            mmap_path, mode="w+", dtype=np.int32, shape=amplitudes.shape
+        )
+        vectors[:] = amplitudes
+        return vectors
+
     subject_data_path = os.path.join(data_dir, "patient" + subject, "pers_input")
+    vectors = None
     for time in range(total_time):
-        time_list = []
         prs_filename = "patient_" + subject + "_time_" + str(time) + ".prs"
-        with open(os.path.join(subject_data_path, prs_filename), "r") as prs_file:
-            for line in prs_file:
-                if line == "3\n":
-                    continue
-                else:
-                    time_list.append(int(line.split(" ")[-1]))
-        return_list.append(time_list)
-    return return_list
+        voxels = read_perseus_input(os.path.join(subject_data_path, prs_filename))
+        if vectors is None:
+            coordinates = voxels[:, :3]
+            shape = (total_time, len(voxels))
+            if mmap_path is None:
+                vectors = np.empty(shape, dtype=np.int32)
+            else:
+                vectors = np.lib.format.open_memmap(
+                    mmap_path, mode="w+", dtype=np.int32, shape=shape
+                )
+        elif not np.array_equal(voxels[:, :3], coordinates):
+            raise ValueError(
+                f"Voxels of time slice {time} differ from those of time slice 0"
+            )
+        vectors[time] = voxels[:, 3]
+    return vectors
@@ -0,0 +1,150 @@
+"""Regions of interest, as the voxels they select from the raw volumes.
+
+A mask file such as 'rDACC.mat' holds one or more 3D arrays, each nonzero on
+a region of interest. A `Mask` stores the coordinates of the selected voxels
+in the order of the perseus input files, together with their bounding box and
+their flat index into the volume, so masking a volume is a single gather.
+Masks are computed once per file and name and memoized for the rest of the
+process, and can also be cached on disk.
+
+"""
+
+import hashlib
+import os
+
+import h5py as h5
+import numpy as np
+
+DEFAULT_MASK = "ocd0408"  # Asadur hardcoded this mask for all subjects.
+
+_loaded = {}
+
+
+class Mask:
+    """
+    The voxels selected by a region of interest.
+
+    Parameters
+    ----------
+    name : str
+        The name of the region.
+    coordinates : tuple
+        Integer arrays (z, x, y) of the voxel coordinates, in the order of the
+        perseus input files, i.e. lexicographically in (z, x, y).
+    shape : tuple
+        The shape of the volume the mask applies to.
+
+    """
+
+    def __init__(self, name: str, coordinates: tuple, shape: tuple) -> None:
+        self.name = name
+        self.shape = tuple(int(n) for n in shape)
+        self.coordinates = tuple(np.asarray(c, dtype=np.int64) for c in coordinates)
+        self.lower = tuple(int(c.min()) for c in self.coordinates)
+        self.upper = tuple(int(c.max()) + 1 for c in self.coordinates)
+        self.bounding_box = tuple(
+            slice(low, high) for low, high in zip(self.lower, self.upper)
+        )
+        self.flat_index = np.ravel_multi_index(self.coordinates, self.shape)
+
+    @classmethod
+    def from_array(cls, name: str, mask: np.ndarray) -> "Mask":
+        """Select the voxels where `mask` rounds to a nonzero value."""
+        # np.nonzero lists the voxels in C order, which is the perseus order.
+        return cls(name, np.nonzero(np.round(mask) != 0), mask.shape)
+
+    def __len__(self) -> int:
+        return len(self.flat_index)
+
+    def gather(self, volume: np.ndarray) -> np.ndarray:
+        """
+        Select the masked voxels of a volume.
+
+        Parameters
+        ----------
+        volume : np.ndarray
+            An array whose last three axes have the shape of the mask, e.g.
+            indexed by (time, z, x, y).
+
+        Returns
+        -------
+        A numpy.ndarray with the last three axes replaced by one axis over the
+        masked voxels.
+
+        """
+        volume = np.asarray(volume)
+        return volume.reshape(volume.shape[:-3] + (-1,))[..., self.flat_index]
+
+    def perseus_coordinates(self) -> np.ndarray:
+        """Return the (z, x, y) rows written to the perseus input files."""
+        return np.column_stack(self.coordinates)
+
+    def save(self, path: str) -> None:
+        """Write the mask to an .npz file."""
+        np.savez(path, coordinates=np.stack(self.coordinates), shape=self.shape)
+
+    @classmethod
+    def load(cls, name: str, path: str) -> "Mask":
+        """Read a mask written by `save`."""
+        with np.load(path) as npz:
+            return cls(name, tuple(npz["coordinates"]), tuple(npz["shape"]))
+
+
+def load_masks(mask_path: str, names: list = None, cache_dir: str = None) -> dict:
+    """
+    Load several masks from a matlab file, opening it at most once.
+
+    Parameters
+    ----------
+    mask_path : str
+        The path to the matlab file of the masks.
+    names : list, optional
+        The names of the masks in the file. The default is every 3D array.
+    cache_dir : str, optional
+        Directory of an on-disk cache of the masks. The cached masks are
+        addressed by the name, size and modification time of `mask_path`.
+
+    Returns
+    -------
+    A dict from the names to the `Mask`s.
+
+    """
+    stat = os.stat(mask_path)
+    fingerprint = hashlib.sha256(
+        f"{os.path.abspath(mask_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+    ).hexdigest()[:32]
+
+    def cache_path(name: str) -> str:
+        return os.path.join(cache_dir, f"mask_{name}_{fingerprint}.npz")
+
+    masks = {}
+    if names is not None:
+        for name in names:
+            if (fingerprint, name) in _loaded:
+                masks[name] = _loaded[fingerprint, name]
+            elif cache_dir is not None and os.path.exists(cache_path(name)):
+                masks[name] = Mask.load(name, cache_path(name))
+        if len(masks) == len(names):
+            _loaded.update({(fingerprint, name): masks[name] for name in names})
+            return masks
+
+    with h5.File(mask_path, "r") as mask_file:
+        if names is None:
+            names = [
+                name
+                for name, item in mask_file.items()
+                if isinstance(item, h5.Dataset) and item.ndim == 3
+            ]
+        for name in names:
+            if name not in masks:
+                masks[name] = Mask.from_array(name, mask_file[name][()])
+                if cache_dir is not None:
+                    os.makedirs(cache_dir, exist_ok=True)
+                    masks[name].save(cache_path(name))
+    _loaded.update({(fingerprint, name): masks[name] for name in names})
+    return masks
+
+
+def load_mask(mask_path: str, name: str = DEFAULT_MASK, cache_dir: str = None) -> Mask:
+    """Load one mask from a matlab file; see `load_masks`."""
+    return load_masks(mask_path, [name], cache_dir)[name]
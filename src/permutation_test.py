@@ -1,13 +1,26 @@
 """Construct the permutation test."""
+
 import random
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+import pandas as pd
 from persim.landscapes import average_approx, snap_pl
+from scipy.stats import beta
 
-from .landscapes import select_from_list
+from .design import get_design, resolve_design
+from .exact_landscapes import ExactLandscape, breakpoint_matrix
+from .landscapes import landscape_matrix
+from .profiling import timed
 
 
+@timed
 def permutation_test(
-    landscapes: list, labels: list, num_perms: int = 1500, seed: int = 42
+    landscapes: list,
+    labels: list,
+    num_perms: int = 1500,
+    seed: int = 42,
+    design=None,
 ):
     """
     Compute the permutation test of landscapes with labellings.
@@ -35,19 +48,22 @@ def permutation_test(
         Number of shuffles used in the permutation test.
     seed: int, optional
         Random seed for consistency among repeated runs.
+    design: ExperimentDesign | str, optional
+        The design labelling the landscapes. The default is `DEFAULT_DESIGN`.
 
     Returns
     -------
     The p-value of the test.
 
     """
-    from src import target_labels
-
     if seed:
         random.seed(seed)
 
-    plA = select_from_list(landscapes, target_labels, labels[0])
-    plB = select_from_list(landscapes, target_labels, labels[1])
+    label_index = get_design(design)
+    if len(landscapes) != len(label_index):
+        raise ValueError("landscapes and the design must be the same length")
+    plA = [landscapes[idx] for idx in label_index.rows(labels[:1])]
+    plB = [landscapes[idx] for idx in label_index.rows(labels[1:2])]
     avg_A = average_approx(plA)
     avg_B = average_approx(plB)
     [avg_A_snapped, avg_B_snapped] = snap_pl([avg_A, avg_B])
@@ -74,3 +90,430 @@ def permutation_test(
 
     p_val = sig_count / num_perms
     return p_val
+
+
+def permutation_statistics(features: np.ndarray, a_masks: np.ndarray) -> np.ndarray:
+    """
+    Compute the sup norm of the difference of group averages for many labellings.
+
+    Each row of `a_masks` splits the rows of `features` into a group A (True)
+    and a group B (False). The group averages of all labellings are computed
+    at once as matrix products.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Padded and flattened landscape values, one row per landscape, as
+        returned by `landscape_matrix`.
+    a_masks : np.ndarray
+        Boolean array of shape (number of labellings, len(features)).
+
+    Returns
+    -------
+    A numpy.ndarray with the sup norm of each labelling.
+
+    """
+    a_masks = np.asarray(a_masks, dtype=features.dtype)
+    b_masks = 1 - a_masks
+    avg_a = (a_masks @ features) / a_masks.sum(axis=1, keepdims=True)
+    avg_b = (b_masks @ features) / b_masks.sum(axis=1, keepdims=True)
+    return np.max(np.abs(avg_a - avg_b), axis=1)
+
+
+def _significant_count(
+    features: np.ndarray, significance: float, a_masks: np.ndarray
+) -> int:
+    """Count the labellings at least as significant as `significance`."""
+    return int(
+        np.count_nonzero(permutation_statistics(features, a_masks) >= significance)
+    )
+
+
+def _random_masks(num_landscapes: int, size: int, seed_seq) -> np.ndarray:
+    """Draw `size` labellings putting half of the landscapes in the first group."""
+    rng = np.random.default_rng(seed_seq)
+    a_indices = np.argsort(rng.random((size, num_landscapes)), axis=1)
+    a_masks = np.zeros((size, num_landscapes), dtype=bool)
+    np.put_along_axis(a_masks, a_indices[:, : num_landscapes // 2], True, axis=1)
+    return a_masks
+
+
+_worker_state = {}
+
+
+def _init_worker(features: np.ndarray, significance: float) -> None:
+    """Send the feature matrix to a worker process once."""
+    _worker_state["features"] = features
+    _worker_state["significance"] = significance
+
+
+def _worker_batch(size: int, seed_seq) -> int:
+    """Draw and score one batch of shuffles in a worker process."""
+    features = _worker_state["features"]
+    return _significant_count(
+        features,
+        _worker_state["significance"],
+        _random_masks(len(features), size, seed_seq),
+    )
+
+
+def _p_value_decided(
+    sig_count: int, num_done: int, alpha: float, confidence: float
+) -> bool:
+    """Check if the Clopper-Pearson interval of the p-value excludes `alpha`."""
+    tail = (1 - confidence) / 2
+    lower = beta.ppf(tail, sig_count, num_done - sig_count + 1) if sig_count else 0.0
+    upper = (
+        beta.ppf(1 - tail, sig_count + 1, num_done - sig_count)
+        if sig_count < num_done
+        else 1.0
+    )
+    return upper < alpha or lower > alpha
+
+
+@timed
+def permutation_test_vectorized(
+    landscapes: list,
+    labels: list,
+    num_perms: int = 1500,
+    seed: int = 42,
+    batch_size: int = 250,
+    permutations: np.ndarray = None,
+    n_jobs: int = 1,
+    alpha: float = None,
+    confidence: float = 0.99,
+    design=None,
+):
+    """
+    Compute the permutation test of landscapes with labellings in batches.
+
+    This is the same test as `permutation_test`, but the landscapes are
+    snapped and padded once into a matrix, and the group averages of
+    `batch_size` shuffles are evaluated together by `permutation_statistics`.
+    All averages are taken on the common grid of the selected landscapes,
+    whereas `permutation_test` averages each group on its own grid before
+    snapping; the two agree exactly when the landscapes share a grid.
+
+    If the landscapes are ExactLandscapes, they are sampled at the union of
+    their breakpoints by `breakpoint_matrix` instead, and the sup norms of
+    the differences of the group averages are exact.
+
+    As in `permutation_test`, each shuffle draws half of the selected
+    landscapes, rounded down, into the first group.
+
+    The batches can be spread over `n_jobs` worker processes. Every batch
+    draws its shuffles from its own stream, spawned from `seed` by a
+    numpy.random.SeedSequence, so the result for a given seed does not depend
+    on `n_jobs`. If `alpha` is given, the test stops early as soon as the
+    confidence interval of the p-value lies entirely above or below `alpha`.
+
+    Parameters
+    ----------
+    landscapes: list
+        List of landscapes to perform the permutation test on.
+    labels: list
+        List of two strings chosen from "rest", "beat", or "random" to use in
+        performing the permutation test.
+    num_perms : int
+        Number of shuffles used in the permutation test.
+    seed: int, optional
+        Seed from which the streams of shuffles are spawned.
+    batch_size: int, optional
+        Number of shuffles evaluated at once.
+    permutations: np.ndarray, optional
+        Integer array whose rows are the indices, into the selected landscapes
+        of `labels[0]` followed by those of `labels[1]`, of the first group of
+        each shuffle. If given, `num_perms`, `seed` and `n_jobs` are ignored.
+    n_jobs: int, optional
+        Number of worker processes, at least 1. The default is 1, which runs
+        in process.
+    alpha: float, optional
+        Significance level for early stopping. The default never stops early.
+    confidence: float, optional
+        Confidence level of the Clopper-Pearson interval used to stop early.
+    design: ExperimentDesign | str, optional
+        The design labelling the landscapes. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    The p-value of the test, over the shuffles evaluated before stopping.
+
+    """
+    if n_jobs < 1:
+        raise ValueError("n_jobs must be at least 1")
+    label_index = get_design(design)
+    if len(landscapes) != len(label_index):
+        raise ValueError("landscapes and the design must be the same length")
+    rows = label_index.rows(labels[:2])
+    selected = [landscapes[idx] for idx in rows]
+    if isinstance(selected[0], ExactLandscape):
+        features = breakpoint_matrix(selected)
+    else:
+        features = landscape_matrix(selected)
+    num_landscapes = len(features)
+
+    true_mask = np.zeros((1, num_landscapes), dtype=bool)
+    true_mask[0, : len(label_index.rows(labels[:1]))] = True
+    significance = permutation_statistics(features, true_mask)[0]
+
+    if permutations is not None:
+        num_perms = len(permutations)
+        sig_count = 0
+        for batch_start in range(0, num_perms, batch_size):
+            batch = np.asarray(permutations[batch_start : batch_start + batch_size])
+            a_masks = np.zeros((len(batch), num_landscapes), dtype=bool)
+            np.put_along_axis(a_masks, batch, True, axis=1)
+            sig_count += _significant_count(features, significance, a_masks)
+        return sig_count / num_perms
+
+    sizes = [
+        min(batch_size, num_perms - batch_start)
+        for batch_start in range(0, num_perms, batch_size)
+    ]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(sizes))
+    # Without early stopping every batch is submitted at once; with it, one
+    # batch per worker is evaluated before the interval is checked again.
+    round_size = len(sizes) if alpha is None else n_jobs
+
+    executor = None
+    if n_jobs > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=n_jobs,
+            initializer=_init_worker,
+            initargs=(features, significance),
+        )
+    sig_count, num_done = 0, 0
+    try:
+        for round_start in range(0, len(sizes), round_size):
+            round_batches = list(
+                zip(
+                    sizes[round_start : round_start + round_size],
+                    seed_seqs[round_start : round_start + round_size],
+                )
+            )
+            if executor is None:
+                counts = [
+                    _significant_count(
+                        features,
+                        significance,
+                        _random_masks(num_landscapes, size, seed_seq),
+                    )
+                    for size, seed_seq in round_batches
+                ]
+            else:
+                counts = executor.map(_worker_batch, *zip(*round_batches))
+            sig_count += sum(counts)
+            num_done += sum(size for size, _ in round_batches)
+            if alpha is not None and _p_value_decided(
+                sig_count, num_done, alpha, confidence
+            ):
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    p_val = sig_count / num_done
+    return p_val
+
+
+def _stratified_weights(
+    a_masks: np.ndarray, valid: np.ndarray, stratified: bool
+) -> np.ndarray:
+    """
+    Turn labellings into the weights of the difference of group averages.
+
+    `a_masks` has shape (number of labellings, subjects, rows), and `valid`,
+    of shape (subjects, rows), marks the rows holding a landscape; the other
+    rows pad the subjects with fewer selected time slices. The weights are
+    1 / |A| on group A and -1 / |B| on group B, and 0 on padding, with the
+    groups counted within each subject if `stratified`, and over all subjects
+    otherwise. The stratified weights are divided by the number of subjects,
+    so both give the difference of the cohort averages.
+    """
+    axes = (2,) if stratified else (1, 2)
+    b_masks = ~a_masks & valid
+    a_weights = a_masks / a_masks.sum(axis=axes, keepdims=True)
+    b_weights = b_masks / b_masks.sum(axis=axes, keepdims=True)
+    weights = a_weights - b_weights
+    if stratified:
+        weights /= a_masks.shape[1]
+    return weights
+
+
+def _group_masks(
+    valid: np.ndarray, size: int, stratified: bool, seed_seq
+) -> np.ndarray:
+    """
+    Draw `size` labellings of the valid rows of every subject.
+
+    With `stratified`, half of the valid rows of each subject, rounded down,
+    go into the first group; otherwise half of all valid rows do. The rows
+    are ranked by uniform keys as in `_random_masks`, so a single subject
+    gets the labellings `_random_masks` draws from the same seed.
+    """
+    rng = np.random.default_rng(seed_seq)
+    keys = rng.random((size,) + valid.shape)
+    keys[:, ~valid] = np.inf
+    if not stratified:
+        keys = keys.reshape(size, 1, -1)
+    num_valid = np.isfinite(keys[0]).sum(axis=-1)
+    a_masks = np.zeros(keys.shape, dtype=bool)
+    np.put_along_axis(
+        a_masks,
+        np.argsort(keys, axis=-1),
+        np.arange(keys.shape[-1]) < (num_valid // 2)[:, np.newaxis],
+        axis=-1,
+    )
+    return a_masks.reshape((size,) + valid.shape)
+
+
+@timed
+def group_permutation_test(
+    landscapes: dict,
+    labels: list,
+    num_perms: int = 1500,
+    seed: int = 42,
+    batch_size: int = 250,
+    stratified: bool = True,
+    design=None,
+) -> pd.DataFrame:
+    """
+    Compute the permutation test of a cohort, and of each of its subjects.
+
+    The statistic of the cohort is the sup norm of the difference between the
+    averages of the landscapes labelled `labels[0]` and `labels[1]` over all
+    subjects. The landscapes of each degree are snapped to one grid and padded
+    into a single tensor of shape (subjects, rows, columns), as by
+    `landscape_matrix`, and every batch of shuffles is drawn once and scored
+    against every degree. With `stratified` the labels are shuffled within
+    each subject, half of each subject's landscapes, rounded down, going into
+    the first group as in `permutation_test`; each subject is then also tested
+    on its own, under the same shuffles. Otherwise the labels are shuffled
+    across the whole cohort and only the cohort is tested.
+
+    The subjects may have designs of different lengths, given as a dict of
+    designs keyed by subject. The landscapes of the subjects with fewer
+    selected time slices are then padded with rows which take no part in
+    the averages or the shuffles.
+
+    ExactLandscapes are sampled at the union of their breakpoints, as in
+    `permutation_test_vectorized`.
+
+    Parameters
+    ----------
+    landscapes : dict
+        Landscapes of each subject, keyed by subject number, as dicts from the
+        homological degree to the list of landscapes of every time slice, e.g.
+        `{subject: {1: construct_landscapes(subject, 1, data_dir)}}`.
+    labels : list
+        The two labels to be compared, e.g. ["rest", "beat"].
+    num_perms : int, optional
+        Number of shuffles used in the permutation test.
+    seed : int, optional
+        Seed from which the streams of shuffles are spawned.
+    batch_size : int, optional
+        Number of shuffles evaluated at once.
+    stratified : bool, optional
+        If True (the default), shuffle the labels within each subject.
+    design : ExperimentDesign | str | dict, optional
+        The design labelling the landscapes of every subject, or a dict of
+        designs keyed by subject, as read by `get_design`. The default is
+        `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    A pandas.DataFrame with one row per subject and degree, and the columns
+    "subject", "hom_deg", "statistic" and "p_value". The rows of the whole
+    cohort have the subject "all".
+
+    """
+    design = resolve_design(design)
+    subjects = list(landscapes)
+    designs = [get_design(design, subject) for subject in subjects]
+    rows = [label_index.rows(labels[:2]) for label_index in designs]
+    hom_degs = sorted({hom_deg for pls in landscapes.values() for hom_deg in pls})
+    num_rows = max(len(subject_rows) for subject_rows in rows)
+    # The rows of each subject which hold a landscape, the rest is padding.
+    valid = np.arange(num_rows) < np.array([len(r) for r in rows])[:, np.newaxis]
+
+    tensors = {}
+    for hom_deg in hom_degs:
+        selected = []
+        for subject, label_index, subject_rows in zip(subjects, designs, rows):
+            if len(landscapes[subject][hom_deg]) != len(label_index):
+                raise ValueError("landscapes and the design must be the same length")
+            selected += [landscapes[subject][hom_deg][idx] for idx in subject_rows]
+        if isinstance(selected[0], ExactLandscape):
+            features = breakpoint_matrix(selected)
+        else:
+            features = landscape_matrix(selected)
+        if valid.all():
+            tensors[hom_deg] = features.reshape(len(subjects), num_rows, -1)
+        else:
+            tensors[hom_deg] = np.zeros((len(subjects), num_rows, features.shape[1]))
+            tensors[hom_deg][valid] = features
+
+    true_masks = np.zeros((1, len(subjects), num_rows), dtype=bool)
+    for idx, label_index in enumerate(designs):
+        true_masks[0, idx, : len(label_index.rows(labels[:1]))] = True
+    true_weights = _stratified_weights(true_masks, valid, stratified)
+
+    def statistics(weights: np.ndarray, tensor: np.ndarray) -> tuple:
+        """The statistics of the cohort and of each subject, per labelling."""
+        cohort_diff = np.zeros((len(weights), tensor.shape[2]))
+        subject_stats = np.zeros((len(weights), len(subjects)))
+        for idx in range(len(subjects)):
+            diff = weights[:, idx] @ tensor[idx]
+            cohort_diff += diff
+            subject_stats[:, idx] = np.max(np.abs(diff), axis=1) * len(subjects)
+        return np.max(np.abs(cohort_diff), axis=1), subject_stats
+
+    significance = {
+        hom_deg: statistics(true_weights, tensor) for hom_deg, tensor in tensors.items()
+    }
+    sig_counts = {
+        hom_deg: (0, np.zeros(len(subjects), dtype=int)) for hom_deg in hom_degs
+    }
+
+    sizes = [
+        min(batch_size, num_perms - batch_start)
+        for batch_start in range(0, num_perms, batch_size)
+    ]
+    for size, seed_seq in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))):
+        weights = _stratified_weights(
+            _group_masks(valid, size, stratified, seed_seq), valid, stratified
+        )
+        for hom_deg, tensor in tensors.items():
+            cohort, subject_stats = statistics(weights, tensor)
+            true_cohort, true_subjects = significance[hom_deg]
+            cohort_count, subject_counts = sig_counts[hom_deg]
+            sig_counts[hom_deg] = (
+                cohort_count + np.count_nonzero(cohort >= true_cohort[0]),
+                subject_counts
+                + np.count_nonzero(subject_stats >= true_subjects, axis=0),
+            )
+
+    results = []
+    for hom_deg in hom_degs:
+        true_cohort, true_subjects = significance[hom_deg]
+        cohort_count, subject_counts = sig_counts[hom_deg]
+        results.append(
+            {
+                "subject": "all",
+                "hom_deg": hom_deg,
+                "statistic": true_cohort[0],
+                "p_value": cohort_count / num_perms,
+            }
+        )
+        if not stratified:
+            continue
+        for idx, subject in enumerate(subjects):
+            results.append(
+                {
+                    "subject": subject,
+                    "hom_deg": hom_deg,
+                    "statistic": true_subjects[0, idx],
+                    "p_value": subject_counts[idx] / num_perms,
+                }
+            )
+    return pd.DataFrame(results, columns=["subject", "hom_deg", "statistic", "p_value"])
@@ -0,0 +1,384 @@
+"""Run the preprocessing workflow as a graph of resumable stages.
+
+Each stage of the workflow (mask application, persistence, diagram store and
+landscapes) reads some files under the data directory and writes others.
+After a stage has run for a subject, a manifest recording a fingerprint of its
+parameters and of its input files (name, size and modification time) is
+written to the 'manifests' subdirectory of the data directory. A stage is
+rerun only if its outputs are missing or its fingerprint has changed, and a
+rerun stage makes every stage downstream of it stale. Changing `supra`, say,
+reruns mask application and everything after it, while changing `num_steps`
+only recomputes the landscapes.
+
+The `design` parameter is the experiment design of the acquisitions, or a
+dict of designs keyed by subject. It is not fingerprinted itself: the time
+slices it implies determine the files each stage reads and writes, so a
+design of another length is picked up by those.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from src import profiling
+from src.design import get_design, resolve_design
+from src.diagram_store import DiagramStore, convert_perseus_outputs, diagram_store_path
+from src.landscapes import construct_landscape_array
+from src.make_dataset import (
+    _diagram_filename,
+    apply_mask,
+    construct_persistence_files_parallel,
+    raw_data_path,
+)
+from src.masks import load_mask
+
+
+class Stage:
+    """
+    A step of the workflow, run for one subject at a time.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+    run : callable
+        Called as `run(subject, data_dir, params)` to produce the outputs.
+    inputs : callable
+        Called as `inputs(subject, data_dir, params)`, returns the paths of
+        the files the stage reads.
+    outputs : callable
+        Called as `outputs(subject, data_dir, params)`, returns the paths of
+        the files the stage writes.
+    params : tuple, optional
+        Names of the pipeline parameters the stage depends on.
+    deps : tuple, optional
+        Names of the stages which must run before this one.
+
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run,
+        inputs,
+        outputs,
+        params: tuple = (),
+        deps: tuple = (),
+    ) -> None:
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = tuple(params)
+        self.deps = tuple(deps)
+
+
+class Pipeline:
+    """
+    A graph of stages, and the parameters they are run with.
+
+    Parameters
+    ----------
+    stages : list
+        The stages. Dependencies which are not in the list are assumed to be
+        satisfied already, so a pipeline can start from any stage.
+    data_dir : str
+        The path to the data directory.
+    **params
+        The pipeline parameters, passed to the stages as a dict. The default
+        parameters are given by `DEFAULT_PARAMS`.
+
+    """
+
+    def __init__(self, stages: list, data_dir: str, **params) -> None:
+        self.stages = _topological_order(stages)
+        self.data_dir = data_dir
+        self.params = {**DEFAULT_PARAMS, **params}
+        # Design files are read here once, rather than by every stage.
+        self.params["design"] = resolve_design(self.params["design"])
+
+    def _manifest_path(self, stage: Stage, subject: str) -> str:
+        """Path of the manifest of a stage for a subject."""
+        return os.path.join(self.data_dir, "manifests", subject, stage.name + ".json")
+
+    def fingerprint(self, stage: Stage, subject: str) -> str:
+        """Hash the parameters and the current input files of a stage."""
+        params = {name: self.params[name] for name in stage.params}
+        digest = hashlib.sha256(
+            (stage.name + "|" + json.dumps(params, sort_keys=True)).encode()
+        )
+        for path in stage.inputs(subject, self.data_dir, self.params):
+            stat = os.stat(path)
+            digest.update(
+                f"|{os.path.basename(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+            )
+        return digest.hexdigest()
+
+    def is_stale(self, stage: Stage, subject: str) -> bool:
+        """Check whether a stage has to be (re)run for a subject."""
+        manifest_path = self._manifest_path(stage, subject)
+        if not os.path.exists(manifest_path):
+            return True
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["fingerprint"] != self.fingerprint(stage, subject):
+            return True
+        return not all(
+            os.path.exists(path)
+            for path in stage.outputs(subject, self.data_dir, self.params)
+        )
+
+    def stale(self, subject: str) -> list:
+        """
+        Return the names of the stages a run would execute for a subject.
+
+        A stage is stale if it is stale itself or any of its dependencies in
+        the pipeline is.
+        """
+        stale = []
+        for stage in self.stages:
+            if any(dep in stale for dep in stage.deps):
+                stale.append(stage.name)
+            else:
+                try:
+                    if self.is_stale(stage, subject):
+                        stale.append(stage.name)
+                except FileNotFoundError:
+                    # An input is missing, to be written by an upstream stage.
+                    stale.append(stage.name)
+        return stale
+
+    def run(self, subjects: str, force: bool = False) -> list:
+        """
+        Run the stale stages for each subject, in dependency order.
+
+        Parameters
+        ----------
+        subjects : str | list(str)
+            A (list of) subject number(s) to be analyzed.
+        force : bool, optional
+            If True, rerun every stage.
+
+        Returns
+        -------
+        A list of (subject, stage name) pairs, one per stage which was run.
+
+        """
+        if type(subjects) is str:
+            subjects = [subjects]
+        logger = logging.getLogger(__name__)
+        executed = []
+        for subject in subjects:
+            rerun = set()
+            for stage in self.stages:
+                if (
+                    not force
+                    and not rerun.intersection(stage.deps)
+                    and not self.is_stale(stage, subject)
+                ):
+                    logger.info(f"Subject {subject}: {stage.name} is up to date")
+                    continue
+                logger.info(f"Subject {subject}: running {stage.name}")
+                with profiling.stage(stage.name, subject):
+                    stage.run(subject, self.data_dir, self.params)
+                manifest_path = self._manifest_path(stage, subject)
+                os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+                with open(manifest_path, "w") as manifest_file:
+                    json.dump(
+                        {
+                            "fingerprint": self.fingerprint(stage, subject),
+                            "params": {
+                                name: self.params[name] for name in stage.params
+                            },
+                        },
+                        manifest_file,
+                    )
+                rerun.add(stage.name)
+                executed.append((subject, stage.name))
+        return executed
+
+
+def _topological_order(stages: list) -> list:
+    """Order the stages so that each comes after its dependencies."""
+    by_name = {stage.name: stage for stage in stages}
+    ordered = []
+    visiting = set()
+
+    def visit(stage: Stage) -> None:
+        if stage in ordered:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Stage {stage.name} depends on itself")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            if dep in by_name:
+                visit(by_name[dep])
+        visiting.discard(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+DEFAULT_PARAMS = {
+    "supra": True,
+    "hom_degs": [0, 1],
+    "num_steps": 1800,
+    "n_jobs": None,
+    "design": None,
+}
+
+
+def _mask_path(data_dir: str) -> str:
+    """Path of the mask file."""
+    return os.path.join(data_dir, "rDACC.mat")
+
+
+def _perseus_input_paths(subject: str, data_dir: str, design) -> list:
+    """Paths of the perseus input files of a subject."""
+    total_time = get_design(design, subject).total_time
+    return [
+        os.path.join(
+            data_dir,
+            "preprocessed",
+            subject,
+            "patient_" + subject + "_time_" + str(time) + ".prs",
+        )
+        for time in range(total_time)
+    ]
+
+
+def _perseus_output_paths(subject: str, data_dir: str, hom_degs: list, design) -> list:
+    """Paths of the persistence diagram files of a subject."""
+    total_time = get_design(design, subject).total_time
+    return [
+        os.path.join(
+            data_dir,
+            "postprocessed",
+            subject,
+            _diagram_filename(subject, time, hom_deg),
+        )
+        for hom_deg in hom_degs
+        for time in range(total_time)
+    ]
+
+
+def landscape_path(subject: str, hom_deg: int, data_dir: str) -> str:
+    """Path of the landscapes of a subject in a degree, written by the pipeline."""
+    return os.path.join(
+        data_dir,
+        "landscapes",
+        subject,
+        "patient_" + subject + "_landscapes_" + str(hom_deg) + ".npz",
+    )
+
+
+def _run_mask(subject: str, data_dir: str, params: dict) -> None:
+    # Loaded once, then memoized for every other subject.
+    mask = load_mask(_mask_path(data_dir))
+    os.makedirs(os.path.join(data_dir, "preprocessed", subject), exist_ok=True)
+    apply_mask(
+        subject,
+        mask,
+        data_dir,
+        params["supra"],
+        design=get_design(params["design"], subject),
+    )
+
+
+def _run_persistence(subject: str, data_dir: str, params: dict) -> None:
+    construct_persistence_files_parallel(
+        subject,
+        params["hom_degs"],
+        data_dir,
+        n_jobs=params["n_jobs"],
+        resume=False,
+        design=params["design"],
+    )
+
+
+def _run_diagrams(subject: str, data_dir: str, params: dict) -> None:
+    convert_perseus_outputs(
+        subject,
+        params["hom_degs"],
+        data_dir,
+        design=get_design(params["design"], subject),
+    )
+
+
+def _run_landscapes(subject: str, data_dir: str, params: dict) -> None:
+    store = DiagramStore(diagram_store_path(subject, data_dir))
+    for hom_deg in params["hom_degs"]:
+        values, start, stop = construct_landscape_array(
+            store.diagrams(hom_deg), num_steps=params["num_steps"]
+        )
+        path = landscape_path(subject, hom_deg, data_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, values=values, start=start, stop=stop)
+
+
+def default_stages() -> list:
+    """
+    Return the stages of the README workflow.
+
+    'mask' applies the mask to the raw data, 'persistence' computes the
+    diagrams with gudhi, 'diagrams' packs them into a diagram store and
+    'landscapes' writes the landscape values of every degree, on the grid
+    shared by all time slices, to the 'landscapes' subdirectory.
+    """
+    return [
+        Stage(
+            "mask",
+            _run_mask,
+            inputs=lambda subject, data_dir, params: [
+                raw_data_path(subject, data_dir),
+                _mask_path(data_dir),
+            ],
+            outputs=lambda subject, data_dir, params: _perseus_input_paths(
+                subject, data_dir, params["design"]
+            ),
+            params=("supra",),
+        ),
+        Stage(
+            "persistence",
+            _run_persistence,
+            inputs=lambda subject, data_dir, params: _perseus_input_paths(
+                subject, data_dir, params["design"]
+            ),
+            outputs=lambda subject, data_dir, params: _perseus_output_paths(
+                subject, data_dir, params["hom_degs"], params["design"]
+            ),
+            params=("hom_degs",),
+            deps=("mask",),
+        ),
+        Stage(
+            "diagrams",
+            _run_diagrams,
+            inputs=lambda subject, data_dir, params: _perseus_output_paths(
+                subject, data_dir, params["hom_degs"], params["design"]
+            ),
+            outputs=lambda subject, data_dir, params: [
+                diagram_store_path(subject, data_dir)
+            ],
+            params=("hom_degs",),
+            deps=("persistence",),
+        ),
+        Stage(
+            "landscapes",
+            _run_landscapes,
+            inputs=lambda subject, data_dir, params: [
+                diagram_store_path(subject, data_dir)
+            ],
+            outputs=lambda subject, data_dir, params: [
+                landscape_path(subject, hom_deg, data_dir)
+                for hom_deg in params["hom_degs"]
+            ],
+            params=("hom_degs", "num_steps"),
+            deps=("diagrams",),
+        ),
+    ]
@@ -0,0 +1,266 @@
+"""Record where the time of a run goes, stage by stage.
+
+The functions of the pipeline are wrapped with the `timed` decorator, and any
+block of code can be wrapped in the `stage` context manager. While profiling
+is enabled, each stage records its number of calls, wall time, the bytes read
+by the process and the memory it added to the resident set size (RSS) of the
+process, aggregated per subject. Stages called without a subject are charged
+to the subject of the enclosing stage. Profiling is disabled by default, and
+a disabled stage costs one global lookup.
+
+The records are kept per process: stages run in worker processes, such as
+those of joblib or a process pool, are not recorded in the parent. Run them
+with a single job to profile them.
+
+Example::
+
+    from src import profiling
+
+    profiling.enable()
+    landscapes = construct_landscapes("0508", 1, data_dir)
+    print(profiling.report())
+
+`enable(profile=True)` additionally runs cProfile, and
+`enable(trace_memory=True)` runs tracemalloc, over the whole run; `dump`
+writes their output to a directory.
+
+"""
+
+import contextlib
+import cProfile
+import functools
+import inspect
+import os
+import resource
+import time
+import tracemalloc
+
+import pandas as pd
+
+_enabled = False
+_profiler = None
+_records = {}
+_subject = None
+
+
+def enable(profile: bool = False, trace_memory: bool = False) -> None:
+    """
+    Start recording stages.
+
+    Parameters
+    ----------
+    profile : bool, optional
+        If True, also run cProfile until `disable` is called.
+    trace_memory : bool, optional
+        If True, also run tracemalloc until `disable` is called.
+
+    Returns
+    -------
+    None.
+
+    """
+    global _enabled, _profiler
+    _enabled = True
+    if profile and _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable() -> None:
+    """Stop recording stages, and stop cProfile. The records are kept."""
+    global _enabled
+    _enabled = False
+    if _profiler is not None:
+        _profiler.disable()
+
+
+def reset() -> None:
+    """Discard the records, the cProfile statistics and the tracemalloc traces."""
+    global _profiler
+    _records.clear()
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _bytes_read() -> int:
+    """Bytes read by this process so far, or 0 where Linux's /proc is missing."""
+    try:
+        with open("/proc/self/io", "rb") as io_file:
+            for line in io_file:
+                if line.startswith(b"rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _max_rss() -> int:
+    """
+    Maximum resident set size of this process so far, in bytes.
+
+    This is the high-water mark over the lifetime of the process, so it only
+    grows when a stage needs more memory than anything run before it.
+    """
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextlib.contextmanager
+def _recording(name: str, subject: str):
+    """Record one call of a stage while profiling is enabled."""
+    global _subject
+    outer_subject = _subject
+    if subject is not None:
+        _subject = subject
+    start_read = _bytes_read()
+    start_rss = _max_rss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        record = _records.setdefault(
+            (_subject, name),
+            {"calls": 0, "wall": 0.0, "read": 0, "rss_growth": 0, "max_rss": 0},
+        )
+        max_rss = _max_rss()
+        record["calls"] += 1
+        record["wall"] += wall
+        record["read"] += _bytes_read() - start_read
+        record["rss_growth"] = max(record["rss_growth"], max_rss - start_rss)
+        record["max_rss"] = max(record["max_rss"], max_rss)
+        _subject = outer_subject
+
+
+def stage(name: str, subject: str = None):
+    """
+    Context manager recording a block of code as a stage.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage.
+    subject : str, optional
+        The subject the stage works on. The default is the subject of the
+        enclosing stage.
+
+    Returns
+    -------
+    A context manager.
+
+    """
+    if not _enabled:
+        return contextlib.nullcontext()
+    return _recording(name, subject)
+
+
+def timed(func=None, *, name: str = None):
+    """
+    Decorate a function to be recorded as a stage.
+
+    The stage is named after the function unless `name` is given. If the
+    function has a `subject` parameter, the calls are charged to that subject.
+    """
+    if func is None:
+        return functools.partial(timed, name=name)
+    stage_name = name or func.__name__
+    parameters = list(inspect.signature(func).parameters)
+    position = parameters.index("subject") if "subject" in parameters else None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        subject = kwargs.get("subject")
+        if subject is None and position is not None and position < len(args):
+            subject = args[position]
+        with _recording(stage_name, subject):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def summary() -> pd.DataFrame:
+    """
+    Return the records as a table.
+
+    Returns
+    -------
+    A pandas.DataFrame with one row per subject and stage, and the columns
+    "subject", "stage", "calls", "wall (s)", "read (MB)", "RSS growth (MB)"
+    and "max RSS so far (MB)". The subject is None for stages outside of any
+    subject.
+
+    "RSS growth (MB)" is the largest rise of the maximum RSS of the process
+    during one call: the memory a call needed beyond the high-water mark of
+    everything run before it, and 0 if it fit below that mark. "max RSS so
+    far (MB)" is the high-water mark itself at the end of the last call, which
+    includes the memory of every earlier stage.
+
+    """
+    return pd.DataFrame(
+        [
+            {
+                "subject": subject,
+                "stage": name,
+                "calls": record["calls"],
+                "wall (s)": record["wall"],
+                "read (MB)": record["read"] / 2**20,
+                "RSS growth (MB)": record["rss_growth"] / 2**20,
+                "max RSS so far (MB)": record["max_rss"] / 2**20,
+            }
+            for (subject, name), record in _records.items()
+        ],
+        columns=[
+            "subject",
+            "stage",
+            "calls",
+            "wall (s)",
+            "read (MB)",
+            "RSS growth (MB)",
+            "max RSS so far (MB)",
+        ],
+    )
+
+
+def report(table: pd.DataFrame = None) -> str:
+    """
+    Format a summary table, by default that of the current records.
+
+    Nested stages are included in the wall time of their enclosing stage, so
+    the wall times of a subject do not add up to its total.
+    """
+    if table is None:
+        table = summary()
+    if table.empty:
+        return "No stages were recorded."
+    return (
+        table.fillna({"subject": "-"})
+        .sort_values(["subject", "wall (s)"], ascending=[True, False])
+        .set_index(["subject", "stage"])
+        .round(3)
+        .to_string()
+    )
+
+
+def dump(output_dir: str) -> None:
+    """
+    Write the summary, and the cProfile and tracemalloc output if enabled.
+
+    The files are 'stages.csv', 'profile.prof' (readable with pstats or
+    snakeviz) and 'tracemalloc.txt' (the 50 lines allocating the most memory).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary().to_csv(os.path.join(output_dir, "stages.csv"), index=False)
+    if _profiler is not None:
+        _profiler.dump_stats(os.path.join(output_dir, "profile.prof"))
+    if tracemalloc.is_tracing():
+        statistics = tracemalloc.take_snapshot().statistics("lineno")
+        with open(os.path.join(output_dir, "tracemalloc.txt"), "w") as trace_file:
+            for statistic in statistics[:50]:
+                trace_file.write(f"{statistic}\n")
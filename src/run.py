@@ -0,0 +1,285 @@
+"""Run the landscape SVMs and permutation tests over a cohort from the command line.
+
+Each subject is an independent job on a process pool. The results of a
+subject are written to their own CSV file in the output directory as soon as
+the subject finishes, so an interrupted run loses only the subjects in
+progress, and rerunning the same command skips the subjects already done.
+
+Example::
+
+    python -m src.run --data-dir /path/to/data --subjects 0295 0394 \
+        --hom-degs 0 1 --pairings "Rest vs Beat" "All Three" --output-dir results
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from src import profiling
+from src.design import get_design, resolve_design
+from src.landscapes import LandscapeCache
+from src.permutation_test import permutation_test_vectorized
+from src.profiling import timed
+from src.svm import landscape_svm
+
+
+@timed
+def run_subject(
+    subject: str,
+    hom_degs: list,
+    pairings: list,
+    data_dir: str,
+    cache_dir: str = None,
+    num_steps: int = 1800,
+    folds: int = 10,
+    num_perms: int = 1500,
+    seed: int = 42,
+    design=None,
+) -> pd.DataFrame:
+    """
+    Run the SVMs and permutation tests of one subject.
+
+    The SVM of a pairing is trained on the landscapes of all of `hom_degs`
+    together, as in `main.py`. The permutation test is run in each degree
+    separately, for the pairings of exactly two labels.
+
+    Parameters
+    ----------
+    subject : str
+        The subject number to be analyzed.
+    hom_degs : list
+        The homological degrees.
+    pairings : list
+        Names of entries of the pairings of the design.
+    data_dir : str
+        The path to the data directory.
+    cache_dir : str, optional
+        Directory of the on-disk landscape cache.
+    num_steps : int, optional
+        Number of grid points of the landscapes.
+    folds : int, optional
+        Number of cross-validation folds of the SVMs.
+    num_perms : int, optional
+        Number of shuffles in each permutation test. 0 skips the tests.
+    seed : int, optional
+        Seed of the permutation tests.
+    design : ExperimentDesign | str | dict, optional
+        The design of the acquisition, or a dict of designs keyed by subject,
+        as read by `get_design`. The default is `DEFAULT_DESIGN`.
+
+    Returns
+    -------
+    A pandas.DataFrame with the columns "subject", "test", "pairing",
+    "hom_deg" and "value", where "value" is the mean SVM accuracy or the
+    permutation test p-value.
+
+    """
+    design = get_design(design, subject)
+    cache = LandscapeCache(cache_dir=cache_dir)
+    features = cache.feature_matrix(
+        subject, hom_degs, data_dir, num_steps=num_steps, design=design
+    )
+    label_index = design.tile(len(hom_degs))
+    rows = []
+    for pairing in pairings:
+        scores = landscape_svm(
+            landscapes=features,
+            labels=design.pairings[pairing],
+            target_labels=label_index,
+            folds=folds,
+        )
+        rows.append(
+            {
+                "subject": subject,
+                "test": "svm",
+                "pairing": pairing,
+                "hom_deg": "+".join(str(hom_deg) for hom_deg in hom_degs),
+                "value": scores.mean(),
+            }
+        )
+    if num_perms:
+        for hom_deg in hom_degs:
+            landscapes = cache.landscapes(
+                subject, hom_deg, data_dir, num_steps=num_steps, design=design
+            )
+            for pairing in pairings:
+                if len(design.pairings[pairing]) != 2:
+                    continue
+                p_val = permutation_test_vectorized(
+                    landscapes,
+                    design.pairings[pairing],
+                    num_perms=num_perms,
+                    seed=seed,
+                    design=design,
+                )
+                rows.append(
+                    {
+                        "subject": subject,
+                        "test": "permutation",
+                        "pairing": pairing,
+                        "hom_deg": str(hom_deg),
+                        "value": p_val,
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def _result_path(output_dir: str, subject: str) -> str:
+    """Path of the result file of a subject."""
+    return os.path.join(output_dir, "subject_" + subject + ".csv")
+
+
+def _run_and_save(
+    subject: str, output_dir: str, profile_dir: str = None, **kwargs
+) -> str:
+    """Run a subject in a worker process and write its results atomically."""
+    if profile_dir is not None:
+        profiling.reset()
+        profiling.enable(profile=True)
+    results = run_subject(subject, **kwargs)
+    if profile_dir is not None:
+        profiling.disable()
+        profiling.dump(os.path.join(profile_dir, "subject_" + subject))
+    path = _result_path(output_dir, subject)
+    results.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def run_cohort(
+    subjects: list,
+    output_dir: str,
+    n_jobs: int = None,
+    overwrite: bool = False,
+    profile_dir: str = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Run `run_subject` for every subject on a process pool.
+
+    Parameters
+    ----------
+    subjects : list
+        The subject numbers to be analyzed.
+    output_dir : str
+        Directory of the per-subject result files and of the combined
+        'results.csv'.
+    n_jobs : int, optional
+        Number of worker processes. The default is the number of CPUs.
+    overwrite : bool, optional
+        If True, rerun subjects which already have a result file.
+    profile_dir : str, optional
+        If given, profile each subject and write the stage timings and the
+        cProfile statistics of the subject to a subdirectory of `profile_dir`,
+        and log a summary of all subjects run at the end.
+    **kwargs
+        Further keyword arguments of `run_subject`. A dict of designs keyed
+        by subject as `design` runs sessions of different designs on the same
+        pool.
+
+    Returns
+    -------
+    The combined results of all subjects.
+
+    """
+    logger = logging.getLogger(__name__)
+    os.makedirs(output_dir, exist_ok=True)
+    if "design" in kwargs:
+        kwargs["design"] = resolve_design(kwargs["design"])
+    pending = [
+        subject
+        for subject in subjects
+        if overwrite or not os.path.exists(_result_path(output_dir, subject))
+    ]
+    for subject in set(subjects) - set(pending):
+        logger.info(f"Subject {subject} is done already, skipping")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {
+                executor.submit(
+                    _run_and_save, subject, output_dir, profile_dir, **kwargs
+                ): subject
+                for subject in pending
+            }
+            for future in as_completed(futures):
+                logger.info(f"Subject {futures[future]} written to {future.result()}")
+        if profile_dir is not None:
+            stages = pd.concat(
+                [
+                    pd.read_csv(
+                        os.path.join(profile_dir, "subject_" + subject, "stages.csv"),
+                        dtype={"subject": str},
+                    )
+                    for subject in pending
+                ],
+                ignore_index=True,
+            )
+            logger.info("Stage timings:\n" + profiling.report(stages))
+
+    results = pd.concat(
+        [
+            pd.read_csv(
+                _result_path(output_dir, subject),
+                dtype={"subject": str, "hom_deg": str},
+            )
+            for subject in subjects
+        ],
+        ignore_index=True,
+    )
+    results.to_csv(os.path.join(output_dir, "results.csv"), index=False)
+    return results
+
+
+def main(argv: list = None) -> None:
+    """Parse the command line and run the cohort."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--data-dir", required=True, help="The data directory.")
+    parser.add_argument("--subjects", nargs="+", required=True)
+    parser.add_argument("--hom-degs", nargs="+", type=int, default=[0, 1])
+    parser.add_argument("--design", help="JSON or TOML file of the experiment design.")
+    parser.add_argument(
+        "--pairings", nargs="+", help="The default is every pairing of the design."
+    )
+    parser.add_argument("--output-dir", default="results")
+    parser.add_argument("--cache-dir", help="Directory of the landscape cache.")
+    parser.add_argument("--num-steps", type=int, default=1800)
+    parser.add_argument("--folds", type=int, default=10)
+    parser.add_argument("--num-perms", type=int, default=1500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--n-jobs", type=int)
+    parser.add_argument("--overwrite", action="store_true")
+    parser.add_argument(
+        "--profile-dir", help="Profile each subject and write the output here."
+    )
+    args = parser.parse_args(argv)
+    design = get_design(args.design)
+    pairings = args.pairings or list(design.pairings)
+    unknown = [pairing for pairing in pairings if pairing not in design.pairings]
+    if unknown:
+        parser.error(f"pairings {unknown} are not in the design {design.name!r}")
+
+    logging.basicConfig(level=logging.INFO)
+    run_cohort(
+        subjects=args.subjects,
+        output_dir=args.output_dir,
+        n_jobs=args.n_jobs,
+        overwrite=args.overwrite,
+        profile_dir=args.profile_dir,
+        hom_degs=args.hom_degs,
+        pairings=pairings,
+        data_dir=args.data_dir,
+        cache_dir=args.cache_dir,
+        num_steps=args.num_steps,
+        folds=args.folds,
+        num_perms=args.num_perms,
+        seed=args.seed,
+        design=design,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Expose the bundled sample data in the layout of the original data share.
+
+The repository bundles the perseus input and output files of subject 0508
+under 'data/preprocessed' and 'data/postprocessed'. Functions such as
+`construct_vector` and `perseus_to_sktda` read them from
+data_dir/patient<subject>/pers_input and pers_output instead, so the tests
+and the benchmarks link the bundled directories into that layout.
+
+"""
+
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+SAMPLE_SUBJECT = "0508"
+
+
+def link_subject_data(
+    data_dir: str, subject: str, pers_input: str = None, pers_output: str = None
+) -> None:
+    """
+    Expose perseus inputs and outputs in the layout of the original data share.
+
+    Parameters
+    ----------
+    data_dir : str
+        The data directory to link the files into.
+    subject : str
+        The subject number.
+    pers_input, pers_output : str, optional
+        The directories of the perseus input and output files, linked to
+        data_dir/patient<subject>/pers_input and pers_output.
+
+    Returns
+    -------
+    None.
+
+    """
+    patient_dir = os.path.join(data_dir, "patient" + subject)
+    os.makedirs(patient_dir, exist_ok=True)
+    for name, source in [("pers_input", pers_input), ("pers_output", pers_output)]:
+        if source is not None:
+            os.symlink(os.path.abspath(source), os.path.join(patient_dir, name))
+
+
+def link_sample_data(data_dir: str) -> None:
+    """Expose the bundled perseus inputs and outputs of the sample subject."""
+    link_subject_data(
+        data_dir,
+        SAMPLE_SUBJECT,
+        pers_input=os.path.join(DATA_DIR, "preprocessed", SAMPLE_SUBJECT),
+        pers_output=os.path.join(DATA_DIR, "postprocessed", SAMPLE_SUBJECT),
+    )
@@ -1,11 +1,17 @@
 """Construct the SVM."""
-from sklearn.model_selection import cross_val_score
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from joblib import Parallel, delayed
+from sklearn.model_selection import cross_validate
 from sklearn.pipeline import Pipeline
 from sklearn.svm import LinearSVC
 
-from .landscapes import pad_flatten_landscape_values, select_from_list
+from .landscapes import LabelIndex, landscape_matrix
+from .profiling import timed
 
 
+@timed
 def landscape_svm(
     landscapes: list,
     labels: list,
@@ -15,21 +21,30 @@ def landscape_svm(
     loss: str = "squared_hinge",
     scoring: str = "accuracy",
     folds: int = 10,
+    max_depth: int = None,
+    downsample: int = 1,
+    sparse: bool = False,
+    n_jobs: int = None,
+    return_cv_results: bool = False,
 ):
     """
     Construct an SVM pipeline with standard scaling.
 
     Parameters
     ----------
-    landscapes : list
-        List of landscapes.
+    landscapes : list | np.ndarray | scipy.sparse.csr_matrix
+        List of landscapes, or the rows of a precomputed `landscape_matrix`,
+        dense or sparse, such as `LandscapeCache.feature_matrix`, in which case
+        the landscapes are not snapped and padded again.
 
     labels: list
-        List of two strings chosen from "rest", "beat", or "random" to use in
-        performing the permutation test.
+        List of strings chosen from "rest", "beat", or "random" to use in
+        performing the permutation test. Any number of labels may be given.
 
-    target_labels: list
-        List of target labels for the classifier. Must be same length as landscapes.
+    target_labels: list | LabelIndex
+        List of target labels for the classifier, or its `LabelIndex`, such as
+        an `ExperimentDesign`, which is not encoded again. Must be same length
+        as landscapes.
 
     C: int
         Hyperparameter for the linear SVM.
@@ -43,24 +58,54 @@ def landscape_svm(
     folds: int
         Number of folds for cross-validation
 
+    max_depth: int, optional
+        Keep at most this many landscape functions of each landscape.
+
+    downsample: int, optional
+        Keep every `downsample`-th point of the landscape grid.
+
+    sparse: bool, optional
+        If True, train on a sparse feature matrix, which saves memory and
+        time since most landscape values are zero.
+
+        These three options are passed to `landscape_matrix`, so they only
+        apply when `landscapes` is a list of landscapes. A ValueError is
+        raised if they are set for a precomputed matrix, which should be
+        built with them instead.
+
+    n_jobs: int, optional
+        Number of folds fitted in parallel. The default is one at a time.
+
+    return_cv_results: bool, optional
+        If True, return the whole `sklearn.model_selection.cross_validate`
+        dictionary, with the fold scores, fit and score times, and the fitted
+        model of each fold. The default returns the fold scores only.
+
     Returns
     -------
-    A sklearn-style pipeline.
+    The cross-validation scores of each fold, or the cross-validation results.
 
     """
     if seed == 0:
         seed = None
-    plA = select_from_list(landscapes, target_labels, labels[0])
-    plB = select_from_list(landscapes, target_labels, labels[1])
-    if len(labels) == 3:
-        plC = select_from_list(landscapes, target_labels, labels[2])
-        labels_ = (
-            [labels[0]] * len(plA) + [labels[1]] * len(plB) + [labels[2]] * len(plC)
-        )
-        pls = pad_flatten_landscape_values(plA + plB + plC)
+    label_index = _label_index(target_labels)
+    if isinstance(landscapes, np.ndarray) or scipy.sparse.issparse(landscapes):
+        if max_depth is not None or downsample != 1 or sparse:
+            raise ValueError(
+                "max_depth, downsample and sparse do not apply to a feature matrix"
+            )
+        pls, labels_ = label_index.select(landscapes, labels)
     else:
-        labels_ = [labels[0]] * len(plA) + [labels[1]] * len(plB)
-        pls = pad_flatten_landscape_values(plA + plB)
+        if len(landscapes) != len(label_index):
+            raise ValueError("landscapes and target_labels must be the same length")
+        rows = label_index.rows(labels)
+        pls = landscape_matrix(
+            [landscapes[idx] for idx in rows],
+            max_depth=max_depth,
+            downsample=downsample,
+            sparse=sparse,
+        )
+        labels_ = label_index.classes[label_index.codes[rows]]
 
     svm_clf = Pipeline(
         [
@@ -68,11 +113,12 @@ def landscape_svm(
             ("Linear SVC", LinearSVC(C=C, loss=loss, random_state=seed, dual=False)),
         ]
     )
-    svm_clf.fit(pls, labels_)
-    score = cross_val_score(svm_clf, pls, labels_, scoring=scoring, cv=folds)
-    return score
+    return _cross_validate(
+        svm_clf, pls, labels_, scoring, folds, n_jobs, return_cv_results
+    )
 
 
+@timed
 def nontda_svm(
     list_of_vectors: list,
     labels: list,
@@ -82,6 +128,8 @@ def nontda_svm(
     loss: str = "squared_hinge",
     scoring: str = "accuracy",
     folds: int = 10,
+    n_jobs: int = None,
+    return_cv_results: bool = False,
 ):
     """
     Construct an SVM for non-TDA processed data.
@@ -92,8 +140,9 @@ def nontda_svm(
         DESCRIPTION.
     labels : list
         DESCRIPTION.
-    target_labels : list
-        DESCRIPTION.
+    target_labels : list | LabelIndex
+        List of target labels, or its `LabelIndex`, such as an
+        `ExperimentDesign`, which is not encoded again.
     seed : int, optional
         DESCRIPTION. The default is 0.
     C : int, optional
@@ -104,28 +153,26 @@ def nontda_svm(
         DESCRIPTION. The default is "accuracy".
     folds : int, optional
         DESCRIPTION. The default is 10.
+    n_jobs : int, optional
+        Number of folds fitted in parallel. The default is one at a time.
+    return_cv_results : bool, optional
+        If True, return the whole `sklearn.model_selection.cross_validate`
+        dictionary, with the fold scores, fit and score times, and the fitted
+        model of each fold. The default returns the fold scores only.
 
     Returns
     -------
-    raw_score : TYPE
-        DESCRIPTION.
+    raw_score : np.ndarray | dict
+        The cross-validation scores of each fold, or the cross-validation
+        results.
 
     """
     if seed == 0:
         seed = None
 
-    vectors_a = select_from_list(list_of_vectors, target_labels, labels[0])
-    vectors_b = select_from_list(list_of_vectors, target_labels, labels[1])
-
-    if len(labels) == 3:
-        vectors_c = select_from_list(list_of_vectors, target_labels, labels[2])
-        labels_abc = (
-            [labels[0]] * len(vectors_a)
-            + [labels[1]] * len(vectors_b)
-            + [labels[2]] * len(vectors_c)
-        )
-    else:
-        labels_ab = [labels[0]] * len(vectors_a) + [labels[1]] * len(vectors_b)
+    vectors, labels_ = _label_index(target_labels).select(
+        np.asarray(list_of_vectors), labels
+    )
 
     svm_raw_clf = Pipeline(
         [
@@ -133,19 +180,106 @@ def nontda_svm(
             ("Linear SVC", LinearSVC(C=C, loss=loss, random_state=seed, dual=False)),
         ]
     )
-    if len(labels) == 2:
-        svm_raw_clf.fit(vectors_a + vectors_b, labels_ab)
-        raw_score = cross_val_score(
-            svm_raw_clf, vectors_a + vectors_b, labels_ab, scoring=scoring, cv=folds
-        )
-        return raw_score
-    elif len(labels) == 3:
-        svm_raw_clf.fit(vectors_a + vectors_b + vectors_c, labels_abc)
-        raw_score = cross_val_score(
-            svm_raw_clf,
-            vectors_a + vectors_b + vectors_c,
-            labels_abc,
-            scoring=scoring,
-            cv=folds,
-        )
-        return raw_score
+    return _cross_validate(
+        svm_raw_clf, vectors, labels_, scoring, folds, n_jobs, return_cv_results
+    )
+
+
+def _cross_validate(
+    clf: Pipeline,
+    X: np.ndarray,
+    y: np.ndarray,
+    scoring: str,
+    folds: int,
+    n_jobs: int,
+    return_cv_results: bool,
+):
+    """
+    Cross-validate `clf`, fitting it exactly once per fold.
+
+    The classifier is never fitted on the whole data set, since every fold
+    fits its own copy anyway.
+    """
+    cv_results = cross_validate(
+        clf,
+        X,
+        y,
+        scoring=scoring,
+        cv=folds,
+        n_jobs=n_jobs,
+        return_estimator=return_cv_results,
+    )
+    if return_cv_results:
+        return cv_results
+    return cv_results["test_score"]
+
+
+def _label_index(target_labels) -> LabelIndex:
+    """Encode `target_labels` unless it is a `LabelIndex` already."""
+    if isinstance(target_labels, LabelIndex):
+        return target_labels
+    return LabelIndex(target_labels)
+
+
+@timed
+def evaluate_pairings(
+    features: dict,
+    pairings: dict,
+    target_labels: list,
+    svm=landscape_svm,
+    n_jobs: int = None,
+    **svm_kwargs,
+) -> pd.DataFrame:
+    """
+    Evaluate an SVM on every label pairing of every subject.
+
+    Each subject's feature matrix is built once by the caller and shared by
+    all of its pairings, and the (subject, pairing) comparisons are spread
+    over a single joblib pool.
+
+    Parameters
+    ----------
+    features : dict
+        Feature matrix of each subject, keyed by subject number, e.g. from
+        `LandscapeCache.feature_matrix` or `construct_vector`.
+    pairings : dict
+        Lists of labels to be compared, keyed by the name of the comparison,
+        e.g. `label_pairings`.
+    target_labels : list | LabelIndex
+        Labels of the rows of every feature matrix, encoded once for all
+        comparisons unless it is a `LabelIndex` already.
+    svm : callable, optional
+        `landscape_svm` (the default) or `nontda_svm`.
+    n_jobs : int, optional
+        Number of comparisons evaluated in parallel.
+    **svm_kwargs
+        Further keyword arguments of `svm`.
+
+    Returns
+    -------
+    A pandas.DataFrame with one row per subject, pairing and fold, and the
+    columns "subject", "pairing", "fold" and "score". The heatmap of mean
+    scores is
+
+        >>> scores.pivot_table(
+        ...     index="subject", columns="pairing", values="score", sort=False
+        ... )
+
+    """
+    label_index = _label_index(target_labels)
+    comparisons = [
+        (subject, name, labels)
+        for subject in features
+        for name, labels in pairings.items()
+    ]
+    all_scores = Parallel(n_jobs=n_jobs)(
+        delayed(svm)(features[subject], labels, label_index, **svm_kwargs)
+        for subject, _, labels in comparisons
+    )
+    return pd.DataFrame(
+        [
+            {"subject": subject, "pairing": name, "fold": fold, "score": score}
+            for (subject, name, _), scores in zip(comparisons, all_scores)
+            for fold, score in enumerate(scores)
+        ]
+    )
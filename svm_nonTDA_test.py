@@ -1,11 +1,10 @@
 import logging
 
-import pandas as pd
 import seaborn as sns
 
-from src import target_labels
+from src import label_pairings, target_labels
 from src.make_dataset import construct_vector
-from src.svm import nontda_svm
+from src.svm import evaluate_pairings, nontda_svm
 
 logging.basicConfig(level=logging.INFO)
 
@@ -87,53 +86,22 @@ SVM_TEST_LABELS = ["rest", "beat", "random"]
 #     )
 
 
-def svm_raw_list(subject: str, data_dir: str):
-    logging.info(f"Running on svm_raw_list on {subject}")
-    return_list = []
-    logging.info("Running construct_vector")
-    vectors = construct_vector(subject=subject, data_dir=data_dir)
-    return_list.append(
-        nontda_svm(
-            list_of_vectors=vectors,
-            labels=["rest", "beat"],
-            target_labels=target_labels,
-        ).mean()
-    )
-    logging.info("Completed rest vs beat")
-    return_list.append(
-        nontda_svm(
-            list_of_vectors=vectors,
-            labels=["random", "beat"],
-            target_labels=target_labels,
-        ).mean()
-    )
-    logging.info("Completed random vs beat")
-    return_list.append(
-        nontda_svm(
-            list_of_vectors=vectors,
-            labels=["rest", "random"],
-            target_labels=target_labels,
-        ).mean()
-    )
-    logging.info("Completed rest vs random")
-    return_list.append(
-        nontda_svm(
-            list_of_vectors=vectors,
-            labels=["rest", "random", "beat"],
-            target_labels=target_labels,
-        ).mean()
-    )
-    logging.info("Completed all three")
-    return return_list
-
-
 def svm_raw_pd_test(subject_list: str, data_dir: str):
-    svm_raw_pd = pd.DataFrame(
-        columns=["Rest vs Beat", "Random vs Beat", "Rest vs Random", "All Three"]
-    )
+    features = {}
     for subject in subject_list:
-        svm_raw_pd.loc[subject] = svm_raw_list(subject, data_dir=data_dir)
-    return svm_raw_pd
+        logging.info(f"Running construct_vector on {subject}")
+        features[subject] = construct_vector(subject=subject, data_dir=data_dir)
+    logging.info("Running the SVM comparisons")
+    scores = evaluate_pairings(
+        features=features,
+        pairings=label_pairings,
+        target_labels=target_labels,
+        svm=nontda_svm,
+        n_jobs=-1,
+    )
+    return scores.pivot_table(
+        index="subject", columns="pairing", values="score", sort=False
+    )
 
 
 avg_accur = svm_raw_pd_test(subject_list=SUBJECT_LIST, data_dir=DATA_DIR)
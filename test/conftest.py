@@ -0,0 +1,11 @@
+import pytest
+
+from src.sample_data import link_sample_data
+
+
+@pytest.fixture
+def sample_data_dir(tmp_path):
+    """A temporary data directory exposing the bundled sample subject."""
+    data_dir = str(tmp_path)
+    link_sample_data(data_dir)
+    return data_dir
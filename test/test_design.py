@@ -0,0 +1,133 @@
+import json
+
+import numpy as np
+import pytest
+
+from src import label_pairings, target_labels
+from src.design import DEFAULT_DESIGN, ExperimentDesign, get_design, resolve_design
+from src.landscapes import (
+    accumulate_landscapes,
+    construct_landscapes,
+    landscape_matrix,
+)
+from src.permutation_test import group_permutation_test, permutation_test_vectorized
+from src.pipeline import Pipeline
+
+
+class TestDesign:
+    def test_default_design(self):
+        assert DEFAULT_DESIGN.labels == target_labels
+        assert DEFAULT_DESIGN.total_time == len(target_labels)
+        assert DEFAULT_DESIGN.pairings == label_pairings
+        assert get_design() is DEFAULT_DESIGN
+
+        # The blocks tile the time slices, alternating labels.
+        starts, stops = DEFAULT_DESIGN.block_starts, DEFAULT_DESIGN.block_stops
+        assert starts[0] == 0 and stops[-1] == len(target_labels)
+        np.testing.assert_array_equal(starts[1:], stops[:-1])
+        assert np.all(np.diff(DEFAULT_DESIGN.block_codes) != 0)
+        for start, stop in DEFAULT_DESIGN.blocks("beat"):
+            assert set(target_labels[start:stop]) == {"beat"}
+        np.testing.assert_array_equal(
+            DEFAULT_DESIGN.rows(["beat"]),
+            [idx for idx, label in enumerate(target_labels) if label == "beat"],
+        )
+
+    def test_files(self, tmp_path):
+        path = str(tmp_path / "default.json")
+        DEFAULT_DESIGN.save(path)
+        assert ExperimentDesign.load(path) == DEFAULT_DESIGN
+        assert get_design(path) == DEFAULT_DESIGN
+
+        toml_path = tmp_path / "short.toml"
+        toml_path.write_text(
+            'name = "short"\n'
+            'blocks = [["rest", 2], ["beat", 3], ["rest", 1]]\n'
+            "\n[pairings]\n"
+            '"Rest vs Beat" = ["rest", "beat"]\n'
+        )
+        design = ExperimentDesign.load(str(toml_path))
+        assert design.name == "short"
+        assert design.labels == ["rest"] * 2 + ["beat"] * 3 + ["rest"]
+        assert design.blocks("rest") == [(0, 2), (5, 6)]
+        assert design.pairings == {"Rest vs Beat": ["rest", "beat"]}
+
+        json_path = tmp_path / "labels.json"
+        json_path.write_text(json.dumps({"labels": design.labels}))
+        assert ExperimentDesign.load(str(json_path)).labels == design.labels
+        with pytest.raises(ValueError):
+            ExperimentDesign.from_dict({"name": "empty"})
+
+        designs = {"0508": design}
+        assert get_design(designs, "0508") is design
+        with pytest.raises(KeyError):
+            get_design(designs, "0295")
+
+        # Design files are read once by resolve_design.
+        resolved = resolve_design({"0508": str(toml_path), "0295": None})
+        assert resolved["0508"] == design
+        assert resolved["0295"] is DEFAULT_DESIGN
+        assert resolve_design(str(json_path)).labels == design.labels
+        pipeline = Pipeline([], str(tmp_path), design={"0508": str(toml_path)})
+        assert pipeline.params["design"] == {"0508": design}
+
+    def test_design_of_other_length(self, sample_data_dir):
+        data_dir = sample_data_dir
+        short = ExperimentDesign(target_labels[:40], label_pairings, name="short")
+
+        landscapes = construct_landscapes("0508", 1, data_dir, design=short)
+        assert len(landscapes) == 40
+        p_val = permutation_test_vectorized(
+            landscapes, ["rest", "beat"], num_perms=50, design=short
+        )
+        assert 0 <= p_val <= 1
+        with pytest.raises(ValueError):
+            permutation_test_vectorized(landscapes, ["rest", "beat"], num_perms=50)
+
+        accumulator = accumulate_landscapes(
+            "0508", 1, data_dir, num_steps=100, design={"0508": short}
+        )
+        assert accumulator.counts == {
+            label: target_labels[:40].count(label) for label in set(target_labels[:40])
+        }
+
+        # A cohort of sessions of different lengths, with a design per subject.
+        full = construct_landscapes("0508", 1, data_dir)
+        designs = {"long": DEFAULT_DESIGN, "short": short}
+        results = group_permutation_test(
+            {"long": {1: full}, "short": {1: landscapes}},
+            ["rest", "beat"],
+            num_perms=50,
+            design=designs,
+        )
+        assert list(results["subject"]) == ["all", "long", "short"]
+        assert results["p_value"].between(0, 1).all()
+        # The statistics are those of the padded groups, on the shared grid.
+        long_rows = DEFAULT_DESIGN.rows(["rest", "beat"])
+        short_rows = short.rows(["rest", "beat"])
+        features = landscape_matrix(
+            [full[idx] for idx in long_rows] + [landscapes[idx] for idx in short_rows]
+        )
+        diffs = [
+            group[:num_rest].mean(axis=0) - group[num_rest:].mean(axis=0)
+            for group, num_rest in [
+                (features[: len(long_rows)], len(DEFAULT_DESIGN.rows(["rest"]))),
+                (features[len(long_rows) :], len(short.rows(["rest"]))),
+            ]
+        ]
+        np.testing.assert_allclose(
+            results["statistic"],
+            [np.abs(sum(diffs) / 2).max()] + [np.abs(diff).max() for diff in diffs],
+        )
+        pooled = group_permutation_test(
+            {"long": {1: full}, "short": {1: landscapes}},
+            ["rest", "beat"],
+            num_perms=50,
+            stratified=False,
+            design=designs,
+        )
+        assert 0 <= pooled["p_value"].iloc[0] <= 1
+        with pytest.raises(KeyError):
+            group_permutation_test(
+                {"other": {1: landscapes}}, ["rest", "beat"], design=designs
+            )
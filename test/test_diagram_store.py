@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+from src import total_time
+from src.diagram_store import DiagramStore, convert_perseus_outputs, read_perseus_output
+from src.landscapes import perseus_to_sktda
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+class TestDiagramStore:
+    def test_read_perseus_output(self, tmp_path):
+        path = os.path.join(tmp_path, "output.txt")
+        with open(path, "w") as pd_file:
+            pd_file.write("1 3\n2 -1\n")
+        np.testing.assert_array_equal(
+            read_perseus_output(path), np.array([[1, 3], [2, np.inf]])
+        )
+        with open(path, "w") as pd_file:
+            pd_file.write("")
+        assert read_perseus_output(path).shape == (0, 2)
+
+    def test_convert_and_load(self, tmp_path, sample_data_dir):
+        store_path = convert_perseus_outputs(
+            subject="0508",
+            hom_degs=[0, 1, 2],
+            data_dir=DATA_DIR,
+            store_path=os.path.join(tmp_path, "0508.h5"),
+        )
+        store = DiagramStore(store_path)
+        assert store.hom_degs == [0, 1, 2]
+        assert len(store.diagrams(1)) == total_time
+
+        # sample_data_dir has the layout of the original data share, read by
+        # perseus_to_sktda.
+        for hom_deg in [0, 1, 2]:
+            for time in [0, 57, total_time - 1]:
+                np.testing.assert_array_equal(
+                    store.sktda(hom_deg, time)[hom_deg],
+                    perseus_to_sktda(
+                        subject="0508",
+                        hom_deg=hom_deg,
+                        time=time,
+                        data_dir=sample_data_dir,
+                    )[hom_deg],
+                )
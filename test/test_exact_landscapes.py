@@ -0,0 +1,148 @@
+import numpy as np
+import pytest
+from persim import PersLandscapeApprox
+
+from src import exact_landscapes, target_labels
+from src.exact_landscapes import (
+    ExactLandscape,
+    average,
+    breakpoint_matrix,
+    construct_exact_landscapes,
+    grid_matrix,
+)
+from src.landscapes import LabelIndex, construct_landscapes, landscape_matrix
+from src.permutation_test import permutation_statistics, permutation_test_vectorized
+
+
+def brute_force(diagram, grid):
+    """Evaluate and sort the tents of a diagram on a grid."""
+    births, deaths = np.asarray(diagram, dtype=float).T
+    tents = np.maximum(np.minimum(grid - births[:, None], deaths[:, None] - grid), 0)
+    return -np.sort(-tents, axis=0)
+
+
+def random_diagram(rng, size=30):
+    births = rng.integers(0, 50, size=size)
+    return np.column_stack((births, births + rng.integers(1, 30, size=size)))
+
+
+class TestExactLandscapes:
+    def test_from_diagram(self, monkeypatch):
+        rng = np.random.default_rng(0)
+        diagram = random_diagram(rng)
+        landscape = ExactLandscape.from_diagram(
+            np.vstack((diagram, [[3, np.inf]])), hom_deg=1
+        )
+        grid = np.linspace(-1, 81, 8201)
+        expected = brute_force(diagram, grid)
+        assert landscape.depth == np.max(np.count_nonzero(expected, axis=0))
+        np.testing.assert_allclose(
+            landscape.sample(grid), expected[: landscape.depth], atol=1e-12
+        )
+        assert landscape.hom_deg == 1
+
+        # Breakpoints are only kept where the slope changes.
+        for k in range(landscape.depth):
+            x, y = landscape.layer(k)
+            slopes = np.diff(y) / np.diff(x)
+            assert np.all(np.diff(slopes) != 0)
+            assert y[0] == 0 and y[-1] == 0
+
+        # Chunks of a few candidates give the same landscape.
+        monkeypatch.setattr(exact_landscapes, "_CHUNK_SIZE", 3 * len(diagram))
+        chunked = ExactLandscape.from_diagram(diagram, hom_deg=1)
+        np.testing.assert_array_equal(chunked.breakpoints, landscape.breakpoints)
+        np.testing.assert_array_equal(chunked.values, landscape.values)
+        np.testing.assert_array_equal(chunked.offsets, landscape.offsets)
+
+        empty = ExactLandscape.from_diagram(np.array([[0, np.inf]]))
+        assert empty.depth == 0 and empty.sup_norm() == 0
+
+    def test_arithmetic(self):
+        rng = np.random.default_rng(1)
+        diagrams = [random_diagram(rng, size) for size in [5, 20, 40]]
+        landscapes = construct_exact_landscapes(diagrams)
+        grid = np.linspace(-1, 81, 16401)
+        sampled = [brute_force(diagram, grid) for diagram in diagrams]
+        depth = max(len(values) for values in sampled)
+        padded = np.zeros((len(diagrams), depth, len(grid)))
+        for idx, values in enumerate(sampled):
+            padded[idx, : len(values)] = values
+
+        mean = average(landscapes)
+        np.testing.assert_allclose(
+            mean.sample(grid), padded.mean(axis=0)[: mean.depth], atol=1e-12
+        )
+        difference = landscapes[1] - 2 * landscapes[2]
+        # The grid contains every breakpoint, which are all multiples of 1/2.
+        assert difference.sup_norm() == np.abs(padded[1] - 2 * padded[2]).max()
+
+    def test_matrices(self):
+        rng = np.random.default_rng(2)
+        landscapes = construct_exact_landscapes(
+            [random_diagram(rng, size) for size in [5, 20, 40, 10]]
+        )
+        features = breakpoint_matrix(landscapes)
+        a_mask = np.array([[True, False, True, False]])
+        expected = (
+            average([landscapes[0], landscapes[2]])
+            - average([landscapes[1], landscapes[3]])
+        ).sup_norm()
+        np.testing.assert_allclose(
+            permutation_statistics(features, a_mask), [expected], rtol=1e-12
+        )
+
+        matrix = grid_matrix(landscapes, num_steps=50)
+        assert matrix.shape == (4, max(pl.depth for pl in landscapes) * 50)
+        np.testing.assert_array_equal(
+            landscape_matrix(landscapes)[:, :1800], grid_matrix(landscapes)[:, :1800]
+        )
+        sparse = grid_matrix(landscapes, num_steps=50, max_depth=2, sparse=True)
+        assert sparse.format == "csr"
+        np.testing.assert_array_equal(sparse.toarray(), matrix[:, :100])
+        assert landscape_matrix(landscapes, sparse=True, max_depth=2).shape == (4, 3600)
+        np.testing.assert_array_equal(
+            landscape_matrix(landscapes, num_steps=50, sparse=True).toarray(), matrix
+        )
+        with pytest.raises(ValueError):
+            landscape_matrix(
+                [
+                    PersLandscapeApprox(
+                        start=0, stop=1, num_steps=2, values=np.zeros((1, 2))
+                    )
+                ],
+                num_steps=50,
+            )
+
+    def test_exact_permutation_test(self, sample_data_dir):
+        data_dir = sample_data_dir
+        landscapes = construct_landscapes("0508", 1, data_dir, exact=True)
+        with pytest.raises(ValueError):
+            construct_landscapes("0508", 1, data_dir, num_steps=100, exact=True)
+        assert all(isinstance(pl, ExactLandscape) for pl in landscapes)
+
+        label_index = LabelIndex(target_labels)
+        selected = [landscapes[idx] for idx in label_index.rows(["rest", "beat"])]
+        num_rest = len(label_index.rows(["rest"]))
+        rng = np.random.default_rng(3)
+        permutations = np.array(
+            [rng.permutation(len(selected))[: len(selected) // 2] for _ in range(5)]
+        )
+
+        def statistic(a_indices):
+            b_indices = np.setdiff1d(np.arange(len(selected)), a_indices)
+            return (
+                average([selected[idx] for idx in a_indices])
+                - average([selected[idx] for idx in b_indices])
+            ).sup_norm()
+
+        significance = statistic(np.arange(num_rest))
+        expected = np.mean(
+            [statistic(a_indices) >= significance for a_indices in permutations]
+        )
+        assert (
+            permutation_test_vectorized(
+                landscapes, ["rest", "beat"], permutations=permutations
+            )
+            == expected
+        )
@@ -1,8 +1,22 @@
+import os
+
 import numpy as np
 import pytest
 from persim.landscapes import PersLandscapeApprox
 
-from src.landscapes import pad_flatten_landscape_values, select_from_list
+from src.design import ExperimentDesign
+from src.landscapes import (
+    LabelIndex,
+    LandscapeAccumulator,
+    LandscapeCache,
+    accumulate_landscapes,
+    construct_landscape_array,
+    construct_landscapes,
+    iter_diagrams,
+    landscape_matrix,
+    pad_flatten_landscape_values,
+    select_from_list,
+)
 
 
 class TestLandscapes:
@@ -17,6 +31,24 @@ class TestLandscapes:
             target_label="0",
         )
 
+    def test_label_index(self):
+        label_index = LabelIndex(["b", "a", "c", "a", "b"])
+        np.testing.assert_array_equal(label_index.rows(["a", "b"]), [1, 3, 0, 4])
+        features = np.arange(10).reshape(5, 2)
+        X, y = label_index.select(features, ["c", "a", "b"])
+        np.testing.assert_array_equal(X, features[[2, 1, 3, 0, 4]])
+        np.testing.assert_array_equal(y, ["c", "a", "a", "b", "b"])
+        assert len(label_index.rows(["d"])) == 0
+        with pytest.raises(ValueError):
+            label_index.select(features[:4], ["a"])
+
+        # Tiling matches encoding the repeated labelling.
+        tiled = label_index.tile(3)
+        expected = LabelIndex(["b", "a", "c", "a", "b"] * 3)
+        np.testing.assert_array_equal(tiled.codes, expected.codes)
+        for labels in [["a", "b"], ["c"], ["d"]]:
+            np.testing.assert_array_equal(tiled.rows(labels), expected.rows(labels))
+
     def test_pad_flatten(self):
         P = PersLandscapeApprox(
             start=0,
@@ -37,3 +69,169 @@ class TestLandscapes:
                 np.array([0, 0.75, 1, 0.75, 0, 0, 0, 0, 0, 0, 0, 0]),
             ],
         )
+
+    def test_construct_landscape_array(self):
+        diagrams = [
+            np.array([[0, 3], [1, 4], [2, np.inf]]),
+            np.array([[0.5, 7], [3, 5], [4.1, 6.5], [4.2, 6.6]]),
+        ]
+        values, start, stop = construct_landscape_array(diagrams, num_steps=50)
+        assert (start, stop) == (0, 7)
+        landscapes = [
+            PersLandscapeApprox(dgms=[diagram], hom_deg=0, num_steps=50)
+            for diagram in diagrams
+        ]
+        np.testing.assert_array_equal(
+            values.reshape(len(diagrams), -1),
+            pad_flatten_landscape_values(landscapes),
+        )
+
+    def test_landscape_matrix(self):
+        P = PersLandscapeApprox(
+            start=0,
+            stop=5,
+            num_steps=6,
+            values=np.array([[0, 1, 2, 2, 1, 0], [0, 0, 1, 0, 0, 0]]),
+        )
+        Q = PersLandscapeApprox(
+            start=0,
+            stop=4,
+            num_steps=4,
+            values=np.array([[0, 1, 1, 0]]),
+        )
+        matrix = landscape_matrix([P, Q], max_depth=1, dtype=np.float32)
+        assert matrix.dtype == np.float32
+        assert matrix.flags["C_CONTIGUOUS"]
+        np.testing.assert_array_equal(
+            matrix,
+            np.array([[0, 1, 2, 2, 1, 0], [0, 0.75, 1, 0.75, 0, 0]]),
+        )
+
+    def test_landscape_cache(self, sample_data_dir):
+        data_dir = sample_data_dir
+        cache_dir = os.path.join(data_dir, "cache")
+        cache = LandscapeCache(cache_dir=cache_dir)
+        cached = cache.landscapes("0508", 1, data_dir, num_steps=100)
+        expected = construct_landscapes("0508", 1, data_dir, num_steps=100)
+        for landscape, expected_landscape in zip(cached, expected):
+            assert landscape.start == expected_landscape.start
+            assert landscape.stop == expected_landscape.stop
+            np.testing.assert_array_equal(landscape.values, expected_landscape.values)
+        features = cache.feature_matrix("0508", [0, 1], data_dir, num_steps=100)
+        assert features is cache.feature_matrix("0508", [0, 1], data_dir, num_steps=100)
+
+        # A fresh cache reads the entries back from disk.
+        assert len(os.listdir(cache_dir)) == 3
+        np.testing.assert_array_equal(
+            LandscapeCache(cache_dir=cache_dir).feature_matrix(
+                "0508", [0, 1], data_dir, num_steps=100
+            ),
+            features,
+        )
+
+        # The memory bound evicts the least recently used entries.
+        small_cache = LandscapeCache(max_bytes=features.nbytes)
+        small_cache.feature_matrix("0508", [0, 1], data_dir, num_steps=100)
+        assert small_cache._nbytes <= features.nbytes
+
+    def test_landscape_matrix_modes(self):
+        diagrams = [
+            np.array([[0, 3], [1, 4]]),
+            np.array([[0.5, 7], [3, 5], [4.1, 6.5], [4.2, 6.6]]),
+        ]
+        landscapes = [
+            PersLandscapeApprox(dgms=[diagram], hom_deg=0, num_steps=30)
+            for diagram in diagrams
+        ]
+        dense = landscape_matrix(landscapes)
+        sparse = landscape_matrix(landscapes, sparse=True)
+        assert sparse.nnz == np.count_nonzero(dense)
+        np.testing.assert_array_equal(sparse.toarray(), dense)
+
+        depth = dense.shape[1] // 30
+        reduced = landscape_matrix(landscapes, max_depth=2, downsample=3)
+        np.testing.assert_array_equal(
+            reduced,
+            dense.reshape(2, depth, 30)[:, :2, ::3].reshape(2, -1),
+        )
+        np.testing.assert_array_equal(
+            landscape_matrix(
+                landscapes, max_depth=2, downsample=3, sparse=True
+            ).toarray(),
+            reduced,
+        )
+
+    def test_landscape_accumulator(self, sample_data_dir):
+        from src import target_labels
+
+        data_dir = sample_data_dir
+        diagrams = [diagram for _, _, diagram in iter_diagrams("0508", 1, data_dir)]
+        values, start, stop = construct_landscape_array(diagrams, num_steps=300)
+        labels = np.array(target_labels)
+
+        accumulator = accumulate_landscapes("0508", 1, data_dir, num_steps=300)
+        assert (accumulator.start, accumulator.stop) == (start, stop)
+        assert sorted(accumulator.labels) == sorted(set(target_labels))
+        for label in accumulator.labels:
+            rows = values[labels == label]
+            assert accumulator.counts[label] == len(rows)
+            mean = accumulator.mean(label)
+            assert isinstance(mean, PersLandscapeApprox)
+            depth = len(mean.values)
+            np.testing.assert_allclose(mean.values, rows.mean(axis=0)[:depth])
+            assert not rows.mean(axis=0)[depth:].any()
+            np.testing.assert_allclose(
+                accumulator.variance(label), rows.var(axis=0, ddof=1)[:depth]
+            )
+
+        # Partial accumulators over the two halves merge into the whole.
+        halves = [
+            LandscapeAccumulator(start, stop, 300, hom_deg=1).update(
+                zip(target_labels[part], diagrams[part])
+            )
+            for part in [slice(0, 100), slice(100, None)]
+        ]
+        merged = halves[0].merge(halves[1])
+        for label in accumulator.labels:
+            assert merged.counts[label] == accumulator.counts[label]
+            np.testing.assert_allclose(
+                merged.mean(label).values, accumulator.mean(label).values
+            )
+            np.testing.assert_allclose(
+                merged.variance(label), accumulator.variance(label)
+            )
+        with pytest.raises(ValueError):
+            merged.merge(LandscapeAccumulator(start, stop + 1, 300))
+
+        # Landscape objects are sampled on the shared grid.
+        landscapes = [
+            PersLandscapeApprox(dgms=[diagram], hom_deg=0, num_steps=300)
+            for diagram in diagrams[:3]
+        ]
+        from_landscapes = LandscapeAccumulator(start, stop, 300).update(
+            ("rest", landscape) for landscape in landscapes
+        )
+        depth = len(from_landscapes.mean("rest").values)
+        np.testing.assert_allclose(
+            from_landscapes.mean("rest").values, values[:3].mean(axis=0)[:depth]
+        )
+
+    def test_accumulator_without_finite_pairs(self, tmp_path):
+        data_dir = str(tmp_path)
+        pers_output = os.path.join(data_dir, "patient0001", "pers_output")
+        os.makedirs(pers_output)
+        for time in range(2):
+            with open(
+                os.path.join(pers_output, f"patient_0001_time_{time}_output_0.txt"),
+                "w",
+            ) as pd_file:
+                pd_file.write("0 -1\n")
+        design = ExperimentDesign(["rest", "beat"])
+        with pytest.raises(ValueError):
+            accumulate_landscapes("0001", 0, data_dir, design=design)
+        accumulator = accumulate_landscapes(
+            "0001", 0, data_dir, start=0, stop=1, num_steps=10, design=design
+        )
+        assert accumulator.counts == {"rest": 1, "beat": 1}
+        with pytest.raises(ValueError):
+            LandscapeAccumulator(0, np.inf)
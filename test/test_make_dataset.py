@@ -0,0 +1,292 @@
+import os
+
+import h5py as h5
+import numpy as np
+import pytest
+
+from src import total_time
+from src.design import ExperimentDesign
+from src.diagram_store import read_perseus_output
+from src.make_dataset import (
+    _masked_amplitudes,
+    apply_mask,
+    construct_all_diagrams_gudhi,
+    construct_diagrams_gudhi,
+    construct_diagrams_in_memory,
+    construct_persistence_files_parallel,
+    construct_vector,
+    read_masked_amplitudes,
+    read_perseus_input,
+)
+from src.masks import Mask
+from src.sample_data import link_subject_data
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def sort_pairs(pairs):
+    """Sort birth-death pairs lexicographically."""
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def write_prs_files(data_dir, subject):
+    """Write a small perseus input file, as by apply_mask, for every time slice."""
+    prs_dir = os.path.join(data_dir, "preprocessed", subject)
+    os.makedirs(prs_dir)
+    rng = np.random.default_rng(0)
+    coordinates = np.argwhere(rng.integers(0, 2, size=(3, 3, 3))) + 10
+    for time in range(total_time):
+        np.savetxt(
+            os.path.join(prs_dir, f"patient_{subject}_time_{time}.prs"),
+            np.column_stack((coordinates, rng.integers(0, 10, size=len(coordinates)))),
+            fmt="%d",
+            header="3",
+            comments="",
+        )
+
+
+def load_sample_volume():
+    """Rebuild a supralevel volume for time 0 of subject 0508 from its .prs file."""
+    mask = np.array(
+        h5.File(os.path.join(DATA_DIR, "raw", "rDACC.mat"), "r").get("ocd0408")
+    )
+    prs = np.loadtxt(
+        os.path.join(DATA_DIR, "preprocessed", "0508", "patient_0508_time_0.prs"),
+        skiprows=1,
+        dtype=int,
+    )
+    max_fmri = prs[:, 3].max()
+    volume = np.zeros((1,) + mask.shape)
+    volume[0, 0, 0, 0] = max_fmri  # Outside the mask; fixes the maximum.
+    volume[0, prs[:, 0], prs[:, 1], prs[:, 2]] = max_fmri - prs[:, 3]
+    return volume, mask
+
+
+def apply_mask_loop(volume, mask, supra, times):
+    """The rows written by the original per-voxel loop of `apply_mask`."""
+    max_fmri = int(np.round(np.amax(volume)))
+    rows = []
+    for time in times:
+        rows.append([])
+        for z in range(35, 85):
+            for x in range(40, 77):
+                for y in range(83, 123):
+                    if int(np.round(mask[z, x, y])) != 0:
+                        value = volume[time, z, x, y]
+                        if supra:
+                            value = max_fmri - value
+                        rows[-1].append([z, x, y, np.round(value)])
+    return np.array(rows)
+
+
+class TestMakeDataset:
+    def test_diagrams_in_memory(self):
+        volume, mask = load_sample_volume()
+        [pds] = construct_diagrams_in_memory(
+            subject_data=volume, mask=mask, hom_degs=[0, 1, 2], supra=True, times=[0]
+        )
+        for hom_deg in [0, 1, 2]:
+            expected = np.loadtxt(
+                os.path.join(
+                    DATA_DIR,
+                    "postprocessed",
+                    "0508",
+                    f"patient_0508_time_0_output_{hom_deg}.txt",
+                ),
+                ndmin=2,
+            )
+            expected[expected == -1] = np.inf
+            np.testing.assert_array_equal(
+                sort_pairs(pds[hom_deg]), sort_pairs(expected)
+            )
+
+    def test_read_masked_amplitudes(self, tmp_path):
+        rng = np.random.default_rng(0)
+        volume = rng.uniform(0, 100, size=(7, 6, 5, 8)).astype(np.float32)
+        # The maximum lies outside the bounding box of the voxels and outside
+        # the subset of time slices read below.
+        volume[0, 0, 0, 0] = 1000
+        path = os.path.join(tmp_path, "rocd0001.mat")
+        with h5.File(path, "w") as raw_file:
+            raw_file.create_group("#refs#")
+            raw_file.create_dataset("rocd0001", data=volume)
+        coordinates = tuple(
+            rng.integers(low, high, size=20) for low, high in [(1, 5), (2, 5), (0, 6)]
+        )
+        for supra in [True, False]:
+            expected = _masked_amplitudes(volume, coordinates, range(7), supra)
+            # Chunks of one, two and all time slices.
+            for chunk_bytes in [1, 2 * 6 * 5 * 8 * 4, 2**20]:
+                np.testing.assert_array_equal(
+                    read_masked_amplitudes(
+                        path, coordinates, range(7), supra, chunk_bytes
+                    ),
+                    expected,
+                )
+        for supra in [True, False]:
+            np.testing.assert_array_equal(
+                read_masked_amplitudes(path, coordinates, range(2, 6), supra, 1),
+                _masked_amplitudes(volume, coordinates, range(2, 6), supra),
+            )
+
+    def test_apply_mask(self, tmp_path):
+        data_dir = str(tmp_path)
+        rng = np.random.default_rng(2)
+        mask_array = rng.integers(0, 2, size=(4, 5, 6))
+        mask = Mask.from_array("roi", mask_array)
+        volume = rng.uniform(0, 100, size=(total_time, 4, 5, 6))
+        os.makedirs(os.path.join(data_dir, "raw", "0001"))
+        with h5.File(os.path.join(data_dir, "raw", "0001", "rocd0001.mat"), "w") as f:
+            f.create_dataset("rocd0001", data=volume)
+        os.makedirs(os.path.join(data_dir, "preprocessed", "0001"))
+        apply_mask("0001", mask, data_dir, supra=True)
+
+        # The vectors gathered with the mask are those written by apply_mask.
+        link_subject_data(
+            data_dir,
+            "0001",
+            pers_input=os.path.join(data_dir, "preprocessed", "0001"),
+        )
+        vectors = construct_vector("0001", data_dir)
+        np.testing.assert_array_equal(
+            construct_vector("0001", data_dir, mask=mask), vectors
+        )
+        np.testing.assert_array_equal(
+            construct_vector("0001", data_dir, mask=mask_array), vectors
+        )
+        np.testing.assert_array_equal(
+            vectors,
+            _masked_amplitudes(volume, mask.coordinates, range(total_time), True),
+        )
+
+    def test_apply_mask_matches_loop(self, tmp_path):
+        data_dir = str(tmp_path)
+        design = ExperimentDesign(["rest", "beat", "rest"])
+        rng = np.random.default_rng(3)
+        mask = np.zeros((86, 78, 124))
+        mask[40:45, 45:49, 90:96] = rng.integers(0, 2, size=(5, 4, 6))
+        volume = rng.uniform(0, 1000, size=(3,) + mask.shape).astype(np.float32)
+        os.makedirs(os.path.join(data_dir, "raw", "0001"))
+        with h5.File(os.path.join(data_dir, "raw", "0001", "rocd0001.mat"), "w") as f:
+            f.create_group("#refs#")
+            f.create_dataset("rocd0001", data=volume)
+        os.makedirs(os.path.join(data_dir, "preprocessed", "0001"))
+        for supra in [True, False]:
+            apply_mask("0001", mask, data_dir, supra=supra, design=design)
+            expected = apply_mask_loop(volume, mask, supra, range(3))
+            for time in range(3):
+                np.testing.assert_array_equal(
+                    read_perseus_input(
+                        os.path.join(
+                            data_dir,
+                            "preprocessed",
+                            "0001",
+                            f"patient_0001_time_{time}.prs",
+                        )
+                    ),
+                    expected[time],
+                )
+
+    def test_diagrams_gudhi(self, tmp_path):
+        # The bundled perseus input files are apply_mask output, and the
+        # bundled diagrams were computed from them by perseus.
+        for hom_deg in [0, 1, 2]:
+            expected = read_perseus_output(
+                os.path.join(
+                    DATA_DIR,
+                    "postprocessed",
+                    "0508",
+                    f"patient_0508_time_0_output_{hom_deg}.txt",
+                )
+            )
+            np.testing.assert_array_equal(
+                sort_pairs(construct_diagrams_gudhi("0508", hom_deg, 0, DATA_DIR)),
+                sort_pairs(expected),
+            )
+
+        # Diagrams of apply_mask output agree with those computed in memory.
+        data_dir = str(tmp_path)
+        design = ExperimentDesign(["rest", "beat"])
+        rng = np.random.default_rng(4)
+        mask = Mask.from_array("roi", rng.integers(0, 2, size=(6, 5, 7)))
+        volume = rng.integers(0, 50, size=(2, 6, 5, 7)).astype(np.float32)
+        os.makedirs(os.path.join(data_dir, "raw", "0001"))
+        with h5.File(os.path.join(data_dir, "raw", "0001", "rocd0001.mat"), "w") as f:
+            f.create_dataset("rocd0001", data=volume)
+        os.makedirs(os.path.join(data_dir, "preprocessed", "0001"))
+        apply_mask("0001", mask, data_dir, supra=True, design=design)
+        in_memory = construct_diagrams_in_memory(
+            volume, mask, [0, 1, 2], supra=True, design=design
+        )
+        for time in range(2):
+            for expected, pds in zip(
+                in_memory[time],
+                construct_all_diagrams_gudhi("0001", [0, 1, 2], time, data_dir),
+            ):
+                np.testing.assert_array_equal(sort_pairs(pds), sort_pairs(expected))
+
+    def test_all_diagrams(self, tmp_path):
+        data_dir = str(tmp_path)
+        write_prs_files(data_dir, "0001")
+        all_pds = construct_all_diagrams_gudhi(
+            subject="0001", hom_degs=[0, 1, 2], time=3, data_dir=data_dir
+        )
+        for hom_deg, pds in enumerate(all_pds):
+            np.testing.assert_array_equal(
+                pds,
+                construct_diagrams_gudhi(
+                    subject="0001", hom_deg=hom_deg, time=3, data_dir=data_dir
+                ),
+            )
+
+    def test_persistence_parallel(self, tmp_path):
+        data_dir = str(tmp_path)
+        write_prs_files(data_dir, "0001")
+        timings = construct_persistence_files_parallel(
+            subjects="0001", hom_degs=[0, 1], data_dir=data_dir, n_jobs=2
+        )
+        assert [t[:2] for t in timings] == [("0001", t) for t in range(total_time)]
+        for hom_deg in [0, 1]:
+            assert os.path.exists(
+                os.path.join(
+                    data_dir,
+                    "postprocessed",
+                    "0001",
+                    f"patient_0001_time_{total_time - 1}_output_{hom_deg}.txt",
+                )
+            )
+        # Every output exists now, so a resumed run has nothing to do.
+        assert (
+            construct_persistence_files_parallel(
+                subjects="0001", hom_degs=[0, 1], data_dir=data_dir, n_jobs=2
+            )
+            == []
+        )
+
+    def test_construct_vector(self, sample_data_dir):
+        data_dir = sample_data_dir
+        prs_dir = os.path.join(data_dir, "patient0508", "pers_input")
+        mmap_path = os.path.join(data_dir, "vectors.npy")
+        vectors = construct_vector("0508", data_dir, mmap_path=mmap_path)
+        assert vectors.shape == (total_time, 6243)
+        assert vectors.dtype == np.int32
+        for time in [0, total_time - 1]:
+            prs = np.loadtxt(
+                os.path.join(prs_dir, f"patient_0508_time_{time}.prs"),
+                skiprows=1,
+                dtype=int,
+            )
+            np.testing.assert_array_equal(vectors[time], prs[:, 3])
+        np.testing.assert_array_equal(np.load(mmap_path, mmap_mode="r"), vectors)
+
+    def test_construct_vector_mismatch(self, tmp_path):
+        data_dir = str(tmp_path)
+        prs_dir = os.path.join(data_dir, "patient0001", "pers_input")
+        os.makedirs(prs_dir)
+        for time in range(total_time):
+            with open(
+                os.path.join(prs_dir, f"patient_0001_time_{time}.prs"), "w"
+            ) as prs_file:
+                prs_file.write(f"3\n0 0 {min(time, 1)} 5\n")
+        with pytest.raises(ValueError):
+            construct_vector("0001", data_dir)
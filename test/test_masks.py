@@ -0,0 +1,60 @@
+import os
+
+import h5py as h5
+import numpy as np
+
+from src import masks
+from src.masks import Mask, load_mask, load_masks
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+MASK_PATH = os.path.join(DATA_DIR, "raw", "rDACC.mat")
+
+
+class TestMasks:
+    def test_perseus_order(self):
+        mask = load_mask(MASK_PATH)
+        prs = np.loadtxt(
+            os.path.join(DATA_DIR, "preprocessed", "0508", "patient_0508_time_0.prs"),
+            skiprows=1,
+            dtype=int,
+        )
+        assert len(mask) == len(prs)
+        np.testing.assert_array_equal(mask.perseus_coordinates(), prs[:, :3])
+        assert mask.bounding_box == (slice(41, 84), slice(45, 75), slice(86, 120))
+        # The mask is memoized.
+        assert load_mask(MASK_PATH) is mask
+
+    def test_gather(self):
+        rng = np.random.default_rng(0)
+        mask = Mask.from_array("roi", rng.integers(0, 2, size=(4, 5, 6)))
+        volume = rng.normal(size=(3, 4, 5, 6))
+        z, x, y = mask.coordinates
+        np.testing.assert_array_equal(mask.gather(volume), volume[:, z, x, y])
+        np.testing.assert_array_equal(mask.gather(volume[0]), volume[0, z, x, y])
+
+    def test_named_masks_and_cache(self, tmp_path, monkeypatch):
+        rng = np.random.default_rng(1)
+        mask_path = os.path.join(tmp_path, "rois.mat")
+        arrays = {
+            "acc": rng.integers(0, 2, size=(4, 5, 6)),
+            "pcc": rng.integers(0, 2, size=(4, 5, 6)),
+        }
+        with h5.File(mask_path, "w") as mask_file:
+            mask_file.create_group("#refs#")
+            for name, array in arrays.items():
+                mask_file.create_dataset(name, data=array.astype(np.float64))
+        cache_dir = os.path.join(tmp_path, "cache")
+
+        loaded = load_masks(mask_path, cache_dir=cache_dir)
+        assert sorted(loaded) == ["acc", "pcc"]
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(loaded[name].coordinates, np.nonzero(array))
+
+        # A new process finds the masks in the cache without opening the file.
+        monkeypatch.setattr(masks, "_loaded", {})
+        monkeypatch.setattr(h5, "File", None)
+        cached = load_masks(mask_path, ["pcc", "acc"], cache_dir=cache_dir)
+        np.testing.assert_array_equal(
+            cached["pcc"].flat_index, loaded["pcc"].flat_index
+        )
+        assert cached["acc"].shape == (4, 5, 6)
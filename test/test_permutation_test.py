@@ -0,0 +1,146 @@
+import random
+
+import numpy as np
+import pytest
+from persim.landscapes import PersLandscapeApprox
+
+from src import target_labels
+from src.landscapes import LabelIndex, landscape_matrix
+from src import permutation_test as permutation_test_module
+from src.permutation_test import (
+    _significant_count,
+    group_permutation_test,
+    permutation_statistics,
+    permutation_test,
+    permutation_test_vectorized,
+)
+
+
+def random_landscapes(seed=0):
+    """One landscape on a shared grid for every time slice."""
+    rng = np.random.default_rng(seed)
+    return [
+        PersLandscapeApprox(
+            start=0,
+            stop=1,
+            num_steps=20,
+            values=rng.random((rng.integers(1, 4), 20)),
+        )
+        for _ in target_labels
+    ]
+
+
+class TestPermutationTest:
+    def test_permutation_statistics(self):
+        features = np.array([[0.0, 1.0], [2.0, 1.0], [4.0, 4.0]])
+        np.testing.assert_allclose(
+            permutation_statistics(
+                features, np.array([[True, False, False], [True, True, False]])
+            ),
+            [3.0, 3.0],
+        )
+
+    def test_matches_permutation_test(self):
+        landscapes = random_landscapes()
+        num_landscapes = target_labels.count("rest") + target_labels.count("beat")
+        # Replay the shuffles drawn by permutation_test.
+        random.seed(7)
+        permutations = np.array(
+            [
+                random.sample(range(num_landscapes), num_landscapes // 2)
+                for _ in range(40)
+            ]
+        )
+        assert permutation_test_vectorized(
+            landscapes, ["rest", "beat"], permutations=permutations, batch_size=16
+        ) == permutation_test(landscapes, ["rest", "beat"], num_perms=40, seed=7)
+
+    def test_seeded(self):
+        landscapes = random_landscapes()
+        p_val = permutation_test_vectorized(
+            landscapes, ["rest", "random"], num_perms=100, seed=3
+        )
+        assert 0 <= p_val <= 1
+        assert p_val == permutation_test_vectorized(
+            landscapes, ["rest", "random"], num_perms=100, seed=3
+        )
+
+    def test_length_mismatch(self):
+        landscapes = random_landscapes()
+        for test in [permutation_test, permutation_test_vectorized]:
+            with pytest.raises(ValueError):
+                test(landscapes + landscapes, ["rest", "beat"], num_perms=5)
+
+    def test_parallel_matches_serial(self):
+        landscapes = random_landscapes()
+        assert permutation_test_vectorized(
+            landscapes, ["rest", "beat"], num_perms=120, batch_size=25, n_jobs=2
+        ) == permutation_test_vectorized(
+            landscapes, ["rest", "beat"], num_perms=120, batch_size=25
+        )
+
+    def test_early_stopping(self, monkeypatch):
+        # The labels of random landscapes are not significant, so the test
+        # should stop well before the requested number of shuffles.
+        landscapes = random_landscapes()
+        num_done = []
+
+        def counting(features, significance, a_masks):
+            num_done.append(len(a_masks))
+            return _significant_count(features, significance, a_masks)
+
+        monkeypatch.setattr(permutation_test_module, "_significant_count", counting)
+        p_val = permutation_test_vectorized(
+            landscapes,
+            ["rest", "beat"],
+            num_perms=100000,
+            batch_size=50,
+            alpha=0.01,
+        )
+        assert p_val > 0.01
+        assert 0 < sum(num_done) <= 1000
+
+        with pytest.raises(ValueError):
+            permutation_test_vectorized(
+                landscapes, ["rest", "beat"], num_perms=100, alpha=0.01, n_jobs=0
+            )
+
+    def test_group_permutation_test(self):
+        landscapes = {
+            "a": {0: random_landscapes(0), 1: random_landscapes(1)},
+            "b": {0: random_landscapes(2), 1: random_landscapes(3)},
+        }
+        results = group_permutation_test(
+            landscapes, ["rest", "beat"], num_perms=60, batch_size=25
+        )
+        assert list(results["subject"]) == ["all", "a", "b"] * 2
+        assert list(results["hom_deg"]) == [0] * 3 + [1] * 3
+        assert results["p_value"].between(0, 1).all()
+
+        # The cohort statistic is that of the averages over all subjects.
+        rows = LabelIndex(target_labels).rows(["rest", "beat"])
+        num_rest = target_labels.count("rest")
+        features = landscape_matrix(
+            [landscapes[s][1][idx] for s in ["a", "b"] for idx in rows]
+        ).reshape(2, len(rows), -1)
+        expected = np.abs(
+            features[:, :num_rest].mean(axis=1).mean(axis=0)
+            - features[:, num_rest:].mean(axis=1).mean(axis=0)
+        ).max()
+        np.testing.assert_allclose(results["statistic"].iloc[3], expected)
+
+        pooled = group_permutation_test(
+            landscapes, ["rest", "beat"], num_perms=60, stratified=False
+        )
+        assert list(pooled["subject"]) == ["all", "all"]
+        np.testing.assert_allclose(pooled["statistic"], results["statistic"].iloc[::3])
+
+    def test_group_matches_single_subject(self):
+        landscapes = random_landscapes()
+        results = group_permutation_test(
+            {"a": {1: landscapes}}, ["rest", "beat"], num_perms=120, batch_size=25
+        )
+        p_val = permutation_test_vectorized(
+            landscapes, ["rest", "beat"], num_perms=120, batch_size=25
+        )
+        assert list(results["p_value"]) == [p_val, p_val]
@@ -0,0 +1,157 @@
+import os
+import shutil
+
+import h5py as h5
+import numpy as np
+
+from src import total_time
+from src.design import ExperimentDesign
+from src.diagram_store import DiagramStore, diagram_store_path, read_perseus_output
+from src.landscapes import construct_landscape_array
+from src.make_dataset import construct_diagrams_in_memory, raw_data_path
+from src.pipeline import Pipeline, Stage, default_stages, landscape_path
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+
+def file_stages(calls):
+    """Two stages: 'a' writes the parameter x, 'b' appends y to the output of 'a'."""
+
+    def run_a(subject, data_dir, params):
+        calls.append("a")
+        with open(os.path.join(data_dir, subject + "_a.txt"), "w") as a_file:
+            a_file.write(str(params["x"]))
+
+    def run_b(subject, data_dir, params):
+        calls.append("b")
+        with open(os.path.join(data_dir, subject + "_a.txt"), "r") as a_file:
+            a = a_file.read()
+        with open(os.path.join(data_dir, subject + "_b.txt"), "w") as b_file:
+            b_file.write(a + str(params["y"]))
+
+    return [
+        Stage(
+            "b",
+            run_b,
+            inputs=lambda subject, data_dir, params: [
+                os.path.join(data_dir, subject + "_a.txt")
+            ],
+            outputs=lambda subject, data_dir, params: [
+                os.path.join(data_dir, subject + "_b.txt")
+            ],
+            params=("y",),
+            deps=("a",),
+        ),
+        Stage(
+            "a",
+            run_a,
+            inputs=lambda subject, data_dir, params: [],
+            outputs=lambda subject, data_dir, params: [
+                os.path.join(data_dir, subject + "_a.txt")
+            ],
+            params=("x",),
+        ),
+    ]
+
+
+class TestPipeline:
+    def test_staleness(self, tmp_path):
+        data_dir = str(tmp_path)
+        calls = []
+        stages = file_stages(calls)
+        assert Pipeline(stages, data_dir, x=1, y=2).stale("0001") == ["a", "b"]
+        Pipeline(stages, data_dir, x=1, y=2).run("0001")
+        assert calls == ["a", "b"]
+
+        # Nothing changed, so nothing reruns.
+        assert Pipeline(stages, data_dir, x=1, y=2).run("0001") == []
+
+        # A downstream parameter reruns only the downstream stage.
+        assert Pipeline(stages, data_dir, x=1, y=3).stale("0001") == ["b"]
+        assert Pipeline(stages, data_dir, x=1, y=3).run("0001") == [("0001", "b")]
+
+        # An upstream parameter reruns everything after it.
+        Pipeline(stages, data_dir, x=4, y=3).run("0001")
+        assert calls == ["a", "b", "b", "a", "b"]
+        with open(os.path.join(data_dir, "0001_b.txt"), "r") as b_file:
+            assert b_file.read() == "43"
+
+        # A missing output is recomputed.
+        os.remove(os.path.join(data_dir, "0001_b.txt"))
+        assert Pipeline(stages, data_dir, x=4, y=3).run("0001") == [("0001", "b")]
+
+    def test_landscape_stages(self, tmp_path):
+        data_dir = str(tmp_path)
+        shutil.copytree(
+            os.path.join(DATA_DIR, "postprocessed", "0508"),
+            os.path.join(data_dir, "postprocessed", "0508"),
+        )
+        stages = [
+            stage
+            for stage in default_stages()
+            if stage.name in ("diagrams", "landscapes")
+        ]
+        pipeline = Pipeline(stages, data_dir, hom_degs=[0, 1], num_steps=100)
+        assert pipeline.run("0508") == [("0508", "diagrams"), ("0508", "landscapes")]
+
+        diagrams = [
+            read_perseus_output(
+                os.path.join(
+                    data_dir,
+                    "postprocessed",
+                    "0508",
+                    f"patient_0508_time_{time}_output_1.txt",
+                )
+            )
+            for time in range(total_time)
+        ]
+        values, start, stop = construct_landscape_array(diagrams, num_steps=100)
+        with np.load(landscape_path("0508", 1, data_dir)) as landscapes:
+            np.testing.assert_array_equal(landscapes["values"], values)
+            assert landscapes["start"] == start and landscapes["stop"] == stop
+
+        # Changing the grid reuses the diagram store.
+        pipeline = Pipeline(stages, data_dir, hom_degs=[0, 1], num_steps=50)
+        assert pipeline.run("0508") == [("0508", "landscapes")]
+
+    def test_default_stages(self, tmp_path):
+        data_dir = str(tmp_path)
+        design = ExperimentDesign(["rest", "beat", "beat", "rest"])
+        rng = np.random.default_rng(4)
+        mask = rng.integers(0, 2, size=(6, 7, 8))
+        volume = rng.uniform(0, 100, size=(design.total_time,) + mask.shape)
+        with h5.File(os.path.join(data_dir, "rDACC.mat"), "w") as f:
+            f.create_dataset("ocd0408", data=mask)
+        os.makedirs(os.path.dirname(raw_data_path("0001", data_dir)))
+        with h5.File(raw_data_path("0001", data_dir), "w") as f:
+            f.create_dataset("rocd0001", data=volume)
+
+        pipeline = Pipeline(
+            default_stages(),
+            data_dir,
+            hom_degs=[0, 1],
+            num_steps=50,
+            n_jobs=1,
+            design=design,
+        )
+        assert pipeline.run("0001") == [
+            ("0001", "mask"),
+            ("0001", "persistence"),
+            ("0001", "diagrams"),
+            ("0001", "landscapes"),
+        ]
+
+        expected = construct_diagrams_in_memory(
+            volume, mask, [0, 1], True, design=design
+        )
+        store = DiagramStore(diagram_store_path("0001", data_dir))
+        for idx, hom_deg in enumerate([0, 1]):
+            diagrams = store.diagrams(hom_deg)
+            for diagram, pairs in zip(diagrams, expected):
+                np.testing.assert_array_equal(
+                    np.sort(np.asarray(diagram), axis=0), np.sort(pairs[idx], axis=0)
+                )
+            values, start, stop = construct_landscape_array(diagrams, num_steps=50)
+            with np.load(landscape_path("0001", hom_deg, data_dir)) as landscapes:
+                np.testing.assert_array_equal(landscapes["values"], values)
+        assert pipeline.run("0001") == []
@@ -0,0 +1,44 @@
+import os
+
+from src import profiling
+from src.landscapes import construct_landscapes
+
+
+class TestProfiling:
+    def test_disabled(self):
+        profiling.reset()
+        with profiling.stage("block", subject="0001"):
+            pass
+        assert profiling.summary().empty
+
+    def test_stages(self, sample_data_dir):
+        data_dir = sample_data_dir
+        profiling.reset()
+        profiling.enable(profile=True, trace_memory=True)
+        try:
+            with profiling.stage("block", subject="0508"):
+                construct_landscapes("0508", 1, data_dir, num_steps=100)
+            construct_landscapes(
+                subject="0508", hom_deg=0, data_dir=data_dir, num_steps=100
+            )
+        finally:
+            profiling.disable()
+        table = profiling.summary().set_index(["subject", "stage"])
+        assert table.loc[("0508", "block"), "calls"] == 1
+        assert table.loc[("0508", "construct_landscapes"), "calls"] == 2
+        # Nested stages are recorded too; perseus_to_sktda reads every diagram.
+        perseus = table.loc[("0508", "perseus_to_sktda")]
+        assert perseus["calls"] == 2 * 210
+        assert perseus["read (MB)"] > 0
+        assert (table["wall (s)"] > 0).all()
+        assert (table["RSS growth (MB)"] >= 0).all()
+        assert (table["max RSS so far (MB)"] >= table["RSS growth (MB)"]).all()
+        assert "construct_landscapes" in profiling.report()
+
+        profiling.dump(os.path.join(data_dir, "profile"))
+        assert sorted(os.listdir(os.path.join(data_dir, "profile"))) == [
+            "profile.prof",
+            "stages.csv",
+            "tracemalloc.txt",
+        ]
+        profiling.reset()
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from src.run import main, run_cohort
+
+
+class TestRun:
+    def test_run_cohort(self, sample_data_dir):
+        data_dir = sample_data_dir
+        output_dir = os.path.join(data_dir, "results")
+        results = run_cohort(
+            subjects=["0508"],
+            output_dir=output_dir,
+            n_jobs=1,
+            hom_degs=[0, 1],
+            pairings=["Rest vs Beat", "All Three"],
+            data_dir=data_dir,
+            num_steps=100,
+            folds=3,
+            num_perms=20,
+        )
+        assert list(results.columns) == [
+            "subject",
+            "test",
+            "pairing",
+            "hom_deg",
+            "value",
+        ]
+        svm = results[results["test"] == "svm"]
+        assert list(svm["pairing"]) == ["Rest vs Beat", "All Three"]
+        assert list(svm["hom_deg"]) == ["0+1", "0+1"]
+        # Only the two label pairing has a permutation test, in each degree.
+        permutation = results[results["test"] == "permutation"]
+        assert list(permutation["hom_deg"]) == ["0", "1"]
+        assert results["value"].between(0, 1).all()
+        pd.testing.assert_frame_equal(
+            pd.read_csv(
+                os.path.join(output_dir, "results.csv"),
+                dtype={"subject": str, "hom_deg": str},
+            ),
+            results,
+        )
+
+        # A rerun finds the subject done and does not recompute it.
+        subject_file = os.path.join(output_dir, "subject_0508.csv")
+        mtime = os.stat(subject_file).st_mtime_ns
+        main(
+            [
+                "--data-dir",
+                data_dir,
+                "--subjects",
+                "0508",
+                "--output-dir",
+                output_dir,
+            ]
+        )
+        assert os.stat(subject_file).st_mtime_ns == mtime
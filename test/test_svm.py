@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import scipy.sparse
+
+from src.svm import evaluate_pairings, landscape_svm, nontda_svm
+
+LABELS = ["rest", "beat", "random"] * 20
+
+
+def separable_vectors(seed=0):
+    """Vectors whose first three coordinates encode the label."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(scale=0.1, size=(len(LABELS), 5))
+    for idx, label in enumerate(LABELS):
+        vectors[idx, ["rest", "beat", "random"].index(label)] += 1
+    return vectors
+
+
+class TestSVM:
+    def test_nontda_svm(self):
+        scores = nontda_svm(
+            separable_vectors(), ["rest", "beat"], LABELS, folds=4, n_jobs=2
+        )
+        assert len(scores) == 4
+        assert scores.mean() == 1.0
+
+    def test_landscape_svm_matrix(self):
+        scores = landscape_svm(separable_vectors(), ["rest", "beat"], LABELS, folds=4)
+        assert scores.mean() == 1.0
+        for option in [{"max_depth": 1}, {"downsample": 2}, {"sparse": True}]:
+            with pytest.raises(ValueError):
+                landscape_svm(
+                    separable_vectors(), ["rest", "beat"], LABELS, folds=4, **option
+                )
+
+    def test_sparse_matrix(self):
+        features = scipy.sparse.csr_matrix(separable_vectors())
+        scores = landscape_svm(features, ["rest", "beat"], LABELS, folds=4)
+        assert scores.mean() == 1.0
+        scores = evaluate_pairings(
+            features={"0001": features},
+            pairings={"Rest vs Beat": ["rest", "beat"]},
+            target_labels=LABELS,
+            folds=4,
+        )
+        assert len(scores) == 4
+        assert (scores["score"] == 1.0).all()
+
+    def test_cv_results(self):
+        cv_results = nontda_svm(
+            separable_vectors(),
+            ["rest", "beat", "random"],
+            LABELS,
+            folds=3,
+            return_cv_results=True,
+        )
+        assert len(cv_results["estimator"]) == 3
+        assert len(cv_results["fit_time"]) == 3
+        np.testing.assert_array_equal(cv_results["test_score"], [1.0, 1.0, 1.0])
+
+    def test_evaluate_pairings(self):
+        pairings = {
+            "Rest vs Beat": ["rest", "beat"],
+            "All Three": ["rest", "beat", "random"],
+        }
+        scores = evaluate_pairings(
+            features={"0002": separable_vectors(0), "0001": separable_vectors(1)},
+            pairings=pairings,
+            target_labels=LABELS,
+            svm=nontda_svm,
+            n_jobs=2,
+            folds=3,
+        )
+        assert list(scores.columns) == ["subject", "pairing", "fold", "score"]
+        assert len(scores) == 2 * 2 * 3
+        heatmap = scores.pivot_table(
+            index="subject", columns="pairing", values="score", sort=False
+        )
+        assert list(heatmap.index) == ["0002", "0001"]
+        assert list(heatmap.columns) == list(pairings)
+        assert (heatmap.values == 1.0).all()